@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""Build the single-file obsidianctl script from modules/ and main.
+
+Every module is embedded as source and compiled only when the selected
+command needs it, so a call like `obsidianctl get-current-slot` does not
+pay for parsing the installer. Which modules a command needs is worked
+out here from the top-level names each module uses.
+"""
+import os
+import ast
+import sys
+import time
+import statistics
+import subprocess
+
+MODULES = [
+    "utils",
+    "topology",
+    "efivars",
+    "squashfs",
+    "image",
+    "slotimage",
+    "populate",
+    "download",
+    "delta",
+    "cache",
+    "pacman",
+    "phases",
+    "status",
+    "dualboot",
+    "install",
+    "switch",
+    "update",
+    "sync",
+    "enter",
+    "netupdate",
+    "diff",
+    "backup",
+    "backuprepo",
+    "manifest",
+    "health",
+    "obsiext",
+    "migrations",
+    "etc_ab",
+]
+
+# Wall-clock budget for starting the built script, in milliseconds, for
+# the commands in STARTUP_COMMANDS. Checked by `make startup-check`.
+STARTUP_BUDGET_MS = 50
+STARTUP_COMMANDS = [["--help"], ["get-current-slot"], ["status", "--json"]]
+STARTUP_RUNS = 15
+# Names a constant needed by main may use and still be copied ahead of it.
+HOISTABLE_NAMES = {"os", "min", "max", "len", "int", "str"}
+
+LOADER = '''
+import sys
+import time
+
+_LOADED = set()
+_IMPORTTIME = bool(os.environ.get("OBSIDIANCTL_IMPORTTIME"))
+
+
+def _load_module(name):
+    if name in _LOADED:
+        return
+    _LOADED.add(name)
+    started = time.perf_counter()
+    for dep in _MODULE_EXEC_DEPS[name]:
+        _load_module(dep)
+    exec(compile(_MODULE_SOURCES[name], f"<obsidianctl>/modules/{name}.py", "exec"), globals())
+    if _IMPORTTIME:
+        print(f"obsidianctl module: {(time.perf_counter() - started) * 1e6:10.0f} us | {name}", file=sys.stderr)
+
+
+def _require(name):
+    """Load the module defining name and everything its functions call."""
+    module = _NAME_MODULES[name]
+    for dep in _MODULE_DEPS[module]:
+        _load_module(dep)
+    _load_module(module)
+
+
+def _excepthook(*exc_info):
+    # Tracebacks show module source lines only if linecache has them, and
+    # importing linecache up front would cost more than the lazy loading
+    # saves, so they are registered only when something goes wrong.
+    import linecache
+    import traceback
+
+    for name in _LOADED:
+        filename = f"<obsidianctl>/modules/{name}.py"
+        source = _MODULE_SOURCES[name]
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    traceback.print_exception(*exc_info)
+
+
+sys.excepthook = _excepthook
+
+
+def _lazy(name):
+    def stub(*args, **kwargs):
+        _require(name)
+        return globals()[name](*args, **kwargs)
+
+    stub.__name__ = name
+    return stub
+
+
+for _name in _LAZY_NAMES:
+    globals()[_name] = _lazy(_name)
+for _name in _EAGER_MODULES:
+    _load_module(_name)
+'''
+
+
+def _assigned_names(target):
+    if isinstance(target, ast.Name):
+        return [target.id]
+    if isinstance(target, (ast.Tuple, ast.List)):
+        return [name for elt in target.elts for name in _assigned_names(elt)]
+    return []
+
+
+def _top_level_statements(body):
+    """Yield the module-level statements, looking into if/try/with blocks."""
+    for node in body:
+        yield node
+        for field in ("body", "orelse", "finalbody", "handlers"):
+            inner = getattr(node, field, None)
+            if isinstance(inner, list) and not isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                yield from _top_level_statements(inner)
+
+
+def defined_names(tree):
+    names = {}
+    for node in _top_level_statements(tree.body):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names[node.name] = "function" if not isinstance(node, ast.ClassDef) else "class"
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                for name in _assigned_names(target):
+                    names.setdefault(name, "value")
+        elif isinstance(node, (ast.AnnAssign, ast.AugAssign)):
+            for name in _assigned_names(node.target):
+                names.setdefault(name, "value")
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.setdefault((alias.asname or alias.name).split(".")[0], "import")
+    return names
+
+
+def used_names(node):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+
+
+def exec_time_names(tree):
+    """Names read while the module body runs: everything but function bodies."""
+    names = set()
+
+    def visit(node):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for child in node.decorator_list + node.args.defaults + [d for d in node.args.kw_defaults if d]:
+                names.update(used_names(child))
+            return
+        if isinstance(node, ast.Lambda):
+            return
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        for child in ast.iter_child_nodes(node):
+            visit(child)
+
+    visit(tree)
+    return names
+
+
+def _closure(start, edges):
+    seen = set()
+    stack = list(edges[start])
+    while stack:
+        module = stack.pop()
+        if module in seen or module == start:
+            continue
+        seen.add(module)
+        stack.extend(edges[module])
+    return [module for module in MODULES if module in seen]
+
+
+def analyse(sources, main_source):
+    trees = {name: ast.parse(source, f"modules/{name}.py") for name, source in sources.items()}
+    defined = {name: defined_names(tree) for name, tree in trees.items()}
+    owner = {}
+    for module in MODULES:
+        for name in defined[module]:
+            owner.setdefault(name, module)
+
+    def deps(module, names):
+        return {owner[n] for n in names if n in owner and n not in defined[module]} - {module}
+
+    call_edges = {m: deps(m, used_names(trees[m])) for m in MODULES}
+    exec_edges = {m: deps(m, exec_time_names(trees[m])) for m in MODULES}
+    module_deps = {m: _closure(m, call_edges) for m in MODULES}
+    exec_deps = {m: _closure(m, exec_edges) for m in MODULES}
+
+    main_tree = ast.parse(main_source, "main")
+    main_names = used_names(main_tree) - set(defined_names(main_tree))
+    lazy_names = sorted(
+        n for n in main_names if n in owner and defined[owner[n]][n] == "function"
+    )
+    # Constants main needs while building the parser are copied ahead of
+    # it when they are plain expressions; anything else loads its module.
+    hoisted = []
+    eager_modules = []
+    for name in sorted(n for n in main_names if n in owner and defined[owner[n]][n] == "value"):
+        module = owner[name]
+        statement = _constant_statement(trees[module], name)
+        if statement is not None and used_names(statement) <= HOISTABLE_NAMES:
+            hoisted.append(ast.get_source_segment(sources[module], statement))
+        elif module not in eager_modules:
+            eager_modules.append(module)
+    eager_modules.sort(key=MODULES.index)
+    return owner, module_deps, exec_deps, lazy_names, eager_modules, hoisted
+
+
+def _constant_statement(tree, name):
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(name in _assigned_names(t) for t in node.targets):
+            return node
+    return None
+
+
+def build(output, root="."):
+    sources = {}
+    for module in MODULES:
+        with open(os.path.join(root, "modules", f"{module}.py"), "r") as f:
+            sources[module] = f.read()
+    with open(os.path.join(root, "main"), "r") as f:
+        main_source = f.read()
+    owner, module_deps, exec_deps, lazy_names, eager_modules, hoisted = analyse(sources, main_source)
+    name_modules = {name: owner[name] for name in lazy_names}
+
+    parts = [
+        "#!/usr/bin/env python3\n",
+        "# Generated by build.py from modules/ and main. Do not edit.\n",
+        "import os\n",
+        f"_MODULE_SOURCES = {sources!r}\n",
+        f"_MODULE_DEPS = {module_deps!r}\n",
+        f"_MODULE_EXEC_DEPS = {exec_deps!r}\n",
+        f"_NAME_MODULES = {name_modules!r}\n",
+        f"_LAZY_NAMES = {lazy_names!r}\n",
+        f"_EAGER_MODULES = {eager_modules!r}\n",
+        LOADER,
+        "\n",
+        "".join(f"{statement}\n" for statement in hoisted),
+        "\n",
+        main_source,
+    ]
+    tmp_output = output + ".tmp"
+    with open(tmp_output, "w") as f:
+        f.writelines(parts)
+    os.chmod(tmp_output, 0o755)
+    os.replace(tmp_output, output)
+    print(f"--> {output}")
+
+
+def check_startup(script, budget_ms=STARTUP_BUDGET_MS, runs=STARTUP_RUNS):
+    """Time the built script like python -X importtime and enforce the budget."""
+    env = dict(os.environ, OBSIDIANCTL_IMPORTTIME="1")
+    over = False
+    for command in STARTUP_COMMANDS:
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([script] + command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            samples.append((time.perf_counter() - started) * 1000)
+        median = statistics.median(samples)
+        label = " ".join(command)
+        status = "ok" if median <= budget_ms else "OVER BUDGET"
+        over = over or median > budget_ms
+        print(f"{label:<20} median {median:7.1f} ms (budget {budget_ms} ms) {status}")
+        profile = subprocess.run(
+            [sys.executable, "-X", "importtime", script] + command,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env, check=False,
+        ).stderr
+        costs = []
+        for line in profile.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                fields = line[len("import time:"):].split("|")
+                if fields[1].strip().isdigit():
+                    costs.append((int(fields[1]), fields[2][1:].rstrip()))
+            elif line.startswith("obsidianctl module:"):
+                fields = line[len("obsidianctl module:"):].split("|")
+                costs.append((int(fields[0].split()[0]), f"modules/{fields[1].strip()}.py"))
+        top_level = [c for c in costs if not c[1].startswith(" ")]
+        for cost, name in sorted(top_level, reverse=True)[:5]:
+            print(f"    {cost / 1000:7.1f} ms  {name.strip()}")
+    return not over
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "--check-startup":
+        script = sys.argv[2] if len(sys.argv) > 2 else "./obsidianctl"
+        sys.exit(0 if check_startup(script) else 1)
+    build(sys.argv[1] if len(sys.argv) > 1 else "obsidianctl")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,152 @@ import sys
 import shutil
 from datetime import datetime
 import json
+import time
+import random
 import subprocess
+import contextlib
+
+# Compression profiles for backup archives: the compressor argument for
+# mksquashfs (-comp) and mkfs.erofs (-z), and the command line tool with
+# the same algorithm and level that --benchmark measures it with.
+BACKUP_PROFILES = {
+    "lz4": {"squashfs": "lz4", "erofs": "lz4", "tool": ["lz4", "-1"]},
+    "lz4hc": {"squashfs": "lz4 -Xhc", "erofs": "lz4hc", "tool": ["lz4", "-9"]},
+    "zstd-3": {"squashfs": "zstd -Xcompression-level 3", "erofs": "zstd,3", "tool": ["zstd", "-3"]},
+    "zstd-9": {"squashfs": "zstd -Xcompression-level 9", "erofs": "zstd,9", "tool": ["zstd", "-9"]},
+    "zstd-15": {"squashfs": "zstd -Xcompression-level 15", "erofs": "zstd,15", "tool": ["zstd", "-15"]},
+    "zstd-19": {"squashfs": "zstd -Xcompression-level 19", "erofs": "zstd,19", "tool": ["zstd", "-19"]},
+    "gzip": {"squashfs": "gzip", "erofs": "deflate", "tool": ["gzip", "-9"]},
+    "xz": {"squashfs": "xz", "erofs": "lzma", "tool": ["xz", "-6"]},
+}
+# The profile used when none is given, matching IMAGE_COMPRESSION.
+BACKUP_DEFAULT_PROFILES = {"squashfs": "xz", "erofs": "lz4hc"}
+# Tools that take a thread count, and how.
+BACKUP_THREADED_TOOLS = {"zstd": "-T{}", "xz": "-T{}"}
+# --benchmark compresses this much of the slot, read from files picked at
+# random, at most BACKUP_SAMPLE_PER_FILE from each.
+BACKUP_SAMPLE_SIZE = 32 * 1024 * 1024
+BACKUP_SAMPLE_PER_FILE = 1024 * 1024
+# --benchmark recommends the smallest profile that compresses at least
+# this fast, in MB/s.
+BACKUP_TARGET_SPEED = 50
+
+
+def _sample_tree(root, size=BACKUP_SAMPLE_SIZE):
+    """Return up to size bytes read from files picked at random under root."""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == root:
+            dirnames[:] = [d for d in dirnames if d not in IMAGE_EXCLUDED_DIRS and d != "lost+found"]
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                files.append(path)
+    random.Random(0).shuffle(files)
+    sample = bytearray()
+    for path in files:
+        if len(sample) >= size:
+            break
+        try:
+            with open(path, "rb") as f:
+                sample += f.read(min(BACKUP_SAMPLE_PER_FILE, size - len(sample)))
+        except OSError:
+            continue
+    return bytes(sample)
+
+
+def _tool_command(tool, processors, *extra):
+    cmd = list(tool) + list(extra) + ["-c"]
+    if processors and tool[0] in BACKUP_THREADED_TOOLS:
+        cmd.append(BACKUP_THREADED_TOOLS[tool[0]].format(processors))
+    return cmd
+
+
+def benchmark_profiles(sample, processors=None):
+    """Return [(profile, compress MB/s, decompress MB/s, ratio, error)].
+
+    Profiles that could not be measured have None speeds and say why in
+    error; one failing does not stop the others.
+    """
+    results = []
+    mb = len(sample) / (1024 * 1024)
+    for name, profile in BACKUP_PROFILES.items():
+        tool = profile["tool"]
+        if not shutil.which(tool[0]):
+            results.append((name, None, None, None, f"{tool[0]} not installed"))
+            continue
+        try:
+            start = time.monotonic()
+            packed = subprocess.run(_tool_command(tool, processors), input=sample, capture_output=True, check=True).stdout
+            compress_time = time.monotonic() - start
+            start = time.monotonic()
+            unpacked = subprocess.run(_tool_command(tool[:1], processors, "-d"), input=packed, capture_output=True, check=True).stdout
+            decompress_time = time.monotonic() - start
+        except subprocess.CalledProcessError as e:
+            results.append((name, None, None, None, f"{e.cmd[0]} failed with exit code {e.returncode}"))
+            continue
+        if unpacked != sample:
+            results.append((name, None, None, None, "did not round-trip the sample"))
+            continue
+        results.append((name, mb / max(compress_time, 1e-6), mb / max(decompress_time, 1e-6), len(sample) / max(len(packed), 1), None))
+    return results
+
+
+def recommend_profile(results, target_speed=BACKUP_TARGET_SPEED):
+    """Return the best-compressing profile at target_speed MB/s or faster, else the fastest one."""
+    measured = [r for r in results if r[1] is not None]
+    if not measured:
+        return None
+    fast_enough = [r for r in measured if r[1] >= target_speed]
+    if fast_enough:
+        return max(fast_enough, key=lambda r: r[3])[0]
+    return max(measured, key=lambda r: r[1])[0]
+
+
+def run_backup_benchmark(root, processors=None):
+    print("Sampling the slot's data...")
+    sample = _sample_tree(root)
+    if not sample:
+        print("Error: Found no data to sample in the slot.", file=sys.stderr)
+        sys.exit(1)
+    threads = f" with --processors {processors}" if processors else ""
+    print(f"Benchmarking compression profiles on {len(sample) / (1024*1024):.1f} MB{threads}...")
+    results = benchmark_profiles(sample, processors)
+    print(f"\n{'Profile':<10} {'Compress (MB/s)':>16} {'Decompress (MB/s)':>18} {'Ratio':>7}")
+    for name, compress_speed, decompress_speed, ratio, error in results:
+        if error:
+            print(f"{name:<10} {'(' + error + ')':>43}")
+        else:
+            print(f"{name:<10} {compress_speed:>16.1f} {decompress_speed:>18.1f} {ratio:>7.2f}")
+    best = recommend_profile(results)
+    if best:
+        print(f"\nRecommended: --profile {best} (best ratio at {BACKUP_TARGET_SPEED} MB/s or faster)")
+
+
 def handle_backup_slot(args):
     checkroot()
     slot = args.slot
     backup_dir = args.backup_dir or f"/var/backups/obsidianctl/slot_{slot}"
     device = args.device or None
     full_backup = args.full_backup
-    print(f"Creating backup of slot '{slot}'...")
-    if full_backup:
+    repository = args.repository
+    if repository:
+        backup_dir = args.backup_dir or BACKUP_REPO_DIR
+    image_format = args.format
+    image_ext = BACKUP_INDEX_EXT if repository else IMAGE_EXTENSIONS[image_format]
+    profile = args.profile or BACKUP_DEFAULT_PROFILES[image_format]
+    if repository and args.profile:
+        print("Warning: --profile only applies to image backups. Repository chunks are compressed with zlib.", file=sys.stderr)
+    if args.processors is not None and args.processors < 1:
+        print("Error: --processors must be at least 1.", file=sys.stderr)
+        sys.exit(1)
+    if not repository and not args.benchmark:
+        image_tool_or_exit(image_format, "build")
+    if args.benchmark:
+        print(f"Benchmarking backup compression on slot '{slot}'...")
+    else:
+        print(f"Creating backup of slot '{slot}'...")
+    if full_backup and not args.benchmark:
         print("FULL backup enabled.")
     part_path = lordo(f"root_{slot}", device)
     esp_path  = lordo(f"ESP_{slot.upper()}", device)
@@ -28,30 +165,50 @@ def handle_backup_slot(args):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_name = f"slot_{slot}_backup_{timestamp}"
     backup_path = os.path.join(backup_dir, backup_name)
-    run_command(f"mkdir -p {backup_dir}")
+    if not args.benchmark:
+        run_command(f"mkdir -p {backup_dir}")
     mount_dir = f"/mnt/obsidian_backup_{slot}"
-    run_command(f"mkdir -p {mount_dir}")
     try:
-        run_command(f"mount {part_path} {mount_dir}")
+        mount_slot_root(part_path, mount_dir, f"root_{slot}", read_only=True)
+        if args.benchmark:
+            run_backup_benchmark(mount_dir, args.processors)
+            return
         if full_backup:
             run_command(f"mount {var_path}  {mount_dir}/var" )
             run_command(f"mount {etc_path}  {mount_dir}/etc" )
             run_command(f"mount {esp_path}  {mount_dir}{EFI_DIR} --mkdir")
             run_command(f"mount {home_path} {mount_dir}/home")
-        print(f"Creating backup archive at {backup_path}.sfs...")
-        run_command(
-            f"mksquashfs {mount_dir} {backup_path}.sfs -comp xz -noappend -wildcards -e proc/* sys/* dev/* run/* tmp/* mnt/* media/* lost+found"
-        )
+        # The repository lock is held until the metadata is written: until
+        # then, the new index is not a backup and gc would drop its chunks.
+        repo_lock = contextlib.ExitStack()
+        if repository:
+            print(f"Adding backup {backup_name} to the repository at {backup_dir}...")
+            repo_lock.enter_context(_repo_lock(backup_dir))
+            stats = backup_to_repository(mount_dir, backup_dir, backup_name, slot)
+        else:
+            print(f"Creating backup archive at {backup_path}{image_ext} with profile {profile}...")
+            build_image(
+                mount_dir, f"{backup_path}{image_ext}", image_format,
+                compression=BACKUP_PROFILES[profile][image_format], processors=args.processors,
+            )
 
         metadata = {
             "slot": slot,
             "timestamp": timestamp,
-            "backup_path": f"{backup_path}.sfs",
-            "size": os.path.getsize(f"{backup_path}.sfs"),
+            "backup_path": f"{backup_path}{image_ext}",
+            "format": "repository" if repository else image_format,
+            "size": stats["stored_bytes"] if repository else os.path.getsize(f"{backup_path}{image_ext}"),
             "kernel": "unknown",
             "packages": [],
             "is_full_backup": full_backup,
         }
+        if repository:
+            metadata["index"] = backup_name + BACKUP_INDEX_EXT
+            metadata["stats"] = stats
+        else:
+            metadata["profile"] = profile
+            metadata["compression"] = BACKUP_PROFILES[profile][image_format]
+            metadata["processors"] = args.processors
 
         boot_dir = os.path.join(mount_dir, "boot")
         if os.path.exists(boot_dir):
@@ -60,52 +217,68 @@ def handle_backup_slot(args):
                     metadata["kernel"] = f.replace("vmlinuz-", "")
                     break
 
-        pacman_dir = os.path.join(mount_dir, "var/lib/pacman/local")
-        if os.path.exists(pacman_dir):
-            metadata["packages"] = [
-                d
-                for d in os.listdir(pacman_dir)
-                if os.path.isdir(os.path.join(pacman_dir, d))
-            ]
+        packages = slot_packages(mount_dir, slot)
+        metadata["packages"] = [f"{name}-{packages[name]['version']}" for name in sorted(packages)]
 
-        with open(f"{backup_path}.json", "w") as f:
+        with repo_lock, open(f"{backup_path}.json", "w") as f:
             json.dump(metadata, f, indent=2)
 
         print(f"Backup completed successfully!")
-        print(f"Archive: {backup_path}.sfs")
-        print(f"Metadata: {backup_path}.json")
-        print(f"Size: {metadata['size'] / (1024*1024):.1f} MB")
+        if repository:
+            print(f"Backup: {backup_path}.json")
+            print(f"Index: {backup_path}{image_ext}")
+            print(
+                f"Stored {stats['stored_bytes'] / (1024*1024):.1f} MB of new data for "
+                f"{stats['bytes'] / (1024*1024):.1f} MB in {stats['files']} files "
+                f"({stats['unchanged_files']} unchanged since the last backup)"
+            )
+        else:
+            print(f"Archive: {backup_path}{image_ext}")
+            print(f"Metadata: {backup_path}.json")
+            print(f"Size: {metadata['size'] / (1024*1024):.1f} MB")
 
     finally:
-        run_command(f"umount -R {mount_dir}", check=True)
-        run_command(f"rm -rf {mount_dir}", check=False)
+        umount_slot_root(mount_dir)
+        # Not rm -rf: if an unmount failed, the slot is still below.
+        run_command(f"rmdir {mount_dir}", check=False)
 
 
 def handle_rollback_slot(args):
     checkroot()
     slot = args.slot
+    device = args.device or None
     backup_path = args.backup_path
     if not backup_path:
         print("Error: Please specify a backup path with --backup-path", file=sys.stderr)
         sys.exit(1)
 
-    if not backup_path.endswith(".sfs"):
-        backup_path += ".sfs"
+    repository_backup = read_repository_backup(backup_path)
+    if repository_backup:
+        repo, metadata = repository_backup
+        is_full_backup = metadata.get("is_full_backup", False)
+        print(f"Backup from the repository at {repo}, taken {metadata.get('timestamp')}.")
+    else:
+        backup_path = find_backup_image(backup_path)
 
-    if not os.path.exists(backup_path):
-        print(f"Error: Backup file '{backup_path}' not found.", file=sys.stderr)
-        sys.stderr.write(f"Error: Backup file '{backup_path}' not found.")
-        sys.exit(1)
+        if not os.path.exists(backup_path):
+            print(f"Error: Backup file '{backup_path}' not found.", file=sys.stderr)
+            sys.stderr.write(f"Error: Backup file '{backup_path}' not found.")
+            sys.exit(1)
 
-    metadata_path = backup_path.replace(".sfs", ".json")
-    is_full_backup = False
-    if os.path.exists(metadata_path):
-        try:
-            with open(metadata_path, "r") as f:
-                metadata = json.load(f)
-            is_full_backup = metadata.get("is_full_backup", False)
-        except json.JSONDecodeError:
-            print(f"Warning: Could not read metadata from {metadata_path}. Assuming not a full backup.", file=sys.stderr)
+        image_format = image_format_or_exit(backup_path)
+        metadata_path = os.path.splitext(backup_path)[0] + ".json"
+        is_full_backup = False
+        if os.path.exists(metadata_path):
+            try:
+                with open(metadata_path, "r") as f:
+                    metadata = json.load(f)
+                is_full_backup = metadata.get("is_full_backup", False)
+            except json.JSONDecodeError:
+                print(f"Warning: Could not read metadata from {metadata_path}. Assuming not a full backup.", file=sys.stderr)
+        else:
+            backup_summary = describe_image(backup_path)
+            if backup_summary:
+                print(f"No metadata found for this backup. Backup contents: {backup_summary}")
 
     print(f"Rolling back slot '{slot}' from backup: {backup_path}")
     part_path = lordo(f"root_{slot}", device)
@@ -134,10 +307,16 @@ def handle_rollback_slot(args):
     run_command(f"mkdir -p {temp_extract_dir}")
     try:
         print("Extracting backup to temporary location...")
-        run_command(f"unsquashfs -d {temp_extract_dir} {backup_path}")
-        fstype_result = subprocess.run(["blkid","-s","TYPE","-o","value",subprocess.run(["findmnt","-no","SOURCE","/"],capture_output=True,text=True).stdout.strip()],capture_output=True,text=True)
-        fstype = fstype_result.stdout.strip()
-        if not fstype:
+        if repository_backup:
+            try:
+                restore_from_repository(repo, metadata, temp_extract_dir)
+            except OSError as e:
+                print(f"Error: Could not restore the backup: {e}", file=sys.stderr)
+                sys.exit(1)
+        else:
+            extract_image(backup_path, temp_extract_dir, image_format, xattrs=True)
+        fstype = (mount_info("/") or {}).get("fstype")
+        if fstype in (None, "overlay"):
             fstype = "ext4"
             print(f"Warning: Could not determine filesystem type for root partition. Defaulting to {fstype} for formatting.")
 
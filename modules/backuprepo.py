@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import gzip
+import zlib
+import stat
+import fcntl
+import hashlib
+import contextlib
+
+# A backup repository keeps file contents as content-defined chunks (cut
+# like delta.py cuts images) named by their SHA256, so data that did not
+# change between backups, or is shared by both slots, is stored once.
+# Each backup is a metadata JSON plus a gzipped JSON-lines index of every
+# file with its chunk list.
+BACKUP_REPO_DIR = "/var/backups/obsidianctl/repository"
+BACKUP_CHUNK_DIR = "chunks"
+BACKUP_INDEX_EXT = ".index.gz"
+BACKUP_REPO_LOCK = "lock"
+BACKUP_CHUNK_LEVEL = 3
+# Chunk files start with a byte saying how the rest is stored.
+BACKUP_CHUNK_ZLIB = b"z"
+BACKUP_CHUNK_RAW = b"n"
+
+
+@contextlib.contextmanager
+def _repo_lock(repo, exclusive=False):
+    """Hold the repository lock: shared for backups and restores, exclusive for gc."""
+    os.makedirs(repo, exist_ok=True)
+    with open(os.path.join(repo, BACKUP_REPO_LOCK), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _chunk_path(repo, digest):
+    return os.path.join(repo, BACKUP_CHUNK_DIR, digest[:2], digest)
+
+
+def store_chunk(repo, data):
+    """Add data to the chunk store unless it is already there. Returns (digest, bytes written)."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(repo, digest)
+    if os.path.exists(path):
+        return digest, 0
+    packed = zlib.compress(data, BACKUP_CHUNK_LEVEL)
+    blob = BACKUP_CHUNK_ZLIB + packed if len(packed) < len(data) else BACKUP_CHUNK_RAW + data
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return digest, len(blob)
+
+
+def load_chunk(repo, digest):
+    """Return the data of a chunk, checked against its digest. Raises OSError."""
+    with open(_chunk_path(repo, digest), "rb") as f:
+        blob = f.read()
+    try:
+        data = zlib.decompress(blob[1:]) if blob[:1] == BACKUP_CHUNK_ZLIB else blob[1:]
+    except zlib.error:
+        raise OSError(f"chunk {digest} is corrupted")
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise OSError(f"chunk {digest} is corrupted")
+    return data
+
+
+def _xattrs(path):
+    try:
+        names = os.listxattr(path, follow_symlinks=False)
+        return {name: os.getxattr(path, name, follow_symlinks=False).hex() for name in names}
+    except OSError:
+        return {}
+
+
+def read_backup_index(index_path):
+    """Yield the entries of a backup index in the order they were written."""
+    with gzip.open(index_path, "rt") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def repository_backups(repo, slot=None):
+    """Return [(metadata path, metadata)] of the backups in repo, oldest first."""
+    backups = []
+    try:
+        names = sorted(os.listdir(repo))
+    except OSError:
+        return backups
+    for name in names:
+        if not name.endswith(".json") or (slot and not name.startswith(f"slot_{slot}_backup_")):
+            continue
+        path = os.path.join(repo, name)
+        try:
+            with open(path, "r") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if metadata.get("index"):
+            backups.append((path, metadata))
+    return backups
+
+
+def read_repository_backup(path):
+    """Return (repository, metadata) if path names a repository backup, else None.
+
+    path is the backup's metadata JSON, with or without the extension, or
+    its index.
+    """
+    if path.endswith(BACKUP_INDEX_EXT):
+        path = path[:-len(BACKUP_INDEX_EXT)]
+    for candidate in (path, path + ".json"):
+        if not candidate.endswith(".json") or not os.path.isfile(candidate):
+            continue
+        try:
+            with open(candidate, "r") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if isinstance(metadata, dict) and metadata.get("index"):
+            return os.path.dirname(os.path.abspath(candidate)), metadata
+    return None
+
+
+def _backup_file(repo, path, st, previous, stats):
+    """Return the chunk list of a file, reusing the previous backup's if it is unchanged."""
+    if previous and previous["size"] == st.st_size and previous["mtime_ns"] == st.st_mtime_ns \
+            and all(os.path.exists(_chunk_path(repo, digest)) for digest in previous["chunks"]):
+        stats["unchanged_files"] += 1
+        return previous["chunks"]
+    chunks = []
+    for _, data in iter_chunks(path):
+        digest, written = store_chunk(repo, data)
+        chunks.append(digest)
+        stats["stored_bytes"] += written
+        stats["new_chunks"] += 1 if written else 0
+    return chunks
+
+
+def backup_to_repository(source, repo, name, slot):
+    """Back up the tree at source into repo as name.
+
+    Writes name + BACKUP_INDEX_EXT; the caller writes the metadata JSON
+    that makes it a backup, before releasing the repository lock. Files
+    whose size and mtime match the slot's previous backup are not read
+    again, and further links to a file already backed up are recorded as
+    hard links to it. Returns the statistics.
+    """
+    stats = {"files": 0, "bytes": 0, "unchanged_files": 0, "new_chunks": 0, "stored_bytes": 0}
+    previous = {}
+    earlier = repository_backups(repo, slot)
+    if earlier:
+        path, metadata = earlier[-1]
+        print(f"Comparing with the previous backup {os.path.basename(path)}...")
+        for entry in read_backup_index(os.path.join(repo, metadata["index"])):
+            if entry["type"] == "file":
+                previous[entry["path"]] = {k: entry[k] for k in ("size", "mtime_ns", "chunks")}
+
+    # (st_dev, st_ino) -> path of the first link seen to each multiply
+    # linked inode.
+    inodes = {}
+    index_path = os.path.join(repo, name + BACKUP_INDEX_EXT)
+    with gzip.open(index_path + ".tmp", "wt", compresslevel=6) as index:
+        for dirpath, dirnames, filenames in os.walk(source):
+            rel_dir = os.path.relpath(dirpath, source)
+            if rel_dir == ".":
+                # Runtime directories are kept, but not what is in them.
+                dirnames[:] = [d for d in dirnames if d != "lost+found"]
+                skipped = [d for d in dirnames if d in IMAGE_EXCLUDED_DIRS]
+            else:
+                skipped = []
+            for entry_name in sorted(dirnames) + sorted(filenames):
+                path = os.path.join(dirpath, entry_name)
+                rel = os.path.normpath(os.path.join(rel_dir, entry_name))
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                entry = {"path": rel, "mode": st.st_mode, "uid": st.st_uid, "gid": st.st_gid, "mtime_ns": st.st_mtime_ns}
+                if st.st_nlink > 1 and not stat.S_ISDIR(st.st_mode):
+                    inode = (st.st_dev, st.st_ino)
+                    if inode in inodes:
+                        entry["type"] = "hardlink"
+                        entry["target"] = inodes[inode]
+                        index.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                        continue
+                    inodes[inode] = rel
+                if stat.S_ISDIR(st.st_mode):
+                    entry["type"] = "dir"
+                elif stat.S_ISLNK(st.st_mode):
+                    entry["type"] = "link"
+                    entry["target"] = os.readlink(path)
+                elif stat.S_ISREG(st.st_mode):
+                    entry["type"] = "file"
+                    entry["size"] = st.st_size
+                    entry["chunks"] = _backup_file(repo, path, st, previous.get(rel), stats)
+                    stats["files"] += 1
+                    stats["bytes"] += st.st_size
+                else:
+                    entry["type"] = "special"
+                    entry["rdev"] = st.st_rdev
+                xattrs = _xattrs(path)
+                if xattrs:
+                    entry["xattrs"] = xattrs
+                index.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            dirnames[:] = [d for d in dirnames if d not in skipped]
+    os.replace(index_path + ".tmp", index_path)
+    return stats
+
+
+def _apply_metadata(path, entry):
+    for name, value in entry.get("xattrs", {}).items():
+        try:
+            os.setxattr(path, name, bytes.fromhex(value), follow_symlinks=False)
+        except OSError as e:
+            print(f"Warning: Could not restore {name} on /{entry['path']}: {e}", file=sys.stderr)
+    os.chown(path, entry["uid"], entry["gid"], follow_symlinks=False)
+    if entry["type"] != "link":
+        os.chmod(path, stat.S_IMODE(entry["mode"]))
+    os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]), follow_symlinks=False)
+
+
+def restore_from_repository(repo, metadata, dest):
+    """Recreate the tree of a repository backup at dest. Returns the bytes written."""
+    written = 0
+    dirs = []
+    with _repo_lock(repo):
+        for entry in read_backup_index(os.path.join(repo, metadata["index"])):
+            path = os.path.join(dest, entry["path"])
+            if entry["type"] == "dir":
+                os.makedirs(path, exist_ok=True)
+                dirs.append(entry)
+                continue
+            if os.path.lexists(path):
+                os.remove(path)
+            if entry["type"] == "hardlink":
+                # The first link came earlier in the index and carries the metadata.
+                os.link(os.path.join(dest, entry["target"]), path)
+                continue
+            if entry["type"] == "link":
+                os.symlink(entry["target"], path)
+            elif entry["type"] == "file":
+                with open(path, "wb") as f:
+                    for digest in entry["chunks"]:
+                        written += f.write(load_chunk(repo, digest))
+            else:
+                os.mknod(path, entry["mode"], entry["rdev"])
+            _apply_metadata(path, entry)
+    # Directory times are set last, after their contents stopped changing.
+    for entry in reversed(dirs):
+        _apply_metadata(os.path.join(dest, entry["path"]), entry)
+    return written
+
+
+def gc_repository(repo, keep=None):
+    """Delete all but the newest keep backups of each slot, then the chunks no backup uses.
+
+    Returns (backups deleted, chunks deleted, bytes freed).
+    """
+    deleted_backups = 0
+    with _repo_lock(repo, exclusive=True):
+        if keep is not None:
+            for slot in ("a", "b"):
+                backups = repository_backups(repo, slot)
+                for path, metadata in backups[:max(len(backups) - keep, 0)]:
+                    print(f"Deleting backup {os.path.basename(path)}...")
+                    os.remove(os.path.join(repo, metadata["index"]))
+                    os.remove(path)
+                    deleted_backups += 1
+        backups = repository_backups(repo)
+        # Backups write their metadata before releasing the lock, so an
+        # index without metadata is left over from one that was interrupted.
+        indexes = {metadata["index"] for _, metadata in backups}
+        for name in os.listdir(repo):
+            if (name.endswith(BACKUP_INDEX_EXT) or name.endswith(BACKUP_INDEX_EXT + ".tmp")) and name not in indexes:
+                print(f"Deleting unfinished backup {name}...")
+                os.remove(os.path.join(repo, name))
+        referenced = set()
+        for _, metadata in backups:
+            for entry in read_backup_index(os.path.join(repo, metadata["index"])):
+                referenced.update(entry.get("chunks", ()))
+        deleted_chunks = freed = 0
+        chunk_dir = os.path.join(repo, BACKUP_CHUNK_DIR)
+        for dirpath, _, filenames in os.walk(chunk_dir):
+            for name in filenames:
+                if name in referenced:
+                    continue
+                path = os.path.join(dirpath, name)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                deleted_chunks += 1
+    return deleted_backups, deleted_chunks, freed
+
+
+def handle_backup_gc(args):
+    checkroot()
+    repo = args.backup_dir or BACKUP_REPO_DIR
+    if not os.path.isdir(os.path.join(repo, BACKUP_CHUNK_DIR)):
+        print(f"Error: '{repo}' is not a backup repository.", file=sys.stderr)
+        sys.exit(1)
+    if args.keep is not None and args.keep < 1:
+        print("Error: --keep must be at least 1.", file=sys.stderr)
+        sys.exit(1)
+    deleted_backups, deleted_chunks, freed = gc_repository(repo, args.keep)
+    print(f"Deleted {deleted_backups} backups and {deleted_chunks} unused chunks, freeing {freed / (1024*1024):.1f} MB.")
@@ -0,0 +1,216 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+
+# System images are kept under their SHA256, so the same image reached by
+# different routes (a download, a .mkobsfs build, a local file) is stored
+# once. Other keys, such as the hash of a .mkobsfs recipe, point at it.
+IMAGE_CACHE_DIR = "/var/cache/obsidianctl/images"
+IMAGE_CACHE_INDEX = f"{IMAGE_CACHE_DIR}/index.json"
+IMAGE_CACHE_MAX_SIZE = 20 * 1024 * 1024 * 1024
+# The cache is also kept small enough to leave this much free on its
+# filesystem, which it usually shares with the rest of /var.
+IMAGE_CACHE_MIN_FREE = 2 * 1024 * 1024 * 1024
+
+
+def parse_size(text):
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"invalid size '{text}'")
+    power = " KMGT".index(match.group(2).upper() or " ")
+    return int(float(match.group(1)) * 1024 ** power)
+
+
+def _load_cache_index():
+    try:
+        with open(IMAGE_CACHE_INDEX, "r") as f:
+            index = json.load(f)
+        if isinstance(index.get("images"), dict) and isinstance(index.get("keys"), dict):
+            return index
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {"images": {}, "keys": {}}
+
+
+def _save_cache_index(index):
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    tmp_path = IMAGE_CACHE_INDEX + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, IMAGE_CACHE_INDEX)
+
+
+def mkobsfs_cache_key(recipe, builder):
+    with open(recipe, "rb") as f:
+        return f"{builder}:{hashlib.sha256(f.read()).hexdigest()}"
+
+
+def cached_images():
+    """Return the cached image records, most recently used first."""
+    index = _load_cache_index()
+    images = []
+    for digest, entry in index["images"].items():
+        path = os.path.join(IMAGE_CACHE_DIR, entry["file"])
+        if os.path.exists(path):
+            images.append(dict(entry, sha256=digest, path=path))
+    images.sort(key=lambda e: e["last_used"], reverse=True)
+    return images
+
+
+def cache_lookup(key=None, sha256=None):
+    """Return the path of a cached image by key or SHA256, or None."""
+    index = _load_cache_index()
+    digest = sha256 or index["keys"].get(key)
+    entry = index["images"].get(digest) if digest else None
+    if entry is None:
+        return None
+    path = os.path.join(IMAGE_CACHE_DIR, entry["file"])
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    if size != entry["size"]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    entry["last_used"] = time.time()
+    try:
+        _save_cache_index(index)
+    except OSError:
+        pass
+    return path
+
+
+def _cache_budget(incoming=0):
+    """How large the cache may be with incoming more bytes about to be written to its filesystem."""
+    total = sum(entry["size"] for entry in cached_images())
+    free = shutil.disk_usage(IMAGE_CACHE_DIR).free
+    return min(IMAGE_CACHE_MAX_SIZE, total + free - IMAGE_CACHE_MIN_FREE - incoming)
+
+
+def _copy_image(path, dest):
+    """Copy path to dest, sharing the data blocks where the filesystem can."""
+    with open(path, "rb") as src, open(dest, "wb") as dst:
+        try:
+            # copy_file_range() reflinks on btrfs and XFS.
+            while os.copy_file_range(src.fileno(), dst.fileno(), 1 << 30):
+                pass
+        except OSError:
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def cache_store(path, key=None, sha256=None, move=False):
+    """Add the image at path to the cache and return its cached path.
+
+    The image is copied into the cache, so later changes to path do not
+    reach it. With move, it is moved instead when it is on the same
+    filesystem, and the original is removed either way.
+    """
+    in_cache = os.path.dirname(os.path.abspath(path)) == IMAGE_CACHE_DIR
+    if in_cache:
+        digest = os.path.splitext(os.path.basename(path))[0]
+    else:
+        digest = sha256 or file_sha256(path)
+    index = _load_cache_index()
+    entry = index["images"].get(digest)
+    if entry is None:
+        ext = IMAGE_EXTENSIONS.get(detect_image_format(path), os.path.splitext(path)[1])
+        entry = {"file": digest + ext, "size": os.path.getsize(path), "added": time.time(), "keys": []}
+        index["images"][digest] = entry
+    dest = os.path.join(IMAGE_CACHE_DIR, entry["file"])
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    if not in_cache and not os.path.exists(dest):
+        moved = False
+        if move:
+            try:
+                os.replace(path, dest)
+                moved = True
+            except OSError:
+                pass
+        if not moved:
+            prune_cache(_cache_budget(entry["size"]))
+            tmp_dest = dest + ".tmp"
+            try:
+                _copy_image(path, tmp_dest)
+                os.replace(tmp_dest, dest)
+            except OSError:
+                if os.path.exists(tmp_dest):
+                    os.remove(tmp_dest)
+                raise
+    if move and not in_cache and os.path.exists(path):
+        os.remove(path)
+    entry["last_used"] = time.time()
+    if key:
+        index["keys"][key] = digest
+        if key not in entry["keys"]:
+            entry["keys"].append(key)
+    _save_cache_index(index)
+    prune_cache(_cache_budget(), keep=digest)
+    return dest
+
+
+def prune_cache(max_size, keep=None):
+    """Evict least recently used images until the cache fits in max_size.
+
+    Returns the list of evicted SHA256s.
+    """
+    index = _load_cache_index()
+    images = index["images"]
+    for digest in [d for d, e in images.items() if not os.path.exists(os.path.join(IMAGE_CACHE_DIR, e["file"]))]:
+        del images[digest]
+    total = sum(e["size"] for e in images.values())
+    evicted = []
+    for digest in sorted(images, key=lambda d: images[d].get("last_used", 0)):
+        if total <= max_size:
+            break
+        if digest == keep:
+            continue
+        try:
+            os.remove(os.path.join(IMAGE_CACHE_DIR, images[digest]["file"]))
+        except FileNotFoundError:
+            pass
+        total -= images[digest]["size"]
+        del images[digest]
+        evicted.append(digest)
+    index["keys"] = {k: d for k, d in index["keys"].items() if d in images}
+    if os.path.isdir(IMAGE_CACHE_DIR):
+        _save_cache_index(index)
+    return evicted
+
+
+def handle_cache(args):
+    if args.cache_command == "list":
+        images = cached_images()
+        if not images:
+            print("The image cache is empty.")
+            return
+        print(f"{'SHA256':<14} {'Size (MB)':>10}  {'Last used':<17} Keys")
+        for entry in images:
+            last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_used"]))
+            keys = ", ".join(entry["keys"]) or "-"
+            print(f"{entry['sha256'][:12]:<14} {entry['size'] / (1024*1024):>10.1f}  {last_used:<17} {keys}")
+        total = sum(e["size"] for e in images)
+        print(f"\n{len(images)} image(s), {total / (1024*1024):.1f} MB in {IMAGE_CACHE_DIR}")
+    elif args.cache_command == "prune":
+        checkroot()
+        try:
+            max_size = 0 if args.all else parse_size(args.max_size)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        evicted = prune_cache(max_size)
+        for digest in evicted:
+            print(f"Removed {digest[:12]}")
+        print(f"Removed {len(evicted)} image(s).")
+    else:
+        print("Invalid 'cache' command. Use 'list' or 'prune'.", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import urllib.error
+import concurrent.futures
+
+# Images are cut into content-defined chunks: a chunk ends after the first
+# DELTA_ANCHOR found at least DELTA_MIN_CHUNK bytes into it, or at
+# DELTA_MAX_CHUNK. Because cut points depend only on the bytes around them,
+# an insertion early in the image only changes the chunks it touches and
+# everything after it resynchronises at the next anchor. On compressed
+# image data a two byte anchor occurs about every 64 KiB.
+DELTA_ANCHOR = b"\x4f\xb5"
+DELTA_MIN_CHUNK = 64 * 1024
+DELTA_MAX_CHUNK = 1024 * 1024
+DELTA_READ_SIZE = 8 * 1024 * 1024
+DELTA_INDEX_EXT = ".chunks"
+DELTA_INDEX_VERSION = 1
+# Neighbouring missing chunks are fetched together, up to this many bytes
+# per Range request.
+DELTA_MAX_REQUEST = 8 * 1024 * 1024
+# Images that may share chunks with a new one, besides the image cache and
+# the download directory.
+DELTA_LOCAL_SOURCES = ["/etc/system.sfs"]
+
+
+def iter_chunks(path):
+    """Yield (offset, data) for the content-defined chunks of the file at path."""
+    offset = 0
+    buf = b""
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(DELTA_READ_SIZE)
+            buf += data
+            pos = 0
+            while pos < len(buf):
+                if data and len(buf) - pos < DELTA_MAX_CHUNK:
+                    break
+                cut = buf.find(DELTA_ANCHOR, pos + DELTA_MIN_CHUNK, pos + DELTA_MAX_CHUNK)
+                end = cut + len(DELTA_ANCHOR) if cut != -1 else min(pos + DELTA_MAX_CHUNK, len(buf))
+                yield offset, buf[pos:end]
+                offset += end - pos
+                pos = end
+            buf = buf[pos:]
+            if not data:
+                break
+
+
+def build_chunk_index(image, url=None):
+    image_hash = hashlib.sha256()
+    chunks = []
+    for _, data in iter_chunks(image):
+        image_hash.update(data)
+        chunks.append([len(data), hashlib.sha256(data).hexdigest()])
+    index = {
+        "version": DELTA_INDEX_VERSION,
+        "size": sum(length for length, _ in chunks),
+        "sha256": image_hash.hexdigest(),
+        "chunks": chunks,
+    }
+    if url:
+        index["url"] = url
+    return index
+
+
+def load_chunk_index(location):
+    """Read a chunk index from a local path or an http(s) URL."""
+    try:
+        if is_url(location):
+            with _open_url(location) as resp:
+                index = json.loads(resp.read())
+        else:
+            with open(location, "r") as f:
+                index = json.load(f)
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+    if not isinstance(index, dict) or index.get("version") != DELTA_INDEX_VERSION:
+        return None
+    return index
+
+
+def _local_chunks(sources, wanted):
+    """Map the hashes in wanted to (path, offset, length) in the local images."""
+    found = {}
+    seen = set()
+    for path in sources:
+        if not os.path.isfile(path):
+            continue
+        st = os.stat(path)
+        if (st.st_dev, st.st_ino) in seen:
+            continue
+        seen.add((st.st_dev, st.st_ino))
+        print(f"Scanning {path} for reusable chunks...")
+        try:
+            for offset, data in iter_chunks(path):
+                digest = hashlib.sha256(data).hexdigest()
+                if digest in wanted and digest not in found:
+                    found[digest] = (path, offset, len(data))
+        except OSError as e:
+            print(f"Warning: Could not read {path}: {e}", file=sys.stderr)
+    return found
+
+
+def _copy_local_chunk(fd, dest_offset, source, digest):
+    path, offset, length = source
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    if hashlib.sha256(data).hexdigest() != digest:
+        return False
+    os.pwrite(fd, data, dest_offset)
+    return True
+
+
+def _fetch_chunk_run(url, fd, run):
+    """Fetch a run of adjacent chunks [(offset, length, digest), ...] with one Range request."""
+    start = run[0][0]
+    end = run[-1][0] + run[-1][1]
+    error = None
+    for _ in range(DOWNLOAD_RETRIES):
+        try:
+            with _open_url(url, {"Range": f"bytes={start}-{end - 1}"}) as resp:
+                if resp.status != 206:
+                    raise OSError("server ignored the Range request")
+                for offset, length, digest in run:
+                    data = resp.read(length)
+                    if len(data) != length:
+                        raise OSError("connection closed early")
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise OSError(f"checksum mismatch at offset {offset}")
+                    os.pwrite(fd, data, offset)
+            return end - start
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            error = e
+    raise OSError(f"range {start}-{end - 1} failed: {error}")
+
+
+def delta_download(index, url, dest, sources, connections=None):
+    """Rebuild the image described by index at dest.
+
+    Chunks found in the local source images are copied from them and only
+    the rest is downloaded from url. Returns (reused_bytes, fetched_bytes).
+    """
+    connections = DOWNLOAD_CONNECTIONS if connections is None else connections
+    layout = []
+    offset = 0
+    for length, digest in index["chunks"]:
+        layout.append((offset, length, digest))
+        offset += length
+    if offset != index["size"]:
+        raise ValueError("chunk index is inconsistent")
+
+    found = _local_chunks(sources, {digest for _, _, digest in layout})
+    reused = 0
+    missing = []
+    fd = os.open(dest, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            os.posix_fallocate(fd, 0, index["size"])
+        except OSError:
+            os.ftruncate(fd, index["size"])
+        for offset, length, digest in layout:
+            if digest in found and _copy_local_chunk(fd, offset, found[digest], digest):
+                reused += length
+            else:
+                missing.append((offset, length, digest))
+
+        runs = []
+        for chunk in missing:
+            if runs and runs[-1][-1][0] + runs[-1][-1][1] == chunk[0] and \
+                    chunk[0] + chunk[1] - runs[-1][0][0] <= DELTA_MAX_REQUEST:
+                runs[-1].append(chunk)
+            else:
+                runs.append([chunk])
+        total = sum(length for _, length, _ in missing)
+        print(f"Reusing {reused / (1024*1024):.1f} MB from local images, downloading {total / (1024*1024):.1f} MB...")
+        fetched = 0
+        started = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(connections, 1)) as executor:
+            futures = [executor.submit(_fetch_chunk_run, url, fd, run) for run in runs]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    fetched += future.result()
+                    _print_progress(fetched, total, started)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        if runs:
+            print()
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return reused, fetched
+
+
+def delta_sources(extra=None):
+    sources = list(extra or []) + [entry["path"] for entry in cached_images()] + DELTA_LOCAL_SOURCES
+    if os.path.isdir(DOWNLOAD_DIR):
+        for name in sorted(os.listdir(DOWNLOAD_DIR)):
+            if not name.endswith((".part", ".json", ".tmp", DELTA_INDEX_EXT)):
+                sources.append(os.path.join(DOWNLOAD_DIR, name))
+    return sources
+
+
+def delta_update_or_exit(index_location, index=None, connections=None, extra_sources=None):
+    """Rebuild the image behind a chunk index in DOWNLOAD_DIR and return its path.
+
+    The result serves as a chunk source for the next delta update, from
+    DOWNLOAD_DIR or, once update has moved it there, the image cache.
+    """
+    index = index or load_chunk_index(index_location)
+    if index is None:
+        print(f"Error: Could not read chunk index '{index_location}'.", file=sys.stderr)
+        sys.exit(1)
+    url = index.get("url") or index_location[: -len(DELTA_INDEX_EXT)]
+    if not is_url(url):
+        print(f"Error: Chunk index '{index_location}' does not say where to download the image from.", file=sys.stderr)
+        sys.exit(1)
+    cached = cache_lookup(sha256=index["sha256"])
+    if cached:
+        print(f"Using cached image {cached}.")
+        return cached
+    dest = download_path(url)
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    if os.path.exists(dest) and os.path.getsize(dest) == index["size"] and file_sha256(dest) == index["sha256"]:
+        print(f"{dest} is already up to date.")
+        return dest
+
+    tmp_dest = dest + ".delta"
+    try:
+        reused, fetched = delta_download(index, url, tmp_dest, delta_sources(extra_sources), connections)
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        print(f"\nError: Delta update failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    digest = file_sha256(tmp_dest)
+    if digest != index["sha256"]:
+        os.remove(tmp_dest)
+        print(f"Error: Rebuilt image checksum mismatch (expected {index['sha256']}, got {digest}).", file=sys.stderr)
+        sys.exit(1)
+    os.replace(tmp_dest, dest)
+    total = reused + fetched
+    print(f"SHA256: {digest} (verified)")
+    if total:
+        print(f"Downloaded {fetched / (1024*1024):.1f} MB of {total / (1024*1024):.1f} MB ({fetched * 100 / total:.1f}%).")
+    return dest
+
+
+def handle_delta_index(args):
+    image = args.image
+    if not os.path.isfile(image):
+        print(f"Error: Image '{image}' not found.", file=sys.stderr)
+        sys.exit(1)
+    output = args.output or image + DELTA_INDEX_EXT
+    print(f"Indexing {image}...")
+    index = build_chunk_index(image, args.url)
+    with open(output, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    sizes = [length for length, _ in index["chunks"]]
+    average = sum(sizes) / len(sizes) if sizes else 0
+    print(f"Wrote {output}: {len(sizes)} chunks, average {average / 1024:.0f} KiB.")
@@ -1,15 +1,191 @@
+import os
+import sys
+import json
+import stat
+import fnmatch
+import collections
+import concurrent.futures
+
+# Hashes in flight at once while diffing files. Results are printed in
+# path order, so this bounds how far the walk runs ahead of the output.
+DIFF_PENDING_MAX = 256
+
+
+def _kind(st):
+    if stat.S_ISDIR(st.st_mode):
+        return "dir"
+    if stat.S_ISLNK(st.st_mode):
+        return "link"
+    if stat.S_ISREG(st.st_mode):
+        return "file"
+    return "other"
+
+
+def _scan_dir(path):
+    """Return the entries of path as sorted (name, kind, size, mtime_ns) tuples."""
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries.append((entry.name, _kind(st), st.st_size, st.st_mtime_ns))
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    entries.sort()
+    return entries
+
+
+def _scan_entry(path):
+    """Return path as a (name, kind, size, mtime_ns) tuple like _scan_dir(), or None if it is missing."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    return os.path.basename(path), _kind(st), st.st_size, st.st_mtime_ns
+
+
+def _excluded(rel, excludes):
+    return any(fnmatch.fnmatch(rel, pattern) for pattern in excludes)
+
+
+def _same_contents(path_a, path_b):
+    try:
+        return hash_file(path_a) == hash_file(path_b)
+    except OSError:
+        return False
+
+
+def _diff_dir(root_a, root_b, rel, excludes, executor, stats):
+    """Yield ("+"|"-"|"~", path, kind, pending) for the directory rel, depth first in path order.
+
+    Both sides are listed at the same time. Files whose size and mtime
+    match are taken as equal; files of the same size but a different
+    mtime are hashed, and pending is then a future for whether they
+    differ. Directories on one side only are reported, not descended.
+    Paths the file index ignores (MANIFEST_IGNORED) are skipped.
+    """
+    listing_a, listing_b = executor.map(_scan_dir, [os.path.join(root_a, rel), os.path.join(root_b, rel)])
+    entries_a = {e[0]: e for e in listing_a}
+    entries_b = {e[0]: e for e in listing_b}
+    for name in sorted(entries_a.keys() | entries_b.keys()):
+        path = os.path.join(rel, name) if rel else name
+        if _excluded(path, excludes) or _excluded(path, MANIFEST_IGNORED):
+            continue
+        yield from _diff_entry(root_a, root_b, path, entries_a.get(name), entries_b.get(name), excludes, executor, stats)
+
+
+def _diff_entry(root_a, root_b, path, a, b, excludes, executor, stats):
+    """Yield the differences for path, given its _scan_dir() entry on each side (None if missing)."""
+    stats["entries"] += 1
+    if b is None:
+        yield "-", path, a[1], None
+    elif a is None:
+        yield "+", path, b[1], None
+    elif a[1] != b[1]:
+        yield "~", path, f"{a[1]}->{b[1]}", None
+    elif a[1] == "dir":
+        yield from _diff_dir(root_a, root_b, path, excludes, executor, stats)
+    elif a[1] == "link":
+        if os.readlink(os.path.join(root_a, path)) != os.readlink(os.path.join(root_b, path)):
+            yield "~", path, "link", None
+    elif a[1] == "file" and a[2] != b[2]:
+        yield "~", path, "file", None
+    elif a[1] == "file" and a[3] != b[3]:
+        stats["hashed"] += 1
+        stats["hashed_bytes"] += a[2] + b[2]
+        pending = executor.submit(_same_contents, os.path.join(root_a, path), os.path.join(root_b, path))
+        yield "~", path, "file", pending
+
+
+def diff_trees(root_a, root_b, paths=None, excludes=(), jobs=None, stats=None):
+    """Yield ("+"|"-"|"~", path, kind) for every difference from root_a to root_b, in path order.
+
+    Memory stays bounded by the directory depth and DIFF_PENDING_MAX,
+    not by the size of the trees.
+    """
+    jobs = MANIFEST_JOBS if jobs is None else jobs
+    stats = stats if stats is not None else collections.Counter()
+    pending = collections.deque()
+    # At least two workers, so both sides are always listed side by side.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 2)) as executor:
+        for start in paths or [""]:
+            start = os.path.normpath(start.strip("/")) if start.strip("/") else ""
+            if start:
+                # A --path may name a file as well as a directory.
+                a, b = _scan_entry(os.path.join(root_a, start)), _scan_entry(os.path.join(root_b, start))
+                if a is None and b is None:
+                    print(f"Warning: /{start} exists in neither slot.", file=sys.stderr)
+                    continue
+                changes = _diff_entry(root_a, root_b, start, a, b, excludes, executor, stats)
+            else:
+                changes = _diff_dir(root_a, root_b, start, excludes, executor, stats)
+            for change in changes:
+                pending.append(change)
+                # Print whatever is settled at the head, and wait for the
+                # head only once the window is full.
+                while pending and (pending[0][3] is None or pending[0][3].done() or len(pending) >= DIFF_PENDING_MAX):
+                    status, path, kind, future = pending.popleft()
+                    if future is None or not future.result():
+                        yield status, path, kind
+        while pending:
+            status, path, kind, future = pending.popleft()
+            if future is None or not future.result():
+                yield status, path, kind
+
+
+def _print_file_diff(root_a, root_b, args, label_a, label_b):
+    stats = collections.Counter()
+    counts = collections.Counter()
+    names = {"+": "added", "-": "removed", "~": "modified"}
+    for status, path, kind in diff_trees(root_a, root_b, args.path, args.exclude or (), args.jobs, stats):
+        counts[status] += 1
+        suffix = "/" if kind == "dir" else ""
+        if args.json:
+            print(json.dumps({"change": names[status], "path": f"/{path}{suffix}", "kind": kind}))
+        else:
+            print(f"{status} /{path}{suffix}" + (f" ({kind})" if "->" in kind else ""))
+    summary = {
+        "from": label_a,
+        "to": label_b,
+        "entries": stats["entries"],
+        "hashed": stats["hashed"],
+        "hashed_bytes": stats["hashed_bytes"],
+        **{names[s]: counts[s] for s in names},
+    }
+    if args.json:
+        print(json.dumps({"summary": summary}))
+    else:
+        print(
+            f">> {label_a}->{label_b}: {counts['+']} added, {counts['-']} removed, {counts['~']} modified "
+            f"({stats['entries']} entries compared, {stats['hashed']} files hashed)"
+        )
+
+
 def handle_slot_diff(args):
     checkroot()
     current = get_current_slot()
     inactive = "b" if current == "a" else "a"
     mount_current = f"/mnt/obsidian_slot_{current}"
     mount_inactive = f"/mnt/obsidian_slot_{inactive}"
-    os.makedirs(mount_current, exist_ok=True)
-    os.makedirs(mount_inactive, exist_ok=True)
     part_current = lordo(f"root_{current}")
     part_inactive = lordo(f"root_{inactive}")
-    run_command(f"mount {part_current} {mount_current}")
-    run_command(f"mount {part_inactive} {mount_inactive}")
+    mount_slot_root(part_current, mount_current, f"root_{current}", read_only=True)
+    mount_slot_root(part_inactive, mount_inactive, f"root_{inactive}", read_only=True)
+    if args.files:
+        try:
+            _print_file_diff(mount_current, mount_inactive, args, current, inactive)
+        except BrokenPipeError:
+            # The reader (e.g. head) went away; stop quietly.
+            sys.stdout = open(os.devnull, "w")
+        finally:
+            umount_slot_root(mount_current)
+            umount_slot_root(mount_inactive)
+            os.rmdir(mount_current)
+            os.rmdir(mount_inactive)
+        return
     kernel_current = "unknown"
     kernel_inactive = "unknown"
     boot_current = os.path.join(mount_current, "boot")
@@ -23,25 +199,26 @@ def handle_slot_diff(args):
             if f.startswith("vmlinuz"):
                 kernel_inactive = f.replace("vmlinuz-", "")
 
-    pkgs_current = set()
-    pkgs_inactive = set()
-    pacman_current = os.path.join(mount_current, "var/lib/pacman/local")
-    pacman_inactive = os.path.join(mount_inactive, "var/lib/pacman/local")
-    if os.path.exists(pacman_current):
-        pkgs_current = {d.split("-")[0] for d in os.listdir(pacman_current)}
-    if os.path.exists(pacman_inactive):
-        pkgs_inactive = {d.split("-")[0] for d in os.listdir(pacman_inactive)}
-
-    added = sorted(pkgs_inactive - pkgs_current)
-    removed = sorted(pkgs_current - pkgs_inactive)
+    pkgs_current = slot_packages(mount_current, current)
+    pkgs_inactive = slot_packages(mount_inactive, inactive)
+
+    added = sorted(pkgs_inactive.keys() - pkgs_current.keys())
+    removed = sorted(pkgs_current.keys() - pkgs_inactive.keys())
+    changed = []
+    for p in sorted(pkgs_current.keys() & pkgs_inactive.keys()):
+        order = vercmp(pkgs_current[p]["version"], pkgs_inactive[p]["version"])
+        if order:
+            changed.append(("^" if order < 0 else "v", p))
     print(f">> {current}->{inactive} Kernel: {kernel_current}->{kernel_inactive}")
     print(f">> Packages {current}->{inactive}:")
     for p in added:
-        print(f"+ {p}")
+        print(f"+ {p} {pkgs_inactive[p]['version']}")
     for p in removed:
-        print(f"- {p}")
+        print(f"- {p} {pkgs_current[p]['version']}")
+    for mark, p in changed:
+        print(f"{mark} {p} {pkgs_current[p]['version']} -> {pkgs_inactive[p]['version']}")
 
-    run_command(f"umount {mount_current}")
-    run_command(f"umount {mount_inactive}")
+    umount_slot_root(mount_current)
+    umount_slot_root(mount_inactive)
     os.rmdir(mount_current)
     os.rmdir(mount_inactive)
@@ -0,0 +1,354 @@
+import os
+import re
+import json
+import time
+import sys
+import shutil
+import hashlib
+import urllib.error
+import urllib.parse
+import urllib.request
+import concurrent.futures
+
+DOWNLOAD_BUFFER = 1024 * 1024
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_DIR = "/var/cache/obsidianctl/downloads"
+DOWNLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+DOWNLOAD_CONNECTIONS = 4
+DOWNLOAD_RETRIES = 3
+# Finished downloads keep the server's validators next to them, so they
+# are only reused while the server still has the same file.
+DOWNLOAD_INFO_EXT = ".json"
+
+
+def _open_url(url, headers=None):
+    request = urllib.request.Request(url, headers=headers or {})
+    request.add_header("User-Agent", "obsidianctl")
+    return urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
+
+
+def fetch_expected_sha256(url):
+    """Read the published <url>.sha256 checksum, if there is one."""
+    try:
+        with _open_url(url + ".sha256") as resp:
+            text = resp.read(4096).decode(errors="replace")
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+    match = re.match(r"\s*([0-9a-fA-F]{64})\b", text)
+    return match.group(1).lower() if match else None
+
+
+def _print_progress(done, total, started):
+    elapsed = max(time.monotonic() - started, 1e-6)
+    rate = done / elapsed / (1024 * 1024)
+    if total:
+        print(f"\r   {done * 100 // total:3d}% {done / (1024*1024):8.1f} MB  {rate:6.1f} MB/s", end="", flush=True)
+    else:
+        print(f"\r   {done / (1024*1024):8.1f} MB  {rate:6.1f} MB/s", end="", flush=True)
+
+
+def stream_download(url, dest, max_bytes=None):
+    """Write url to dest as it arrives and return its SHA256.
+
+    The hash is computed on the fly, so the data is never read back.
+    Raises OSError if the download would not fit in max_bytes.
+    """
+    hasher = hashlib.sha256()
+    started = time.monotonic()
+    done = 0
+    with _open_url(url) as resp:
+        total = int(resp.headers.get("Content-Length") or 0)
+        if max_bytes is not None and total > max_bytes:
+            raise OSError(
+                f"image is {total / (1024*1024):.0f} MB but only {max_bytes / (1024*1024):.0f} MB are available"
+            )
+        with open(dest, "wb") as f:
+            while True:
+                chunk = resp.read(DOWNLOAD_BUFFER)
+                if not chunk:
+                    break
+                done += len(chunk)
+                if max_bytes is not None and done > max_bytes:
+                    raise OSError("image does not fit in the available space")
+                hasher.update(chunk)
+                f.write(chunk)
+                _print_progress(done, total, started)
+            f.flush()
+            os.fsync(f.fileno())
+    print()
+    if total and done != total:
+        raise OSError(f"connection closed after {done} of {total} bytes")
+    return hasher.hexdigest()
+
+
+def probe_url(url, etag=None, last_modified=None):
+    """Return (status, etag, last_modified) for url without downloading it.
+
+    With a previous ETag or Last-Modified the request is conditional and
+    a status of 304 means the resource has not changed.
+    """
+    headers = {"Range": "bytes=0-0"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        with _open_url(url, headers) as resp:
+            return resp.status, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return 304, etag, last_modified
+        raise
+
+
+def is_url(path):
+    return path.startswith(("http://", "https://"))
+
+
+def download_path(url):
+    """Where a resumable download of url is kept between runs."""
+    name = os.path.basename(urllib.parse.urlparse(url).path) or "download"
+    key = hashlib.sha256(url.encode()).hexdigest()[:12]
+    return os.path.join(DOWNLOAD_DIR, f"{key}-{name}")
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_BUFFER), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def fetch_chunk_manifest(url):
+    """Read the published <url>.chunksums manifest, if there is one.
+
+    The manifest is JSON: {"chunk_size": N, "sha256": [one digest per chunk]}.
+    """
+    try:
+        with _open_url(url + ".chunksums") as resp:
+            manifest = json.loads(resp.read(16 * 1024 * 1024))
+        chunk_size = int(manifest["chunk_size"])
+        digests = [str(d).lower() for d in manifest["sha256"]]
+    except (urllib.error.URLError, OSError, ValueError, KeyError, TypeError):
+        return None
+    if chunk_size <= 0:
+        return None
+    return {"chunk_size": chunk_size, "sha256": digests}
+
+
+def _probe_ranges(url):
+    """Return (size, etag, last_modified); size is None unless the server honours Range requests."""
+    try:
+        with _open_url(url, {"Range": "bytes=0-0"}) as resp:
+            content_range = resp.headers.get("Content-Range", "")
+            etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+            status = resp.status
+    except (urllib.error.URLError, OSError, ValueError):
+        return None, None, None
+    match = re.match(r"bytes 0-0/(\d+)", content_range)
+    if status != 206 or not match:
+        return None, etag, last_modified
+    return int(match.group(1)), etag, last_modified
+
+
+def _save_download_info(dest, url, etag, last_modified):
+    with open(dest + DOWNLOAD_INFO_EXT, "w") as f:
+        json.dump({"url": url, "size": os.path.getsize(dest), "etag": etag, "last_modified": last_modified}, f)
+
+
+def remove_download(dest):
+    """Delete a finished download and what is kept about it."""
+    for path in (dest, dest + DOWNLOAD_INFO_EXT):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _download_is_current(dest, url):
+    """Whether an earlier download of url at dest is still what the server has.
+
+    Asks the server with a conditional request, so files without a
+    stored ETag or Last-Modified are never reused.
+    """
+    try:
+        with open(dest + DOWNLOAD_INFO_EXT, "r") as f:
+            info = json.load(f)
+        if info["url"] != url or info["size"] != os.path.getsize(dest):
+            return False
+        etag, last_modified = info.get("etag"), info.get("last_modified")
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    if not etag and not last_modified:
+        return False
+    try:
+        status, _, _ = probe_url(url, etag, last_modified)
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+    return status == 304
+
+
+def _load_download_state(state_path, url, size, validator, chunk_size):
+    try:
+        with open(state_path, "r") as f:
+            state = json.load(f)
+        if (state["url"], state["size"], state["validator"], state["chunk_size"]) != (url, size, validator, chunk_size):
+            return None
+        return bytearray.fromhex(state["done"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save_download_state(state_path, url, size, validator, chunk_size, done):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(
+            {"url": url, "size": size, "validator": validator, "chunk_size": chunk_size, "done": done.hex()},
+            f,
+        )
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, state_path)
+
+
+def _fetch_range(url, fd, index, chunk_size, size, expected_sha256):
+    start = index * chunk_size
+    end = min(start + chunk_size, size)
+    error = None
+    for _ in range(DOWNLOAD_RETRIES):
+        hasher = hashlib.sha256()
+        offset = start
+        try:
+            with _open_url(url, {"Range": f"bytes={start}-{end - 1}"}) as resp:
+                if resp.status != 206:
+                    raise OSError("server ignored the Range request")
+                while offset < end:
+                    data = resp.read(min(DOWNLOAD_BUFFER, end - offset))
+                    if not data:
+                        break
+                    os.pwrite(fd, data, offset)
+                    hasher.update(data)
+                    offset += len(data)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            error = e
+            continue
+        if offset != end:
+            error = OSError(f"connection closed after {offset - start} of {end - start} bytes")
+            continue
+        if expected_sha256 and hasher.hexdigest() != expected_sha256:
+            error = OSError("checksum mismatch")
+            continue
+        return end - start
+    raise OSError(f"chunk {index} failed: {error}")
+
+
+def ranged_download(url, dest, connections=DOWNLOAD_CONNECTIONS):
+    """Download url to dest over several concurrent Range requests.
+
+    Data goes to a preallocated dest.part file and a bitmap of completed
+    chunks is kept in dest.part.json, so an interrupted download picks up
+    where it stopped. Chunks are checked against <url>.chunksums when the
+    server publishes one. Servers without Range support fall back to a
+    single stream. Returns the SHA256 of the file if it is known already.
+    """
+    part_path = dest + ".part"
+    state_path = part_path + ".json"
+    size, etag, last_modified = _probe_ranges(url)
+    if size is None:
+        print("Server does not support ranged downloads, using a single connection.")
+        digest = stream_download(url, part_path)
+        os.replace(part_path, dest)
+        _save_download_info(dest, url, etag, last_modified)
+        return digest
+    validator = etag or last_modified or ""
+
+    manifest = fetch_chunk_manifest(url)
+    chunk_size = manifest["chunk_size"] if manifest else DOWNLOAD_CHUNK_SIZE
+    chunks = max((size + chunk_size - 1) // chunk_size, 1)
+    digests = manifest["sha256"] if manifest else None
+    if digests is not None and len(digests) != chunks:
+        print("Warning: Chunk manifest does not match the image, chunks will not be verified.")
+        digests = None
+
+    done = None
+    # Without a validator there is no telling whether the partial file
+    # is still the same image, so it is started over.
+    if os.path.exists(part_path) and validator:
+        done = _load_download_state(state_path, url, size, validator, chunk_size)
+    if done is None or len(done) != (chunks + 7) // 8:
+        done = bytearray((chunks + 7) // 8)
+    pending = [i for i in range(chunks) if not done[i // 8] & (1 << (i % 8))]
+    remaining = sum(min(chunk_size, size - i * chunk_size) for i in pending)
+    if len(pending) < chunks:
+        print(f"Resuming download, {remaining / (1024*1024):.1f} MB left...")
+
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if len(pending) == chunks:
+            if shutil.disk_usage(os.path.dirname(os.path.abspath(dest))).free < size:
+                raise OSError(f"not enough free space for {size / (1024*1024):.0f} MB")
+            os.ftruncate(fd, 0)
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError:
+                os.ftruncate(fd, size)
+            _save_download_state(state_path, url, size, validator, chunk_size, done)
+
+        started = time.monotonic()
+        fetched = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(connections, 1)) as executor:
+            futures = {
+                executor.submit(
+                    _fetch_range, url, fd, i, chunk_size, size, digests[i] if digests else None
+                ): i
+                for i in pending
+            }
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    index = futures[future]
+                    fetched += future.result()
+                    done[index // 8] |= 1 << (index % 8)
+                    _save_download_state(state_path, url, size, validator, chunk_size, done)
+                    _print_progress(fetched, remaining, started)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        print()
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    os.replace(part_path, dest)
+    os.remove(state_path)
+    _save_download_info(dest, url, etag, last_modified)
+    return None
+
+
+def download_or_exit(url, connections=DOWNLOAD_CONNECTIONS, expected_sha256=None):
+    """Fetch url into DOWNLOAD_DIR, resuming an earlier attempt, and return its path."""
+    cached = cache_lookup(sha256=expected_sha256) if expected_sha256 else None
+    if cached:
+        print(f"Using cached image {cached}.")
+        return cached
+    dest = download_path(url)
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    if os.path.exists(dest) and _download_is_current(dest, url):
+        print(f"Using already downloaded {dest}.")
+        digest = None
+    else:
+        remove_download(dest)
+        print(f"Downloading {url} over {connections} connection(s)...")
+        try:
+            digest = ranged_download(url, dest, connections)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            print(f"\nError: Download failed: {e}", file=sys.stderr)
+            print("Run the command again to resume the download.", file=sys.stderr)
+            sys.exit(1)
+    if expected_sha256:
+        digest = digest or file_sha256(dest)
+        if digest != expected_sha256:
+            remove_download(dest)
+            print(f"Error: Checksum mismatch (expected {expected_sha256}, got {digest}).", file=sys.stderr)
+            sys.exit(1)
+        print(f"SHA256: {digest} (verified)")
+    return dest
@@ -13,6 +13,7 @@ def handle_dual_boot(args):
     if not os.path.exists(system_sfs):
         print(f"Error: System image '{system_sfs}' not found.", file=sys.stderr)
         sys.exit(1)
+    image_format = image_format_or_exit(system_sfs)
 
     print(
         f"WARNING: This will install ObsidianOS on {device} alongside your existing OS."
@@ -23,6 +24,9 @@ def handle_dual_boot(args):
         print("Installation aborted.")
         sys.exit(0)
 
+    jobs = args.jobs
+    timings = []
+    partition_start = time.monotonic()
     print("Partitioning device...")
     partition_table = f"""
 label: gpt
@@ -39,16 +43,8 @@ label: gpt
     print("Waiting for device partitions to settle...")
     run_command("udevadm settle")
 
-    part_num = (
-        int(
-            run_command(
-                f"bash -c \"lsblk -l -n -o MAJ:MIN,NAME | grep '{os.path.basename(device)}' | wc -l\"",
-                capture_output=True,
-                text=True,
-            ).stdout.strip()
-        )
-        - 1
-    )
+    invalidate_topology()
+    part_num = len(disk_partitions(device))
 
     part1, part2, part3, part4, part5, part6, part7 = (
         _get_part_path(device, part_num - 6),
@@ -60,25 +56,48 @@ label: gpt
         _get_part_path(device, part_num),
     )
 
+    timings.append({"name": "Partitioning", "seconds": time.monotonic() - partition_start, "group": None})
+
     print("Formatting partitions...")
     format_commands = [
-        f"mkfs.fat -F32 -n ESP_A {part1}",
-        f"mkfs.fat -F32 -n ESP_B {part2}",
-        f"mkfs.{fstype} -F -L root_a {part3}",
-        f"mkfs.{fstype} -F -L root_b {part4}",
-        f"mkfs.{fstype} -F -L etc_ab {part5}",
-        f"mkfs.{fstype} -F -L var_ab {part6}",
-        f"mkfs.{fstype} -F -L home_ab {part7}",
+        ("ESP_A", f"mkfs.fat -F32 -n ESP_A {part1}"),
+        ("ESP_B", f"mkfs.fat -F32 -n ESP_B {part2}"),
+        ("root_a", f"mkfs.{fstype} -F -L root_a {part3}"),
+        ("root_b", f"mkfs.{fstype} -F -L root_b {part4}"),
+        ("etc_ab", f"mkfs.{fstype} -F -L etc_ab {part5}"),
+        ("var_ab", f"mkfs.{fstype} -F -L var_ab {part6}"),
+        ("home_ab", f"mkfs.{fstype} -F -L home_ab {part7}"),
     ]
-    for cmd in format_commands:
-        run_command(cmd)
+    run_concurrent_phases(
+        timings, "Formatting", [(f"mkfs {label}", run_command, (cmd,)) for label, cmd in format_commands], jobs
+    )
+    run_command("udevadm settle")
+    invalidate_topology()
 
     mount_dir = "/mnt/obsidian_install"
-    run_command(f"mkdir -p {mount_dir}")
+    image_mount_dir = "/mnt/obsidian_install_image"
+    run_command(f"mkdir -p {mount_dir} {image_mount_dir}")
     print("Mounting root partition for slot 'a'...")
     run_command(f"mount /dev/disk/by-label/root_a {mount_dir}")
-    print(f"Extracting system from {system_sfs} to slot 'a'...")
-    run_command(f"unsquashfs -f -d {mount_dir} -no-xattrs {system_sfs}")
+    run_command(f"mount -o loop,ro {system_sfs} {image_mount_dir}")
+    try:
+        print(f"Extracting system from {system_sfs} to slot 'a'...")
+        print("Populating shared /var and /home partitions and both ESPs...")
+        run_concurrent_phases(
+            timings,
+            "Populating partitions",
+            [
+                ("root_a", extract_image, (system_sfs, mount_dir, image_format)),
+                ("var_ab", _sync_tree_to_partition, ("/dev/disk/by-label/var_ab", f"{image_mount_dir}/var", "/mnt/tmp_var")),
+                ("home_ab", _sync_tree_to_partition, ("/dev/disk/by-label/home_ab", f"{image_mount_dir}/home", "/mnt/tmp_home")),
+                ("ESP_A", _sync_tree_to_partition, ("/dev/disk/by-label/ESP_A", f"{image_mount_dir}/boot", "/mnt/obsidian_esp_tmp")),
+                ("ESP_B", _sync_tree_to_partition, ("/dev/disk/by-label/ESP_B", f"{image_mount_dir}/boot", "/mnt/obsidian_esp_b_tmp")),
+            ],
+            jobs,
+        )
+    finally:
+        run_command(f"umount {image_mount_dir}", check=False)
+        run_command(f"rmdir {image_mount_dir}", check=False)
     print("Generating fstab for slot 'a'...")
     fstab_content_a = f"""
 LABEL=root_a  /      {fstype}  defaults,noatime 0 1
@@ -90,37 +109,11 @@ LABEL=home_ab /home  {fstype}  defaults,noatime 0 2
     with open(f"{mount_dir}/etc/fstab", "w") as f:
         f.write(fstab_content_a.strip())
 
-    print("Populating shared /etc, /var, and /home partitions...")
-    for part_label in ["etc_ab", "var_ab", "home_ab"]:
-        fs_dir = part_label.split("_")[0]
-        tmp_mount_dir = f"/mnt/tmp_{fs_dir}"
-        run_command(f"mkdir -p {tmp_mount_dir}")
-        try:
-            run_command(f"mount /dev/disk/by-label/{part_label} {tmp_mount_dir}")
-            run_command(f"rsync -aK --delete {mount_dir}/{fs_dir}/ {tmp_mount_dir}/")
-        finally:
-            run_command(f"umount {tmp_mount_dir}", check=False)
-            run_command(f"rmdir {tmp_mount_dir}", check=False)
-
-    print("Populating ESP with boot files from system image...")
-    esp_tmp_mount = "/mnt/obsidian_esp_tmp"
-    run_command(f"mkdir -p {esp_tmp_mount}")
-    try:
-        run_command(f"mount /dev/disk/by-label/ESP_A {esp_tmp_mount}")
-        run_command(f"rsync -aK --delete {mount_dir}/boot/ {esp_tmp_mount}/")
-    finally:
-        run_command(f"umount {esp_tmp_mount}", check=False)
-        run_command(f"rmdir {esp_tmp_mount}", check=False)
-
-    print("Populating ESP_B with boot files from system image...")
-    esp_b_tmp_mount = "/mnt/obsidian_esp_b_tmp"
-    run_command(f"mkdir -p {esp_b_tmp_mount}")
-    try:
-        run_command(f"mount /dev/disk/by-label/ESP_B {esp_b_tmp_mount}")
-        run_command(f"rsync -aK --delete {mount_dir}/boot/ {esp_b_tmp_mount}/")
-    finally:
-        run_command(f"umount {esp_b_tmp_mount}", check=False)
-        run_command(f"rmdir {esp_b_tmp_mount}", check=False)
+    # /etc is copied from the slot, as it carries its fstab.
+    print("Populating shared /etc partition...")
+    run_phase(
+        timings, "Populating /etc", _sync_tree_to_partition, "/dev/disk/by-label/etc_ab", f"{mount_dir}/etc", "/mnt/tmp_etc"
+    )
 
     print("Mounting shared partitions for potential chroot...")
     mount_commands = [
@@ -186,19 +179,7 @@ LABEL=home_ab /home  {fstype}  defaults,noatime 0 2
     print("Unmounting slot 'a' partitions before copy...")
     run_command(f"umount -R {mount_dir}")
     print("Copying system to slot 'b'...")
-    source_mount_point = "/mnt/obsidian_source_a"
-    target_mount_point = "/mnt/obsidian_target_b"
-    run_command(f"mkdir -p {source_mount_point} {target_mount_point}")
-    try:
-        run_command(f"mount {part3} {source_mount_point}")
-        run_command(f"mount {part4} {target_mount_point}")
-        run_command(f"rsync -aHAX --inplace --delete --info=progress2 {source_mount_point}/ {target_mount_point}/")
-    finally:
-        run_command(f"umount {source_mount_point}", check=False)
-        run_command(f"umount {target_mount_point}", check=False)
-        run_command(f"rm -r {source_mount_point} {target_mount_point}", check=False)
-
-    run_command(f"e2label {part4} root_b")
+    run_phase(timings, "Cloning slot a to slot b", clone_slot_filesystem, part3, part4, fstype, "root_b")
     print("Correcting fstab for slot 'b'...")
     mount_b_dir = "/mnt/obsidian_install_b"
     run_command(f"mkdir -p {mount_b_dir}")
@@ -216,6 +197,7 @@ LABEL=home_ab /home  {fstype}  defaults,noatime 0 2
         run_command(f"umount {mount_b_dir}", check=False)
         run_command(f"rm -r {mount_b_dir}", check=False)
 
+    bootloader_start = time.monotonic()
     if not args.use_systemdboot:
         mount_dir="/mnt/obsidianos-install-grub"
         print("Installing GRUB to ESP_A...")
@@ -394,3 +376,5 @@ options root=PARTUUID={root_b_partuuid} rw
         print("\nInstallation complete!")
         print("Default boot order will attempt Slot A, then Slot B.")
         print("Reboot your system to apply changes.")
+    timings.append({"name": "Installing bootloader", "seconds": time.monotonic() - bootloader_start, "group": None})
+    print_phase_report(timings)
@@ -0,0 +1,160 @@
+import os
+import re
+import sys
+import fcntl
+import struct
+
+# Boot state straight from efivarfs, instead of asking bootctl and
+# efibootmgr. Each variable file starts with its 4 byte attribute mask.
+EFIVARS_DIR = "/sys/firmware/efi/efivars"
+LOADER_GUID = "4a67b082-0a4c-41cf-b6c7-440b29bb8c4f"
+EFI_GLOBAL_GUID = "8be4df61-93ca-11d2-aa0d-00e098032b8c"
+# NON_VOLATILE | BOOTSERVICE_ACCESS | RUNTIME_ACCESS, as bootctl writes them.
+LOADER_VARIABLE_ATTRIBUTES = 0x7
+# efivarfs marks most variables immutable so they are not removed by accident.
+FS_IOC_GETFLAGS = 0x80086601
+FS_IOC_SETFLAGS = 0x40086602
+FS_IMMUTABLE_FL = 0x10
+
+_boot_environment = None
+
+
+def read_efivar(name, guid=LOADER_GUID):
+    """Return the data of an EFI variable without its attributes, or None."""
+    try:
+        with open(os.path.join(EFIVARS_DIR, f"{name}-{guid}"), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    return data[4:] if len(data) >= 4 else None
+
+
+def _set_immutable(fd, immutable):
+    """Set or clear the immutable flag and return whether it was set before."""
+    buf = bytearray(8)
+    try:
+        fcntl.ioctl(fd, FS_IOC_GETFLAGS, buf)
+    except OSError:
+        return False
+    flags = struct.unpack_from("i", buf)[0]
+    was_immutable = bool(flags & FS_IMMUTABLE_FL)
+    if was_immutable != immutable:
+        flags = flags | FS_IMMUTABLE_FL if immutable else flags & ~FS_IMMUTABLE_FL
+        struct.pack_into("i", buf, 0, flags)
+        fcntl.ioctl(fd, FS_IOC_SETFLAGS, buf)
+    return was_immutable
+
+
+def write_efivar(name, data, guid=LOADER_GUID, attributes=LOADER_VARIABLE_ATTRIBUTES):
+    """Create or replace an EFI variable. Raises OSError on failure."""
+    path = os.path.join(EFIVARS_DIR, f"{name}-{guid}")
+    was_immutable = False
+    if os.path.exists(path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            was_immutable = _set_immutable(fd, False)
+        finally:
+            os.close(fd)
+    try:
+        # efivarfs takes the attributes and data in a single write.
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            payload = struct.pack("<I", attributes) + data
+            if os.write(fd, payload) != len(payload):
+                raise OSError(f"short write to {path}")
+        finally:
+            os.close(fd)
+    finally:
+        if was_immutable:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                _set_immutable(fd, True)
+            finally:
+                os.close(fd)
+
+
+def set_loader_entry(variable, entry):
+    """Point LoaderEntryDefault or LoaderEntryOneShot at entry.
+
+    Returns False if the variable could not be written, so the caller can
+    fall back to bootctl.
+    """
+    try:
+        write_efivar(variable, (entry + "\0").encode("utf-16-le"))
+    except OSError as e:
+        print(f"Warning: Could not write {variable} to {EFIVARS_DIR}: {e}", file=sys.stderr)
+        return False
+    finally:
+        invalidate_boot_environment()
+    return _efi_string(read_efivar(variable)) == entry
+
+
+def _efi_string(data):
+    if not data:
+        return None
+    text = data.decode("utf-16-le", errors="replace")
+    return text.split("\0", 1)[0] or None
+
+
+def _boot_option(number):
+    """Return (description, raw data) of the Boot#### variable for a hex number."""
+    data = read_efivar(f"Boot{number}", EFI_GLOBAL_GUID)
+    if data is None or len(data) < 6:
+        return None, None
+    # UINT32 attributes, UINT16 device path length, then the description.
+    return _efi_string(data[6:]), data
+
+
+def _mentions_grub(data):
+    return b"g\0r\0u\0b\0" in data.lower() if data else False
+
+
+def _scan_boot_environment():
+    env = {
+        "loader": None,
+        "loader_info": _efi_string(read_efivar("LoaderInfo")),
+        "current_entry": _efi_string(read_efivar("LoaderEntrySelected")),
+        "default_entry": _efi_string(read_efivar("LoaderEntryDefault")),
+        "oneshot_entry": _efi_string(read_efivar("LoaderEntryOneShot")),
+        "boot_current": None,
+        "boot_current_description": None,
+        "grub": os.path.exists(f"{EFI_DIR}/grub/grub.cfg"),
+    }
+    boot_current = read_efivar("BootCurrent", EFI_GLOBAL_GUID)
+    if boot_current and len(boot_current) >= 2:
+        env["boot_current"] = f"{int.from_bytes(boot_current[:2], 'little'):04X}"
+        description, data = _boot_option(env["boot_current"])
+        env["boot_current_description"] = description
+        env["grub"] = env["grub"] or _mentions_grub(data)
+    if not env["grub"]:
+        try:
+            names = os.listdir(EFIVARS_DIR)
+        except OSError:
+            names = []
+        for name in names:
+            match = re.fullmatch(rf"Boot([0-9A-F]{{4}})-{EFI_GLOBAL_GUID}", name)
+            if match and _mentions_grub(_boot_option(match.group(1))[1]):
+                env["grub"] = True
+                break
+    if env["loader_info"]:
+        env["loader"] = "systemd-boot"
+    elif env["grub"]:
+        env["loader"] = "grub"
+    return env
+
+
+def boot_environment():
+    """Return the active loader and its current, default and one-shot entries.
+
+    Read once per process; call invalidate_boot_environment() after
+    changing loader variables.
+    """
+    global _boot_environment
+    if _boot_environment is None:
+        _boot_environment = _scan_boot_environment()
+    return _boot_environment
+
+
+def invalidate_boot_environment():
+    global _boot_environment
+    _boot_environment = None
@@ -21,11 +21,14 @@ def handle_enter(args):
         print(f"ESP for slot {slot} ({esp_partition}) not found.", file=sys.stderr)
         sys.exit(1)
 
-    if not os.path.exists(mount_point):
-        os.makedirs(mount_point)
+    if slot == get_current_slot() and (mount_info("/") or {}).get("fstype") == "overlay":
+        # A second writable overlay on the upper directory the running
+        # system writes to would corrupt it.
+        print(f"Slot {slot} is the running image-mode slot; it cannot be entered.", file=sys.stderr)
+        sys.exit(1)
 
     try:
-        subprocess.run(["mount", root_partition, mount_point], check=True)
+        mount_slot_root(root_partition, mount_point, root_label)
         subprocess.run(["mount", esp_partition, f"{mount_point}{EFI_DIR}", "--mkdir"], check=True)
 
         for shared_part in ["etc_ab", "var_ab", "home_ab"]:
@@ -86,3 +89,5 @@ def handle_enter(args):
         
         if os.path.ismount(mount_point):
             print(f"Could not unmount {mount_point}. Please unmount it manually.", file=sys.stderr)
+        else:
+            umount_slot_root(mount_point)
@@ -1,113 +1,287 @@
 import os
 import sys
+import time
+import json
+import shutil
+import struct
 import subprocess
+import concurrent.futures
+
+HEALTH_SHARED_PARTITIONS = ["etc_ab", "var_ab", "home_ab"]
+# Shared partitions fuller than this (in percent) are reported as a warning.
+HEALTH_USAGE_WARNING = 90
+# fsck results are kept here with the superblock state they were taken
+# at, and reused while the superblock shows the filesystem unchanged.
+HEALTH_CACHE_FILE = "/var/lib/obsidianctl/health.json"
+EXT_SUPERBLOCK_OFFSET = 1024
+EXT_SUPER_MAGIC = 0xEF53
+HEALTH_FSCK_COMMANDS = {
+    "ext2": "e2fsck -n",
+    "ext3": "e2fsck -n",
+    "ext4": "e2fsck -n",
+    "f2fs": "fsck.f2fs --dry-run",
+    "vfat": "fsck.fat -n",
+}
+
 
 def handle_health_check(args):
-    """Check the health of both A/B slots"""
-    print("🔍 Performing system health check...")
-    print("=" * 50)
-    
+    """Check the health of both A/B slots and the shared partitions"""
     # Check if we're running from an obsidianctl-managed system
     if not os.path.exists("/dev/disk/by-label/root_a") or not os.path.exists("/dev/disk/by-label/root_b"):
         print("❌ Error: This system was not installed with obsidianctl")
         print("   Health check requires A/B slot configuration")
         sys.exit(1)
-    
-    current_slot = get_current_slot()
-    print(f"📍 Current active slot: {current_slot.upper()}")
-    
-    # Check both slots
-    slots_status = {}
-    for slot in ["a", "b"]:
-        print(f"\n🔧 Checking slot {slot.upper()}...")
-        status = check_slot_health(slot)
-        slots_status[slot] = status
+
+    report = collect_health_report(args.force)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return report
+
+    print("🔍 Performing system health check...")
+    print("=" * 50)
+    print(f"📍 Current active slot: {report['current_slot'].upper()}")
+    for slot, status in report["slots"].items():
+        print(f"\n🔧 Slot {slot.upper()}:")
         print_slot_status(slot, status)
-    
+    for label, status in report["shared"].items():
+        print(f"\n🗂️  Shared partition {label}:")
+        print_partition_status(status)
+
     # Overall health assessment
     print("\n" + "=" * 50)
     print("📊 OVERALL HEALTH ASSESSMENT")
     print("=" * 50)
-    
+
+    slots_status = report["slots"]
     healthy_slots = sum(1 for status in slots_status.values() if status["overall"] == "healthy")
     total_slots = len(slots_status)
-    
-    if healthy_slots == total_slots:
-        print("✅ All slots are healthy!")
+    unhealthy_shared = [label for label, status in report["shared"].items() if status["overall"] != "healthy"]
+
+    if healthy_slots == total_slots and not unhealthy_shared:
+        print("✅ All slots and shared partitions are healthy!")
         print("🎯 System is in optimal condition")
     elif healthy_slots > 0:
         print(f"⚠️  {healthy_slots}/{total_slots} slots are healthy")
+        if unhealthy_shared:
+            print(f"⚠️  Shared partitions needing attention: {', '.join(unhealthy_shared)}")
         print("🔧 Some maintenance may be needed")
     else:
         print("❌ No healthy slots detected!")
         print("🚨 System requires immediate attention")
-    
+    print(f"⏱️  Checked in {report['seconds']:.1f} s")
+
     return slots_status
 
+
+def collect_health_report(force=False):
+    """Check every partition at once and return one report.
+
+    Each root, ESP and shared partition is a separate job with its own
+    mount, so the whole check takes about as long as the slowest one.
+    """
+    started = time.monotonic()
+    cache = load_health_cache()
+    checks = {}
+    for slot in ["a", "b"]:
+        checks[("root", slot)] = (_check_root, (slot, cache, force))
+        checks[("esp", slot)] = (_check_esp, (slot,))
+    for label in HEALTH_SHARED_PARTITIONS:
+        checks[("shared", label)] = (_check_shared_partition, (label, cache, force))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(checks)) as executor:
+        futures = {key: executor.submit(func, *args) for key, (func, args) in checks.items()}
+        results = {key: future.result() for key, future in futures.items()}
+    save_health_cache(cache)
+
+    report = {"current_slot": get_current_slot(), "slots": {}, "shared": {}}
+    for slot in ["a", "b"]:
+        report["slots"][slot] = _combine_slot_status(results[("root", slot)], results[("esp", slot)])
+    for label in HEALTH_SHARED_PARTITIONS:
+        report["shared"][label] = results[("shared", label)]
+    report["seconds"] = time.monotonic() - started
+    return report
+
+
 def check_slot_health(slot):
     """Check the health of a specific slot"""
+    return _combine_slot_status(_check_root(slot), _check_esp(slot))
+
+
+def _overall(errors):
+    if not errors:
+        return "healthy"
+    return "critical" if len(errors) > 2 else "warning"
+
+
+def _combine_slot_status(root, esp):
     status = {
         "overall": "unknown",
-        "bootable": False,
+        "bootable": esp["bootable"],
+        "filesystem": root["filesystem"],
+        "filesystem_cached": root["filesystem_cached"],
+        "kernel": root["kernel"],
+        "packages": root["packages"],
+        "errors": root["errors"] + esp["errors"],
+        "seconds": max(root["seconds"], esp["seconds"]),
+    }
+    status["overall"] = "critical" if root["missing"] else _overall(status["errors"])
+    return status
+
+
+def _partition_fstype(part_path):
+    mountpoints = device_mountpoints(part_path)
+    if mountpoints:
+        return mount_info(mountpoints[0])["fstype"]
+    return subprocess.run(
+        ["blkid", "-s", "TYPE", "-o", "value", part_path], capture_output=True, text=True
+    ).stdout.strip()
+
+
+def load_health_cache():
+    try:
+        with open(HEALTH_CACHE_FILE, "r") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_health_cache(cache):
+    try:
+        os.makedirs(os.path.dirname(HEALTH_CACHE_FILE), exist_ok=True)
+        with open(HEALTH_CACHE_FILE + ".tmp", "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(HEALTH_CACHE_FILE + ".tmp", HEALTH_CACHE_FILE)
+    except OSError as e:
+        print(f"Warning: Could not save health results to {HEALTH_CACHE_FILE}: {e}", file=sys.stderr)
+
+
+def read_ext_superblock_state(part_path):
+    """Return the ext2/3/4 superblock fields that change whenever the filesystem does.
+
+    Returns None if part_path does not hold an ext filesystem.
+    """
+    try:
+        with open(part_path, "rb") as f:
+            f.seek(EXT_SUPERBLOCK_OFFSET)
+            sb = f.read(1024)
+    except OSError:
+        return None
+    if len(sb) < 1024 or struct.unpack_from("<H", sb, 0x38)[0] != EXT_SUPER_MAGIC:
+        return None
+    return {
+        "uuid": sb[0x68:0x78].hex(),
+        "mount_time": struct.unpack_from("<I", sb, 0x2C)[0],
+        "write_time": struct.unpack_from("<I", sb, 0x30)[0],
+        "mount_count": struct.unpack_from("<H", sb, 0x34)[0],
+        "state": struct.unpack_from("<H", sb, 0x3A)[0],
+        "last_check": struct.unpack_from("<I", sb, 0x40)[0],
+        "kbytes_written": struct.unpack_from("<Q", sb, 0x178)[0],
+        "error_count": struct.unpack_from("<I", sb, 0x194)[0],
+    }
+
+
+def _mounted_rw(part_path):
+    return any("rw" in mount_info(m)["options"] for m in device_mountpoints(part_path))
+
+
+def check_filesystem(part_path, cache=None, force=False):
+    """Run a read-only fsck for the filesystem on part_path.
+
+    Returns (state, error, cached) where state is healthy, needs_repair or
+    unknown. With a cache, the result of an earlier check is reused while
+    the ext superblock proves the filesystem unchanged since then. That
+    proof does not hold for a filesystem mounted read-write, whose
+    superblock lags behind its writes, so those are always checked.
+    """
+    fstype = _partition_fstype(part_path)
+    command = HEALTH_FSCK_COMMANDS.get(fstype)
+    if command is None:
+        return "unknown", f"No filesystem check for '{fstype or 'unknown'}'", False
+    superblock = None
+    if cache is not None and fstype.startswith("ext") and not _mounted_rw(part_path):
+        superblock = read_ext_superblock_state(part_path)
+    if superblock and not force:
+        entry = cache.get(superblock["uuid"])
+        if entry and entry.get("superblock") == superblock:
+            return entry["filesystem"], entry["error"], True
+    if not shutil.which(command.split()[0]):
+        return "unknown", f"Filesystem check failed: {command.split()[0]} not found", False
+    result = run_command(f"{command} {part_path}", capture_output=True, check=False)
+    if result.returncode == 0:
+        state, error = "healthy", None
+    else:
+        state, error = "needs_repair", f"Filesystem has errors (exit code {result.returncode})"
+    if superblock:
+        cache[superblock["uuid"]] = {
+            "superblock": superblock,
+            "filesystem": state,
+            "error": error,
+            "checked": time.time(),
+        }
+    return state, error, False
+
+
+def _with_partition(part_path, mount_dir, func):
+    """Call func(mountpoint) with part_path mounted, reusing an existing mount."""
+    mountpoints = device_mountpoints(part_path)
+    if mountpoints:
+        return func(min(mountpoints, key=len))
+    run_command(f"mkdir -p {mount_dir}")
+    try:
+        result = run_command(f"mount -o ro {part_path} {mount_dir}", capture_output=True, check=False)
+        if result.returncode != 0:
+            raise OSError(result.stderr.strip() or f"could not mount {part_path}")
+        return func(mount_dir)
+    finally:
+        run_command(f"umount {mount_dir}", check=False, capture_output=True)
+        run_command(f"rmdir {mount_dir}", check=False)
+
+
+def _with_slot_root(slot, part_path, mount_dir, func):
+    """Call func(root) with the slot's root filesystem mounted read-only.
+
+    Image-mode slots are assembled from their image and overlay, and the
+    running slot is read in place.
+    """
+    if slot == get_current_slot():
+        return func("/")
+    try:
+        mount_slot_root(part_path, mount_dir, f"root_{slot}", read_only=True)
+        return func(mount_dir)
+    except SystemExit as e:
+        # Checks run in worker threads, where a failed mount must not end
+        # the whole health check.
+        raise OSError(f"could not mount {part_path}") from e
+    finally:
+        umount_slot_root(mount_dir)
+        run_command(f"rmdir {mount_dir}", check=False)
+
+
+def _check_root(slot, cache=None, force=False):
+    started = time.monotonic()
+    status = {
+        "missing": False,
         "filesystem": "unknown",
+        "filesystem_cached": False,
         "kernel": "unknown",
         "packages": "unknown",
-        "errors": []
+        "errors": [],
     }
-    
     part_path = f"/dev/disk/by-label/root_{slot}"
-    
+
     # Check if partition exists
     if not os.path.exists(part_path):
+        status["missing"] = True
         status["errors"].append("Partition not found")
-        status["overall"] = "critical"
+        status["seconds"] = time.monotonic() - started
         return status
-    
+
     # Check filesystem integrity
-    try:
-        result = run_command(f"e2fsck -n {part_path}", capture_output=True, check=False)
-        if result.returncode == 0:
-            status["filesystem"] = "healthy"
-        else:
-            status["filesystem"] = "needs_repair"
-            status["errors"].append("Filesystem has errors")
-    except Exception as e:
-        status["filesystem"] = "unknown"
-        status["errors"].append(f"Filesystem check failed: {e}")
-    
-    # Check if slot is bootable
-    esp_path = f"/dev/disk/by-label/ESP_{slot.upper()}"
-    if os.path.exists(esp_path):
-        # Check for bootloader files
-        mount_dir = f"/mnt/health_check_esp_{slot}"
-        try:
-            run_command(f"mkdir -p {mount_dir}")
-            run_command(f"mount {esp_path} {mount_dir}")
-            
-            boot_files = ["loader/loader.conf", "loader/entries/obsidian-a.conf", "loader/entries/obsidian-b.conf"]
-            missing_files = []
-            
-            for boot_file in boot_files:
-                if not os.path.exists(os.path.join(mount_dir, boot_file)):
-                    missing_files.append(boot_file)
-            
-            if not missing_files:
-                status["bootable"] = True
-            else:
-                status["errors"].append(f"Missing boot files: {', '.join(missing_files)}")
-                
-        finally:
-            run_command(f"umount {mount_dir}", check=False)
-            run_command(f"rmdir {mount_dir}", check=False)
-    else:
-        status["errors"].append("ESP partition not found")
-    
-    # Check kernel and packages
-    mount_dir = f"/mnt/health_check_{slot}"
-    try:
-        run_command(f"mkdir -p {mount_dir}")
-        run_command(f"mount {part_path} {mount_dir}")
-        
+    status["filesystem"], error, status["filesystem_cached"] = check_filesystem(part_path, cache, force)
+    if error:
+        status["errors"].append(error)
+
+    def inspect(mount_dir):
         # Check kernel
         boot_dir = os.path.join(mount_dir, "boot")
         if os.path.exists(boot_dir):
@@ -118,32 +292,79 @@ def check_slot_health(slot):
                 status["errors"].append("No kernel found")
         else:
             status["errors"].append("Boot directory not found")
-        
+
         # Check packages
-        pacman_dir = os.path.join(mount_dir, "var/lib/pacman/local")
-        if os.path.exists(pacman_dir):
-            package_count = len([d for d in os.listdir(pacman_dir) if os.path.isdir(os.path.join(pacman_dir, d))])
-            status["packages"] = f"{package_count} packages"
-        else:
-            status["packages"] = "unknown"
-            
+        packages = slot_packages(mount_dir, slot)
+        if packages:
+            status["packages"] = f"{len(packages)} packages"
+
+    # Check kernel and packages
+    try:
+        _with_slot_root(slot, part_path, f"/mnt/health_check_{slot}", inspect)
     except Exception as e:
         status["errors"].append(f"Mount check failed: {e}")
-    finally:
-        run_command(f"umount {mount_dir}", check=False)
-        run_command(f"rmdir {mount_dir}", check=False)
-    
-    # Determine overall health
-    if status["errors"]:
-        if len(status["errors"]) > 2:
-            status["overall"] = "critical"
+    status["seconds"] = time.monotonic() - started
+    return status
+
+
+def _check_esp(slot):
+    started = time.monotonic()
+    status = {"bootable": False, "errors": []}
+    esp_path = f"/dev/disk/by-label/ESP_{slot.upper()}"
+
+    def inspect(mount_dir):
+        # Check for bootloader files
+        boot_files = ["loader/loader.conf", "loader/entries/obsidian-a.conf", "loader/entries/obsidian-b.conf"]
+        missing_files = [f for f in boot_files if not os.path.exists(os.path.join(mount_dir, f))]
+        if not missing_files:
+            status["bootable"] = True
         else:
-            status["overall"] = "warning"
+            status["errors"].append(f"Missing boot files: {', '.join(missing_files)}")
+
+    # Check if slot is bootable
+    if os.path.exists(esp_path):
+        try:
+            _with_partition(esp_path, f"/mnt/health_check_esp_{slot}", inspect)
+        except Exception as e:
+            status["errors"].append(f"ESP check failed: {e}")
     else:
-        status["overall"] = "healthy"
-    
+        status["errors"].append("ESP partition not found")
+    status["seconds"] = time.monotonic() - started
     return status
 
+
+def _check_shared_partition(label, cache=None, force=False):
+    started = time.monotonic()
+    status = {"overall": "unknown", "filesystem": "unknown", "filesystem_cached": False, "usage": None, "errors": []}
+    part_path = f"/dev/disk/by-label/{label}"
+    if not os.path.exists(part_path):
+        status["overall"] = "critical"
+        status["errors"].append("Partition not found")
+        status["seconds"] = time.monotonic() - started
+        return status
+
+    status["filesystem"], error, status["filesystem_cached"] = check_filesystem(part_path, cache, force)
+    if error:
+        status["errors"].append(error)
+
+    def inspect(mount_dir):
+        st = os.statvfs(mount_dir)
+        if st.f_blocks:
+            status["usage"] = round(100 * (st.f_blocks - st.f_bfree) / st.f_blocks, 1)
+            if status["usage"] > HEALTH_USAGE_WARNING:
+                status["errors"].append(f"{status['usage']}% full")
+        if label == "etc_ab" and not os.path.exists(os.path.join(mount_dir, "fstab")):
+            status["errors"].append("fstab not found")
+
+    try:
+        _with_partition(part_path, f"/mnt/health_check_{label}", inspect)
+    except Exception as e:
+        status["errors"].append(f"Mount check failed: {e}")
+    status["overall"] = _overall(status["errors"])
+    status["seconds"] = time.monotonic() - started
+    return status
+
+
 def print_slot_status(slot, status):
     """Print the status of a slot in a user-friendly format"""
     health_icons = {
@@ -155,7 +376,8 @@ def print_slot_status(slot, status):
     
     print(f"   {health_icons[status['overall']]} Overall: {status['overall'].upper()}")
     print(f"   🚀 Bootable: {'Yes' if status['bootable'] else 'No'}")
-    print(f"   💾 Filesystem: {status['filesystem']}")
+    cached = " (unchanged since last check)" if status.get("filesystem_cached") else ""
+    print(f"   💾 Filesystem: {status['filesystem']}{cached}")
     print(f"   🐧 Kernel: {status['kernel']}")
     print(f"   📦 Packages: {status['packages']}")
     
@@ -164,6 +386,20 @@ def print_slot_status(slot, status):
         for error in status["errors"]:
             print(f"      • {error}")
 
+
+def print_partition_status(status):
+    """Print the status of a shared partition"""
+    health_icons = {"healthy": "✅", "warning": "⚠️", "critical": "❌", "unknown": "❓"}
+    print(f"   {health_icons[status['overall']]} Overall: {status['overall'].upper()}")
+    cached = " (unchanged since last check)" if status.get("filesystem_cached") else ""
+    print(f"   💾 Filesystem: {status['filesystem']}{cached}")
+    if status["usage"] is not None:
+        print(f"   📈 Usage: {status['usage']}%")
+    if status["errors"]:
+        print(f"   ⚠️  Issues:")
+        for error in status["errors"]:
+            print(f"      • {error}")
+
 def handle_verify_integrity(args):
     """Verify the integrity of a specific slot"""
     slot = args.slot
@@ -175,30 +411,29 @@ def handle_verify_integrity(args):
         sys.exit(1)
     
     print("📋 Running filesystem integrity check...")
-    try:
-        # Run read-only filesystem check
-        result = run_command(f"e2fsck -n {part_path}", capture_output=True, check=False)
-        
-        if result.returncode == 0:
-            print("✅ Filesystem integrity check passed")
+    cache = load_health_cache()
+    state, error, cached = check_filesystem(part_path, cache, args.force)
+    save_health_cache(cache)
+    if state == "healthy":
+        if cached:
+            print("✅ Filesystem integrity check passed (unchanged since last check)")
         else:
-            print("❌ Filesystem integrity check failed")
-            print(f"   Exit code: {result.returncode}")
-            if result.stderr:
-                print(f"   Errors: {result.stderr}")
-            sys.exit(1)
-            
-    except Exception as e:
-        print(f"❌ Integrity check failed: {e}", file=sys.stderr)
+            print("✅ Filesystem integrity check passed")
+    else:
+        print("❌ Filesystem integrity check failed")
+        print(f"   {error}")
         sys.exit(1)
     
+    if args.full and args.image and not os.path.isfile(args.image):
+        print(f"❌ Error: Image '{args.image}' not found.", file=sys.stderr)
+        sys.exit(1)
+
     print("🔍 Checking for corrupted files...")
     mount_dir = f"/mnt/integrity_check_{slot}"
     corrupted_files = []
     
     try:
-        run_command(f"mkdir -p {mount_dir}")
-        run_command(f"mount {part_path} {mount_dir}")
+        mount_slot_root(part_path, mount_dir, f"root_{slot}", read_only=True)
         
         # Check critical system files
         critical_files = [
@@ -228,9 +463,101 @@ def handle_verify_integrity(args):
             sys.exit(1)
         else:
             print("✅ All critical files are intact")
+
+        if args.full:
+            index = None
+            if not args.image:
+                # The index written at update time spares mounting and
+                # hashing the image; the copy on /var is read first.
+                index = open_slot_index(slot_index_path(slot) or os.path.join(slot_part_root(mount_dir), MANIFEST_INDEX_FILE))
+            image = args.image or (None if index else _recorded_slot_image(slot))
+            if index is None and not image:
+                print(f"❌ Error: No index or image to verify slot '{slot}' against. Pass an image with --image.", file=sys.stderr)
+                sys.exit(1)
+            if not verify_slot_contents(slot, mount_dir, image, args.jobs, index):
+                sys.exit(1)
             
     finally:
-        run_command(f"umount {mount_dir}", check=False)
+        umount_slot_root(mount_dir)
         run_command(f"rmdir {mount_dir}", check=False)
     
-    print("✅ Slot integrity verification completed successfully!") 
\ No newline at end of file
+    print("✅ Slot integrity verification completed successfully!")
+
+
+def _recorded_slot_image(slot):
+    """The image the slot was last updated from, if it is still around."""
+    record = read_slot_record(slot) or {}
+    if record.get("sha256"):
+        cached = cache_lookup(sha256=record["sha256"])
+        if cached:
+            return cached
+    source = record.get("source")
+    return source if source and os.path.isfile(source) else None
+
+
+def _print_paths(icon, title, paths, limit=20):
+    if not paths:
+        return
+    print(f"{icon} {title} ({len(paths)}):")
+    for path in paths[:limit]:
+        print(f"   • /{path}")
+    if len(paths) > limit:
+        print(f"   … and {len(paths) - limit} more")
+
+
+def verify_slot_contents(slot, mount_dir, image, jobs=None, index=None):
+    """Compare every file in the mounted slot with the image it came from.
+
+    With an open slot index, the slot is compared with the index instead
+    of the image.
+    """
+    jobs = MANIFEST_JOBS if jobs is None else jobs
+    if index is not None:
+        image_id = slot_index_meta(index).get("image_id")
+        print(f"🔍 Comparing every file in slot {slot.upper()} with its index (image {(image_id or '')[:12] or 'unknown'})...")
+    else:
+        print(f"🔍 Comparing every file in slot {slot.upper()} with {image}...")
+    # Image-mode slots are mounted with mount_slot_root(), which shows the
+    # overlay at mount_dir; the image is on the partition behind it.
+    slot_image = os.path.join(slot_part_root(mount_dir), SLOT_IMAGE_FILE)
+    if os.path.isfile(slot_image):
+        # Image-mode slots hold the image itself.
+        started = time.monotonic()
+        if index is not None:
+            matches = image_id and hash_file(slot_image) == image_id
+            count = 1
+        else:
+            matches = hash_file(slot_image) == hash_file(image)
+            count = 2
+        seconds = time.monotonic() - started
+        size = os.path.getsize(slot_image)
+        print(f"📈 Hashed {size / (1024*1024):.0f} MB {'once' if count == 1 else 'twice'} in {seconds:.1f} s")
+        if not matches:
+            print(f"❌ {SLOT_IMAGE_FILE} does not match {image or 'the image it was installed from'}")
+            return False
+        print("✅ Slot image matches")
+        return True
+
+    if index is not None:
+        expected = slot_index_manifest(index)
+    else:
+        image_dir = f"/mnt/integrity_check_image_{slot}"
+        run_command(f"mkdir -p {image_dir}")
+        try:
+            run_command(f"mount -o loop,ro {image} {image_dir}")
+            expected, _, _ = tree_manifest(image_dir, jobs)
+        finally:
+            run_command(f"umount {image_dir}", check=False)
+            run_command(f"rmdir {image_dir}", check=False)
+    actual, total, seconds = tree_manifest(mount_dir, jobs)
+    mismatched, missing, extra = compare_manifests(expected, actual)
+
+    rate = total / max(seconds, 1e-6) / (1024 * 1024)
+    print(f"📈 Hashed {len(actual)} files, {total / (1024*1024):.0f} MB in {seconds:.1f} s ({rate:.0f} MB/s)")
+    _print_paths("❌", "Modified files", mismatched)
+    _print_paths("❌", "Missing files", missing)
+    _print_paths("⚠️ ", "Files not in the image", extra)
+    if mismatched or missing:
+        return False
+    print("✅ Every file matches the image")
+    return True
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import shutil
+import struct
+import tempfile
+
+EROFS_MAGIC = 0xE0F5E1E2
+EROFS_SUPERBLOCK_OFFSET = 1024
+IMAGE_FORMATS = ["squashfs", "erofs"]
+IMAGE_EXTENSIONS = {"squashfs": ".sfs", "erofs": ".erofs"}
+IMAGE_COMPRESSION = {"squashfs": "xz", "erofs": "lz4hc"}
+IMAGE_TOOLS = {
+    "squashfs": {"build": "mksquashfs", "extract": "unsquashfs"},
+    "erofs": {"build": "mkfs.erofs", "extract": "fsck.erofs"},
+}
+# Top-level directories whose contents never belong in an image of a
+# running slot. The directories themselves are kept as mount points.
+IMAGE_EXCLUDED_DIRS = ["proc", "sys", "dev", "run", "tmp", "mnt", "media"]
+
+
+def detect_image_format(path):
+    try:
+        with open(path, "rb") as f:
+            head = f.read(EROFS_SUPERBLOCK_OFFSET + 4)
+    except OSError:
+        return None
+    if head[:4] == struct.pack("<I", SQUASHFS_MAGIC):
+        return "squashfs"
+    if head[EROFS_SUPERBLOCK_OFFSET:EROFS_SUPERBLOCK_OFFSET + 4] == struct.pack("<I", EROFS_MAGIC):
+        return "erofs"
+    return None
+
+
+def image_format_or_exit(path, need="extract"):
+    """Return the format of the image at path, exiting unless it is one and the tool for need is installed.
+
+    need is "build", "extract" or None for callers that only loop-mount
+    or copy the image.
+    """
+    fmt = detect_image_format(path)
+    if fmt is None:
+        print(f"Error: '{path}' is not a SquashFS or EROFS image.", file=sys.stderr)
+        sys.exit(1)
+    if need:
+        image_tool_or_exit(fmt, need)
+    return fmt
+
+
+def image_tool_or_exit(fmt, need):
+    """Exit unless the command that does need ("build" or "extract") for fmt images is installed."""
+    tool = IMAGE_TOOLS[fmt][need]
+    if not shutil.which(tool):
+        print(f"Error: Required command '{tool}' for {fmt} images not found.", file=sys.stderr)
+        sys.exit(1)
+
+
+def find_backup_image(path):
+    """Resolve a backup path given with or without its image extension."""
+    if os.path.exists(path):
+        return path
+    for ext in IMAGE_EXTENSIONS.values():
+        if os.path.exists(path + ext):
+            return path + ext
+    return path
+
+
+def extract_image(image, dest, fmt=None, xattrs=False):
+    fmt = fmt or image_format_or_exit(image)
+    if fmt == "erofs":
+        run_command(f"fsck.erofs --extract={dest} --overwrite {image}")
+    else:
+        xattr_flag = "" if xattrs else " -no-xattrs"
+        run_command(f"unsquashfs -f -d {dest}{xattr_flag} {image}")
+
+
+def build_image(source, dest, fmt="squashfs", exclude_runtime=True, compression=None, processors=None):
+    """Build an image of source at dest.
+
+    compression is the compressor argument of the format's tool (what
+    follows -comp or -z), defaulting to IMAGE_COMPRESSION; processors
+    limits the threads the tool compresses with.
+    """
+    compression = compression or IMAGE_COMPRESSION[fmt]
+    if fmt == "erofs":
+        cmd = f"mkfs.erofs -z{compression} {dest} {source}"
+        if processors:
+            cmd += f" --workers={processors}"
+        if exclude_runtime:
+            dirs = "|".join(IMAGE_EXCLUDED_DIRS)
+            cmd += f" --exclude-regex='^({dirs})/.+' --exclude-path=lost+found"
+    else:
+        cmd = f"mksquashfs {source} {dest} -comp {compression} -noappend"
+        if processors:
+            cmd += f" -processors {processors}"
+        if exclude_runtime:
+            dirs = " ".join(f"{d}/*" for d in IMAGE_EXCLUDED_DIRS)
+            cmd += f" -wildcards -e {dirs} lost+found"
+    run_command(cmd)
+
+
+def _tree_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def handle_image_benchmark(args):
+    source = args.source_dir
+    if not os.path.isdir(source):
+        print(f"Error: Source directory '{source}' not found.", file=sys.stderr)
+        sys.exit(1)
+    formats = args.formats or IMAGE_FORMATS
+    for fmt in formats:
+        for tool in IMAGE_TOOLS[fmt].values():
+            if not shutil.which(tool):
+                print(f"Error: Required command '{tool}' for {fmt} images not found.", file=sys.stderr)
+                sys.exit(1)
+
+    source_size = _tree_size(source)
+    print(f"Benchmarking image formats on {source} ({source_size / (1024*1024):.1f} MB)...")
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="obsidianctl_bench_", dir=args.work_dir)
+    try:
+        for fmt in formats:
+            image = os.path.join(work_dir, f"bench{IMAGE_EXTENSIONS[fmt]}")
+            extract_dir = os.path.join(work_dir, f"extract_{fmt}")
+            print(f"Building {fmt} image...")
+            start = time.monotonic()
+            build_image(source, image, fmt, exclude_runtime=False)
+            build_time = time.monotonic() - start
+            size = os.path.getsize(image)
+            print(f"Extracting {fmt} image...")
+            os.makedirs(extract_dir)
+            start = time.monotonic()
+            extract_image(image, extract_dir, fmt)
+            extract_time = time.monotonic() - start
+            results.append((fmt, build_time, extract_time, size))
+            os.remove(image)
+            shutil.rmtree(extract_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'Format':<18} {'Build (s)':>10} {'Extract (s)':>12} {'Size (MB)':>10} {'Ratio':>7}")
+    for fmt, build_time, extract_time, size in results:
+        ratio = source_size / size if size else 0
+        label = f"{fmt} ({IMAGE_COMPRESSION[fmt]})"
+        print(f"{label:<18} {build_time:>10.2f} {extract_time:>12.2f} {size / (1024*1024):>10.1f} {ratio:>7.2f}")
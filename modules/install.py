@@ -49,8 +49,16 @@ def _detect_chroot_cmd():
             run_command(f"umount -R {mount_dir}/proc {mount_dir}/sys {mount_dir}/dev", check=False)
         return do_chroot
 
-# Detect once at module load time so all handle_* functions share the same instance
-_chroot = _detect_chroot_cmd()
+_chroot_cmd = None
+
+
+def _chroot(mount_dir, *extra_args, check=True):
+    # Detected on first use so loading this module does no work, then
+    # shared by all handle_* functions.
+    global _chroot_cmd
+    if _chroot_cmd is None:
+        _chroot_cmd = _detect_chroot_cmd()
+    _chroot_cmd(mount_dir, *extra_args, check=check)
 
 
 def handle_mkobsidiansfs(args):
@@ -62,6 +70,13 @@ def handle_mkobsidiansfs(args):
     tmp_script = f"{tmp_dir}/{script_name}"
 
     out_sfs = "/tmp/tmp_system.sfs" if is_gentoo else "tmp_system.sfs"
+    cache_key = mkobsfs_cache_key(args.system_sfs, script_name)
+    cached = cache_lookup(cache_key)
+    if cached:
+        print(f"Using cached build of {args.system_sfs}: {cached}")
+        args.system_sfs = cached
+        handle_install(args)
+        return
     if shutil.which(script_name):
         os.system(f"{script_name} {args.system_sfs} {out_sfs}")
     else:
@@ -76,9 +91,25 @@ def handle_mkobsidiansfs(args):
                 "No git or mkobsidiansfs found. Please install one of these to directly pass in an .mkobsfs."
             )
             sys.exit(1)
-    args.system_sfs = out_sfs
+    if not os.path.exists(out_sfs):
+        print(f"Error: Building {args.system_sfs} failed.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        args.system_sfs = cache_store(out_sfs, key=cache_key, move=True)
+    except OSError as e:
+        print(f"Warning: Could not add the build to the image cache: {e}", file=sys.stderr)
+        args.system_sfs = out_sfs
     handle_install(args)
-    os.remove(out_sfs)
+
+
+def _sync_tree_to_partition(part, source_dir, mount_point):
+    run_command(f"mkdir -p {mount_point}")
+    try:
+        run_command(f"mount {part} {mount_point}")
+        run_command(f"rsync -aK --delete {source_dir}/ {mount_point}/")
+    finally:
+        run_command(f"umount {mount_point}", check=False)
+        run_command(f"rmdir {mount_point}", check=False)
 
 
 def handle_install(args):
@@ -100,6 +131,10 @@ def handle_install(args):
     if not os.path.exists(system_sfs):
         print(f"Error: System image '{system_sfs}' not found.", file=sys.stderr)
         sys.exit(1)
+    image_format = image_format_or_exit(system_sfs, need=None if args.image_mode else "extract")
+    if args.image_mode and not args.use_systemdboot:
+        print("Error: --image-mode is only supported together with --use-systemdboot.", file=sys.stderr)
+        sys.exit(1)
 
     print(f"WARNING: This will destroy all data on {device}.")
     confirm = input("Are you sure you want to proceed? (y/N): ")
@@ -114,6 +149,9 @@ def handle_install(args):
             fstype="ext4"
         else:
             fstype="f2fs"
+    jobs = args.jobs
+    timings = []
+    partition_start = time.monotonic()
     print("Partitioning device...")
     partition_table = f"""
 label: gpt
@@ -129,6 +167,7 @@ label: gpt
     run_command("partprobe", check=False)
     print("Waiting for device partitions to settle...")
     run_command("udevadm settle")
+    invalidate_topology()
     part1, part2, part3, part4, part5, part6, part7 = (
         _get_part_path(device, 1),
         _get_part_path(device, 2),
@@ -138,30 +177,67 @@ label: gpt
         _get_part_path(device, 6),
         _get_part_path(device, 7),
     )
+    timings.append({"name": "Partitioning", "seconds": time.monotonic() - partition_start, "group": None})
 
     print("Formatting partitions...")
     format_commands = [
-        f"mkfs.fat    -F32 -n ESP_A   {part1}",
-        f"mkfs.fat    -F32 -n ESP_B   {part2}",
-        f"mkfs.{fstype} -F -L root_a  {part3}",
-        f"mkfs.{fstype} -F -L root_b  {part4}",
-        f"mkfs.{fstype} -F -L etc_ab  {part5}",
-        f"mkfs.{fstype} -F -L var_ab  {part6}",
-        f"mkfs.{fstype} -F -L home_ab {part7}",
+        ("ESP_A", f"mkfs.fat    -F32 -n ESP_A   {part1}"),
+        ("ESP_B", f"mkfs.fat    -F32 -n ESP_B   {part2}"),
+        ("root_a", f"mkfs.{fstype} -F -L root_a  {part3}"),
+        ("root_b", f"mkfs.{fstype} -F -L root_b  {part4}"),
+        ("etc_ab", f"mkfs.{fstype} -F -L etc_ab  {part5}"),
+        ("var_ab", f"mkfs.{fstype} -F -L var_ab  {part6}"),
+        ("home_ab", f"mkfs.{fstype} -F -L home_ab {part7}"),
     ]
-    for cmd in format_commands:
-        run_command(cmd)
+    run_concurrent_phases(
+        timings, "Formatting", [(f"mkfs {label}", run_command, (cmd,)) for label, cmd in format_commands], jobs
+    )
 
     # Wait for partitions to settle after formatting
     run_command("partprobe", check=False)
     run_command("udevadm settle")
+    invalidate_topology()
 
+    # Everything that only needs the image's contents is filled from a
+    # read-only mount of the image, so it does not wait for slot A.
     mount_dir = "/mnt/obsidian_install"
-    run_command(f"mkdir -p {mount_dir}")
-    print("Mounting root partition for slot 'a'...")
-    run_command(f"mount {lordo('root_a', device)} {mount_dir}")
-    print(f"Extracting system from {system_sfs} to slot 'a'...")
-    run_command(f"unsquashfs -f -d {mount_dir} -no-xattrs {system_sfs}")
+    image_mount_dir = "/mnt/obsidian_install_image"
+    run_command(f"mkdir -p {mount_dir} {image_mount_dir}")
+    run_command(f"mount -o loop,ro {system_sfs} {image_mount_dir}")
+    try:
+        if args.image_mode:
+            print(f"Writing image {system_sfs} to slot 'a'...")
+            populate_root = (install_slot_image, (lordo('root_a', device), system_sfs, mount_dir, "root_a"))
+        else:
+            print(f"Extracting system from {system_sfs} to slot 'a'...")
+            run_command(f"mount {lordo('root_a', device)} {mount_dir}")
+            populate_root = (extract_image, (system_sfs, mount_dir, image_format))
+        print("Populating shared /var and /home partitions...")
+        # The image's SHA256 identifies it in the slot's file index; it is
+        # hashed while the partitions are filled from it.
+        image_hash = {}
+        steps = [
+            ("root_a", *populate_root),
+            ("image sha256", lambda: image_hash.update(sha256=hash_file(system_sfs)), ()),
+            ("var_ab", _sync_tree_to_partition, (lordo('var_ab', device), f"{image_mount_dir}/var", "/mnt/tmp_var")),
+            ("home_ab", _sync_tree_to_partition, (lordo('home_ab', device), f"{image_mount_dir}/home", "/mnt/tmp_home")),
+        ]
+        if not args.image_mode:
+            # Image-mode slots rebuild their initramfs below, so their ESPs
+            # are filled from the slot afterwards instead.
+            print("Populating ESP_A and ESP_B with boot files from system image...")
+            steps += [
+                ("ESP_A", _sync_tree_to_partition, (lordo('ESP_A', device), f"{image_mount_dir}/boot", "/mnt/obsidian_esp_tmp")),
+                ("ESP_B", _sync_tree_to_partition, (lordo('ESP_B', device), f"{image_mount_dir}/boot", "/mnt/obsidian_esp_b_tmp")),
+            ]
+        run_concurrent_phases(timings, "Populating partitions", steps, jobs)
+    finally:
+        run_command(f"umount {image_mount_dir}", check=False)
+        run_command(f"rmdir {image_mount_dir}", check=False)
+    if args.image_mode and not check_image_mode_supported(mount_dir):
+        umount_slot_root(mount_dir)
+        sys.exit(1)
+    configure_start = time.monotonic()
     print("Generating fstab for slot 'a'...")
     # On OpenRC, /run is cleared at boot so /run/etc_ab needs to be created
     # before localmount processes fstab. 
@@ -176,8 +252,10 @@ label: gpt
         _dst = f"{mount_dir}/etc/runlevels/sysinit/obsidian-mkmountpoints"
         if not _os.path.exists(_dst):
             _os.symlink("/etc/init.d/obsidian-mkmountpoints", _dst)
+    # In image mode the initramfs assembles / from the slot image and its overlay.
+    root_comment = "# " if args.image_mode else ""
     fstab_content_a = f"""
-{lordo('root_a', device)}  /      {fstype}  defaults,noatime 0 1
+{root_comment}{lordo('root_a', device)}  /      {fstype}  defaults,noatime 0 1
 {lordo('ESP_A', device)}   /efi  vfat  defaults,noatime 0 2
 {lordo('etc_ab', device)}  /run/etc_ab   {fstype}  defaults,noatime 0 2
 {lordo('var_ab', device)}  /var   {fstype}  defaults,noatime 0 2
@@ -186,37 +264,20 @@ label: gpt
     with open(f"{mount_dir}/etc/fstab", "w") as f:
         f.write(fstab_content_a.strip())
 
-    print("Populating shared /etc, /var, and /home partitions...")
-    for part_label in ["etc_ab", "var_ab", "home_ab"]:
-        fs_dir = part_label.split("_")[0]
-        tmp_mount_dir = f"/mnt/tmp_{fs_dir}"
-        run_command(f"mkdir -p {tmp_mount_dir}")
-        try:
-            run_command(f"mount {lordo(part_label, device)} {tmp_mount_dir}")
-            run_command(f"rsync -aK --delete {mount_dir}/{fs_dir}/ {tmp_mount_dir}/")
-        finally:
-            run_command(f"umount {tmp_mount_dir}", check=False)
-            run_command(f"rmdir {tmp_mount_dir}", check=False)
+    if args.image_mode:
+        enable_image_mode_boot(mount_dir)
+    timings.append({"name": "Configuring slot a", "seconds": time.monotonic() - configure_start, "group": None})
 
-    print("Populating ESP with boot files from system image...")
-    esp_tmp_mount = "/mnt/obsidian_esp_tmp"
-    run_command(f"mkdir -p {esp_tmp_mount}")
-    try:
-        run_command(f"mount {lordo('ESP_A', device)} {esp_tmp_mount}")
-        run_command(f"rsync -aK --delete {mount_dir}/boot/ {esp_tmp_mount}/")
-    finally:
-        run_command(f"umount {esp_tmp_mount}", check=False)
-        run_command(f"rmdir {esp_tmp_mount}", check=False)
-
-    print("Populating ESP_B with boot files from system image...")
-    esp_b_tmp_mount = "/mnt/obsidian_esp_b_tmp"
-    run_command(f"mkdir -p {esp_b_tmp_mount}")
-    try:
-        run_command(f"mount {lordo('ESP_B', device)} {esp_b_tmp_mount}")
-        run_command(f"rsync -aK --delete {mount_dir}/boot/ {esp_b_tmp_mount}/")
-    finally:
-        run_command(f"umount {esp_b_tmp_mount}", check=False)
-        run_command(f"rmdir {esp_b_tmp_mount}", check=False)
+    # /etc is copied from the configured slot, as it carries its fstab.
+    print("Populating shared /etc partition...")
+    steps = [("etc_ab", _sync_tree_to_partition, (lordo('etc_ab', device), f"{mount_dir}/etc", "/mnt/tmp_etc"))]
+    if args.image_mode:
+        print("Populating ESP_A and ESP_B with boot files from slot 'a'...")
+        steps += [
+            ("ESP_A", _sync_tree_to_partition, (lordo('ESP_A', device), f"{mount_dir}/boot", "/mnt/obsidian_esp_tmp")),
+            ("ESP_B", _sync_tree_to_partition, (lordo('ESP_B', device), f"{mount_dir}/boot", "/mnt/obsidian_esp_b_tmp")),
+        ]
+    run_concurrent_phases(timings, "Populating /etc", steps, jobs)
 
     print("Mounting shared partitions for potential chroot...")
     mount_commands = [
@@ -231,7 +292,6 @@ label: gpt
     ]
     for cmd in mount_commands:
         run_command(cmd)
-
     print("Copying support files to slot 'a'...")
     script_path = os.path.realpath(sys.argv[0])
     os_release_path = "/etc/os-release"
@@ -280,43 +340,52 @@ label: gpt
         _chroot(mount_dir, "sbctl create-keys || true", check=False)
         _chroot(mount_dir, "sbctl sign-all || true", check=False)
 
+    # The index records the image, not the extracted slot, so what the
+    # chroot and signing changed shows up when the slot is verified.
+    print("Indexing the files of slot 'a'...")
+    index_path, count, _, total, seconds = run_phase(
+        timings, "Indexing slot a", write_image_index, system_sfs, image_hash["sha256"], slot_part_root(mount_dir), mount_dir
+    )
+    print(f"Indexed {count} files, {total / (1024*1024):.0f} MB in {seconds:.1f} s")
+    # Slot B is cloned from slot A before anything else changes it, so
+    # both start out with the same index.
+    for slot in ("a", "b"):
+        store_slot_index(slot, index_path, f"{mount_dir}{SLOT_RECORD_DIR}")
+
     print("Unmounting slot 'a' partitions before copy...")
-    run_command(f"umount -R {mount_dir}")
+    if args.image_mode:
+        umount_slot_root(mount_dir)
+    else:
+        run_command(f"umount -R {mount_dir}")
     print("Copying system to slot 'b'...")
-    source_mount_point = "/mnt/obsidian_source_a"
-    target_mount_point = "/mnt/obsidian_target_b"
-    run_command(f"mkdir -p {source_mount_point} {target_mount_point}")
-    try:
-        run_command(f"mount {part3} {source_mount_point}")
-        run_command(f"mount {part4} {target_mount_point}")
-        run_command(
-            f"rsync -aHAX --inplace --delete --info=progress2 {source_mount_point}/ {target_mount_point}/"
-        )
-    finally:
-        run_command(f"umount {source_mount_point}", check=False)
-        run_command(f"umount {target_mount_point}", check=False)
-        run_command(f"rm -r {source_mount_point} {target_mount_point}", check=False)
-    run_command(f"e2label {part4} root_b")
+    run_phase(timings, "Cloning slot a to slot b", clone_slot_filesystem, part3, part4, fstype, "root_b")
     print("Correcting fstab for slot 'b'...")
     mount_b_dir = "/mnt/obsidian_install_b"
     run_command(f"mkdir -p {mount_b_dir}")
     try:
-        run_command(f"mount {part4} {mount_b_dir}")
+        if args.image_mode:
+            mount_slot_root(part4, mount_b_dir, "root_b")
+        else:
+            run_command(f"mount {part4} {mount_b_dir}")
         fstab_b_path = f"{mount_b_dir}/etc/fstab"
         if not os.path.exists(os.path.dirname(fstab_b_path)):
             run_command(f"mkdir -p {os.path.dirname(fstab_b_path)}")
         with open(fstab_b_path, "w") as f:
             f.write(f"""
-{lordo('root_b', device)}  /      {fstype}  defaults,noatime 0 1
+{root_comment}{lordo('root_b', device)}  /      {fstype}  defaults,noatime 0 1
 {lordo('ESP_B', device)}   /efi  vfat  defaults,noatime 0 2
 {lordo('etc_ab', device)}  /run/etc_ab   {fstype}  defaults,noatime 0 2
 {lordo('var_ab', device)}  /var   {fstype}  defaults,noatime 0 2
 {lordo('home_ab', device)} /home  {fstype}  defaults,noatime 0 2
 """)
     finally:
-        run_command(f"umount {mount_b_dir}", check=False)
+        if args.image_mode:
+            umount_slot_root(mount_b_dir)
+        else:
+            run_command(f"umount {mount_b_dir}", check=False)
         run_command(f"rm -r {mount_b_dir}", check=False)
 
+    bootloader_start = time.monotonic()
     if not args.use_systemdboot:
         mount_dir="/mnt/obsidianos-install-grub"
         print("Installing GRUB to ESP_A...")
@@ -457,6 +526,8 @@ options root=PARTUUID={root_b_partuuid} rw
             run_command(f"umount {esp_b_config_mount_dir}", check=False)
             run_command(f"rm -r {esp_b_config_mount_dir}", check=False)
             run_command(f"rm -r {mount_dir}", check=False)
+    timings.append({"name": "Installing bootloader", "seconds": time.monotonic() - bootloader_start, "group": None})
+    print_phase_report(timings)
     print("\nInstallation complete!")
     print("Default boot order will attempt Slot A, then Slot B.")
     print("Reboot your system to apply changes.")
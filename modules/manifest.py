@@ -0,0 +1,283 @@
+import os
+import sys
+import mmap
+import stat
+import time
+import fnmatch
+import sqlite3
+import hashlib
+import multiprocessing
+import concurrent.futures
+
+MANIFEST_READ_SIZE = 8 * 1024 * 1024
+MANIFEST_JOBS = os.cpu_count() or 1
+# Index of every file a slot got from its image, kept in the slot's
+# partition root next to the image of image-mode slots.
+MANIFEST_INDEX_FILE = f"{SLOT_IMAGE_DIR}/manifest.db"
+MANIFEST_INDEX_VERSION = 1
+# SQLite maps this much of the index instead of reading it page by page.
+MANIFEST_INDEX_MMAP_SIZE = 256 * 1024 * 1024
+# Files obsidianctl rewrites after extracting an image into a slot, and
+# so never match the image.
+MANIFEST_IGNORED = [
+    "lost+found",
+    "lost+found/*",
+    SLOT_IMAGE_DIR,
+    f"{SLOT_IMAGE_DIR}/*",
+    "etc/fstab",
+    "etc/os-release",
+    "usr/bin/obsidianctl",
+    "boot/initramfs-*.img",
+]
+
+
+def _ignored(path):
+    return any(fnmatch.fnmatch(path, pattern) for pattern in MANIFEST_IGNORED)
+
+
+def _same_device(path, dev):
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    # Overlays report the device of the layer for anything but directories.
+    return stat.S_ISLNK(st.st_mode) or st.st_dev == dev
+
+
+def _walk_stat(root):
+    """Yield (relative path, lstat result) for the files and symlinks under root.
+
+    Like find -xdev, filesystems mounted below root are not entered.
+    """
+    root_dev = os.lstat(root).st_dev
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        dirnames[:] = [d for d in dirnames if _same_device(os.path.join(dirpath, d), root_dev)]
+        for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+            rel = os.path.normpath(os.path.join(rel_dir, name))
+            if _ignored(rel):
+                continue
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            if stat.S_ISLNK(st.st_mode) or stat.S_ISREG(st.st_mode):
+                yield rel, st
+
+
+def walk_tree(root):
+    """Return {relative path: (kind, size or link target)} for the files and symlinks under root."""
+    entries = {}
+    for rel, st in _walk_stat(root):
+        if stat.S_ISLNK(st.st_mode):
+            entries[rel] = ("link", os.readlink(os.path.join(root, rel)))
+        else:
+            entries[rel] = ("file", st.st_size)
+    return entries
+
+
+def hash_file(path):
+    """Return the SHA256 of path, reading it through mmap in large slices."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mm)
+                try:
+                    for offset in range(0, size, MANIFEST_READ_SIZE):
+                        hasher.update(view[offset:offset + MANIFEST_READ_SIZE])
+                finally:
+                    view.release()
+    return hasher.hexdigest()
+
+
+def _hash_one(path):
+    try:
+        return hash_file(path)
+    except OSError as e:
+        return f"error: {e.strerror or e}"
+
+
+def hash_files(root, paths, jobs=MANIFEST_JOBS):
+    """Hash the files at root/path for each path in a process pool.
+
+    Returns ({path: sha256 or "error: ..."}, bytes hashed, seconds).
+    """
+    started = time.monotonic()
+    full_paths = [os.path.join(root, path) for path in paths]
+    total = 0
+    for path in full_paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    # fork, so the workers share this script's functions without
+    # re-running it.
+    context = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(jobs, 1), mp_context=context) as executor:
+        digests = list(executor.map(_hash_one, full_paths, chunksize=64))
+    return dict(zip(paths, digests)), total, time.monotonic() - started
+
+
+def tree_manifest(root, jobs=MANIFEST_JOBS):
+    """Return ({path: (kind, size, sha256 or link target)}, bytes hashed, seconds) for root."""
+    entries = walk_tree(root)
+    files = sorted(path for path, (kind, _) in entries.items() if kind == "file")
+    digests, total, seconds = hash_files(root, files, jobs)
+    manifest = {}
+    for path, (kind, value) in entries.items():
+        if kind == "file":
+            manifest[path] = ("file", value, digests[path])
+        else:
+            manifest[path] = ("link", 0, value)
+    return manifest, total, seconds
+
+
+def compare_manifests(expected, actual):
+    """Return (mismatched, missing, extra) sorted path lists."""
+    mismatched = sorted(p for p in expected.keys() & actual.keys() if expected[p] != actual[p])
+    missing = sorted(expected.keys() - actual.keys())
+    extra = sorted(actual.keys() - expected.keys())
+    return mismatched, missing, extra
+
+
+def _previous_digests(index_path):
+    """Return {path: (size, mtime_ns, sha256)} for the files in an earlier index."""
+    db = open_slot_index(index_path) if index_path else None
+    if db is None:
+        return {}
+    try:
+        return {
+            path: (size, mtime_ns, digest)
+            for path, size, mtime_ns, digest in db.execute("SELECT path, size, mtime_ns, digest FROM files WHERE kind = 'file'")
+            if not digest.startswith("error:")
+        }
+    except sqlite3.Error:
+        return {}
+    finally:
+        db.close()
+
+
+def write_slot_index(root, image_id, index_root=None, jobs=MANIFEST_JOBS, previous=None):
+    """Record every file under root in an SQLite index at index_root/MANIFEST_INDEX_FILE.
+
+    Each row holds the path, mode, size, mtime and SHA256 (or link target)
+    of a file, keyed by path, so single files can be looked up without
+    walking or mounting anything. Files whose size and mtime match the
+    index at previous keep its SHA256 instead of being hashed again.
+    Returns (index path, files, files reused, bytes hashed, seconds).
+    """
+    started = time.monotonic()
+    stats = dict(_walk_stat(root))
+    known = _previous_digests(previous)
+    digests = {}
+    for path, st in stats.items():
+        entry = known.get(path)
+        if entry and stat.S_ISREG(st.st_mode) and entry[:2] == (st.st_size, st.st_mtime_ns):
+            digests[path] = entry[2]
+    reused = len(digests)
+    files = sorted(path for path, st in stats.items() if stat.S_ISREG(st.st_mode) and path not in digests)
+    hashed, total, _ = hash_files(root, files, jobs)
+    digests.update(hashed)
+    rows = []
+    for path in sorted(stats):
+        st = stats[path]
+        if stat.S_ISLNK(st.st_mode):
+            kind, digest = "link", os.readlink(os.path.join(root, path))
+        else:
+            kind, digest = "file", digests[path]
+        rows.append((path, kind, stat.S_IMODE(st.st_mode), st.st_size if kind == "file" else 0, st.st_mtime_ns, digest))
+
+    index_path = os.path.join(index_root or root, MANIFEST_INDEX_FILE)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID")
+        db.execute(
+            "CREATE TABLE files (path TEXT PRIMARY KEY, kind TEXT NOT NULL, mode INTEGER NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL) WITHOUT ROWID"
+        )
+        # Rows go in sorted by path, so the B-tree is built in order.
+        db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+        db.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("version", str(MANIFEST_INDEX_VERSION)),
+            ("image_id", image_id or ""),
+            ("created", str(int(time.time()))),
+            ("files", str(len(rows))),
+        ])
+        db.commit()
+    finally:
+        db.close()
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, index_path)
+    return index_path, len(rows), reused, total, time.monotonic() - started
+
+
+def write_image_index(image, image_id, index_root, root=None, previous=None, jobs=MANIFEST_JOBS):
+    """Index the files of image, loop-mounted read-only, at index_root/MANIFEST_INDEX_FILE.
+
+    The index then records what the image holds, not what was extracted
+    from it, so verifying a slot against it catches bad extractions. Only
+    if the image cannot be mounted is root, the tree extracted from it,
+    indexed instead, reusing the SHA256 of files whose size and mtime
+    match the index at previous. Returns what write_slot_index() does.
+    """
+    image_dir = "/mnt/obsidian_index_image"
+    run_command(f"mkdir -p {image_dir}")
+    try:
+        if run_command(f"mount -o loop,ro {image} {image_dir}", check=False, capture_output=True).returncode == 0:
+            return write_slot_index(image_dir, image_id, index_root, jobs)
+    finally:
+        if os.path.ismount(image_dir):
+            run_command(f"umount {image_dir}", check=False)
+        run_command(f"rmdir {image_dir}", check=False)
+    if root is None:
+        print(f"Error: Could not mount {image} to index it.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Warning: Could not mount {image}. Indexing the extracted files instead.", file=sys.stderr)
+    return write_slot_index(root, image_id, index_root, jobs, previous)
+
+
+def open_slot_index(index_path):
+    """Open a slot index read-only, memory-mapped. Returns None if it is missing or unreadable."""
+    if not os.path.isfile(index_path):
+        return None
+    try:
+        db = sqlite3.connect(f"file:{index_path}?mode=ro&immutable=1", uri=True)
+        db.execute(f"PRAGMA mmap_size = {MANIFEST_INDEX_MMAP_SIZE}")
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+    except sqlite3.Error:
+        return None
+    if meta.get("version") != str(MANIFEST_INDEX_VERSION):
+        db.close()
+        return None
+    return db
+
+
+def slot_index_meta(db):
+    """Return the index's metadata: version, image_id, created and files."""
+    return dict(db.execute("SELECT key, value FROM meta"))
+
+
+def slot_index_lookup(db, path):
+    """Return (kind, mode, size, mtime_ns, sha256 or link target) of path, or None."""
+    return db.execute(
+        "SELECT kind, mode, size, mtime_ns, digest FROM files WHERE path = ?", (path.lstrip("/"),)
+    ).fetchone()
+
+
+def slot_index_manifest(db):
+    """Return the index as {path: (kind, size, sha256 or link target)}, like tree_manifest()."""
+    return {
+        path: (kind, size, digest)
+        for path, kind, size, digest in db.execute("SELECT path, kind, size, digest FROM files")
+        if not _ignored(path)
+    }
@@ -1,6 +1,86 @@
+NETUPDATE_IMAGE_URL = "https://github.com/Obsidian-OS/archiso/releases/download/latest/system.sfs"
+# Space left free on the target partition when the image is spooled there,
+# so the extracted tree still fits next to it.
+NETUPDATE_SPOOL_RESERVE = 4 * 1024 * 1024 * 1024
+# Exit codes of netupdate --check, for cron jobs and scripts.
+NETUPDATE_EXIT_AVAILABLE = 100
+NETUPDATE_EXIT_INSTALLED = 101
+
+
+def _netupdate_fetch(url, expected_sha256):
+    """Return a fetch(dest) callback that streams the image from url to dest and returns its SHA256."""
+
+    def fetch(dest):
+        available = shutil.disk_usage(os.path.dirname(dest)).free
+        if not dest.endswith(SLOT_IMAGE_FILE):
+            available -= NETUPDATE_SPOOL_RESERVE
+        print(f"Downloading {url}...")
+        try:
+            digest = stream_download(url, dest, max_bytes=max(available, 0))
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            print(f"Error: Download failed: {e}", file=sys.stderr)
+            print("The slot was left incomplete. Run netupdate again before switching to it.", file=sys.stderr)
+            sys.exit(1)
+        if expected_sha256 and digest != expected_sha256:
+            print(f"Error: Checksum mismatch (expected {expected_sha256}, got {digest}).", file=sys.stderr)
+            print("The slot was left incomplete. Run netupdate again before switching to it.", file=sys.stderr)
+            sys.exit(1)
+        print(f"SHA256: {digest}{' (verified)' if expected_sha256 else ''}")
+        return digest
+
+    return fetch
+
+
+def _netupdate_check(args, url):
+    slot = args.slot or get_current_slot()
+    if slot not in ("a", "b"):
+        print("Error: Could not determine the current slot. Pass the slot to check.", file=sys.stderr)
+        sys.exit(1)
+    record = read_slot_record(slot) or {}
+    # A published checksum is a few bytes; without one fall back to a
+    # conditional request against the validators recorded at update time.
+    latest_sha256 = fetch_expected_sha256(url)
+    if latest_sha256:
+        up_to_date = record.get("sha256") == latest_sha256
+    elif record.get("etag") or record.get("last_modified"):
+        try:
+            status, _, _ = probe_url(url, record.get("etag"), record.get("last_modified"))
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            print(f"Error: Could not reach {url}: {e}", file=sys.stderr)
+            sys.exit(1)
+        up_to_date = status == 304
+    else:
+        try:
+            probe_url(url)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            print(f"Error: Could not reach {url}: {e}", file=sys.stderr)
+            sys.exit(1)
+        up_to_date = False
+
+    if up_to_date:
+        print(f"Slot {slot.upper()} is up to date.")
+        sys.exit(0)
+    other = "b" if slot == "a" else "a"
+    other_record = read_slot_record(other) or {}
+    if latest_sha256 and other_record.get("sha256") == latest_sha256:
+        print(f"The latest image is already installed in slot {other.upper()}. Switch to it and reboot to use it.")
+        sys.exit(NETUPDATE_EXIT_INSTALLED)
+    if record:
+        print(f"An update is available for slot {slot.upper()} (installed {record.get('installed', 'unknown')}).")
+    else:
+        print(f"An update may be available: no record of the image installed in slot {slot.upper()}.")
+    sys.exit(NETUPDATE_EXIT_AVAILABLE)
+
+
 def handle_netupdate(args):
+    url = args.url or NETUPDATE_IMAGE_URL
+    if args.check:
+        _netupdate_check(args, url)
+    if not args.slot:
+        print("Error: The slot to update is required.", file=sys.stderr)
+        sys.exit(1)
     checkroot()
-    if args.break_system or not os.path.exists(
+    if not args.break_system and not os.path.exists(
         "/etc/obsidianctl-netupdate-enable-DONOTDELETE"
     ):
         print(
@@ -13,8 +93,54 @@ def handle_netupdate(args):
         )
         sys.exit(1)
     print("Starting image netupdate...")
-    print("Getting latest image...")
-    os.system(
-        "curl https://github.com/Obsidian-OS/archiso/releases/download/latest/system.sfs -o /tmp/system.sfs"
+    print("Getting latest image checksum...")
+    expected_sha256 = fetch_expected_sha256(url)
+    if not expected_sha256:
+        print("Warning: No published checksum found, the image will not be verified.", file=sys.stderr)
+    try:
+        _, etag, last_modified = probe_url(url)
+    except (urllib.error.URLError, OSError, ValueError):
+        etag = last_modified = None
+    if args.delta:
+        index = load_chunk_index(url + DELTA_INDEX_EXT)
+        if index is not None and expected_sha256 and index["sha256"] != expected_sha256:
+            print("Warning: Chunk index does not match the published image.", file=sys.stderr)
+            index = None
+        if index is not None:
+            # The rebuilt image is kept as the base for the next delta.
+            system_sfs = delta_update_or_exit(url + DELTA_INDEX_EXT, index, args.connections, args.delta_source)
+            _netupdate_install(args, system_sfs)
+            write_slot_record(args.slot, url, index["sha256"], etag, last_modified)
+            return
+        print("Warning: No chunk index published for this image, downloading it in full.", file=sys.stderr)
+    if args.connections > 1:
+        # Ranged downloads are kept in the download cache so an interrupted
+        # fetch can resume, then installed like a local image.
+        system_sfs = download_or_exit(url, args.connections, expected_sha256)
+        _netupdate_install(args, system_sfs)
+        image_sha256 = (read_slot_record(args.slot) or {}).get("sha256") or expected_sha256
+        write_slot_record(args.slot, url, image_sha256, etag, last_modified)
+        return
+    # The image is streamed straight onto the freshly formatted slot by
+    # handle_update, instead of being staged in /tmp first.
+    _netupdate_install(args, url, _netupdate_fetch(url, expected_sha256))
+    # handle_update has recorded the SHA256 the fetch computed.
+    image_sha256 = (read_slot_record(args.slot) or {}).get("sha256") or expected_sha256
+    write_slot_record(args.slot, url, image_sha256, etag, last_modified)
+
+
+def _netupdate_install(args, system_sfs, fetch=None):
+    handle_update(
+        argparse.Namespace(
+            slot=args.slot,
+            system_sfs=system_sfs,
+            switch=False,
+            image_mode=args.image_mode,
+            offline_populate=False,
+            incremental=args.incremental,
+            connections=args.connections,
+            delta_source=args.delta_source,
+            cache=False,
+            fetch=fetch,
+        )
     )
-    handle_update(argparse.Namespace(slot=args.slot, system_sfs="/tmp/system.sfs"))
@@ -4,11 +4,14 @@ OVERLAYS_CONF_PATH = "/etc/obsidianos-overlays.conf"
 LIB_OVERLAYS_SO = "/usr/lib/libobsidianos_overlays.so"
 FSTAB_MARKER_PREFIX = "# OBSIDIANOS_EXT:"
 OVERLAYS_MARKER_PREFIX = "# OBSIDIANOS_EXT:"
-USER_ENV_GENERATOR_DIR = os.path.join(get_user_home_dir(), ".config", "environment.d")
-USER_ENV_GENERATOR_SCRIPT = f"{USER_ENV_GENERATOR_DIR}/99-obsidianos-overlays.conf"
 LD_PRELOAD_LINE = "LD_PRELOAD=/usr/lib/libobsidianos_overlays.so"
 
 
+def _user_env_generator_script():
+    # Resolved on use: looking up the invoking user's home is not free.
+    return os.path.join(get_user_home_dir(), ".config", "environment.d", "99-obsidianos-overlays.conf")
+
+
 def _check_lib_exists():
     if not os.path.exists(LIB_OVERLAYS_SO):
         print(f"Error: libobsidianos_overlays is not installed.", file=sys.stderr)
@@ -0,0 +1,143 @@
+import os
+import json
+
+PACMAN_LOCAL_DB = "var/lib/pacman/local"
+# Parsed package lists of each slot, reused while the slot's local
+# database directory keeps the same inode and mtime. pacman adds and
+# removes a directory there for every package it installs, upgrades or
+# removes, so the directory's mtime changes with every transaction.
+PACMAN_CACHE_FILE = "/var/lib/obsidianctl/packages_{slot}.json"
+PACMAN_DESC_FIELDS = {"%NAME%": "name", "%VERSION%": "version", "%BUILDDATE%": "builddate", "%SIZE%": "size"}
+
+
+def parse_desc(path):
+    """Return {name, version, builddate, size} from a package's desc file."""
+    package = {"name": None, "version": None, "builddate": 0, "size": 0}
+    field = None
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                field = None
+            elif field is None:
+                field = PACMAN_DESC_FIELDS.get(line, "")
+            elif field:
+                package[field] = int(line) if field in ("builddate", "size") and line.isdigit() else line
+                field = ""
+    return package
+
+
+def read_local_db(db_dir):
+    """Return {name: {version, builddate, size}} for the packages in a pacman local database."""
+    packages = {}
+    with os.scandir(db_dir) as it:
+        for entry in it:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                package = parse_desc(os.path.join(entry.path, "desc"))
+            except OSError:
+                continue
+            if package["name"] and package["version"]:
+                packages[package.pop("name")] = package
+    return packages
+
+
+def slot_packages(root, slot=None):
+    """Return the installed packages of the system at root, as read_local_db() does.
+
+    With a slot, the result is cached in PACMAN_CACHE_FILE and reused as
+    long as the database directory is unchanged.
+    """
+    db_dir = os.path.join(root, PACMAN_LOCAL_DB)
+    try:
+        st = os.stat(db_dir)
+    except OSError:
+        return {}
+    key = [st.st_ino, st.st_mtime_ns]
+    cache_file = PACMAN_CACHE_FILE.format(slot=slot) if slot else None
+    if cache_file:
+        try:
+            with open(cache_file, "r") as f:
+                cached = json.load(f)
+            if cached.get("key") == key:
+                return cached["packages"]
+        except (OSError, ValueError, KeyError):
+            pass
+    packages = read_local_db(db_dir)
+    if cache_file:
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file + ".tmp", "w") as f:
+                json.dump({"key": key, "packages": packages}, f)
+            os.replace(cache_file + ".tmp", cache_file)
+        except OSError:
+            pass
+    return packages
+
+
+def _isalnum(char):
+    return char.isascii() and char.isalnum()
+
+
+def _rpmvercmp(a, b):
+    """Compare two version segments the way pacman's rpmvercmp does."""
+    if a == b:
+        return 0
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start_a, start_b = i, j
+        while i < len(a) and not _isalnum(a[i]):
+            i += 1
+        while j < len(b) and not _isalnum(b[j]):
+            j += 1
+        if i == len(a) or j == len(b):
+            break
+        # More separators in a row sort higher.
+        if i - start_a != j - start_b:
+            return -1 if i - start_a < j - start_b else 1
+        start_a, start_b = i, j
+        isnum = a[i].isdigit()
+        same_kind = str.isdigit if isnum else str.isalpha
+        while i < len(a) and a[i].isascii() and same_kind(a[i]):
+            i += 1
+        while j < len(b) and b[j].isascii() and same_kind(b[j]):
+            j += 1
+        if j == start_b:
+            # Numeric segments are newer than alphabetic ones.
+            return 1 if isnum else -1
+        seg_a, seg_b = a[start_a:i], b[start_b:j]
+        if isnum:
+            seg_a, seg_b = seg_a.lstrip("0"), seg_b.lstrip("0")
+            if len(seg_a) != len(seg_b):
+                return -1 if len(seg_a) < len(seg_b) else 1
+        if seg_a != seg_b:
+            return -1 if seg_a < seg_b else 1
+    rest_a, rest_b = a[i:], b[j:]
+    if not rest_a and not rest_b:
+        return 0
+    # A trailing alphabetic segment (like 1.0alpha) is older than none.
+    if (not rest_a and not rest_b[0].isalpha()) or (rest_a and rest_a[0].isalpha()):
+        return -1
+    return 1
+
+
+def _split_evr(version):
+    epoch, sep, rest = version.partition(":")
+    if not sep or not (epoch.isdigit() or not epoch):
+        epoch, rest = "0", version
+    epoch = epoch or "0"
+    ver, sep, rel = rest.rpartition("-")
+    return epoch, (ver if sep else rel), (rel if sep else None)
+
+
+def vercmp(a, b):
+    """Compare two pacman versions ([epoch:]version[-pkgrel]) like vercmp(8): -1, 0 or 1."""
+    if a == b:
+        return 0
+    epoch_a, ver_a, rel_a = _split_evr(a)
+    epoch_b, ver_b, rel_b = _split_evr(b)
+    result = _rpmvercmp(epoch_a, epoch_b) or _rpmvercmp(ver_a, ver_b)
+    if result == 0 and rel_a is not None and rel_b is not None:
+        result = _rpmvercmp(rel_a, rel_b)
+    return result
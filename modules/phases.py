@@ -0,0 +1,57 @@
+import os
+import time
+import concurrent.futures
+
+INSTALL_JOBS = min(os.cpu_count() or 1, 4)
+
+
+def run_phase(timings, name, func, *args):
+    """Run func(*args) and record how long it took under name."""
+    start = time.monotonic()
+    result = func(*args)
+    timings.append({"name": name, "seconds": time.monotonic() - start, "group": None})
+    return result
+
+
+def run_concurrent_phases(timings, group, steps, jobs=INSTALL_JOBS):
+    """Run independent (name, func, args) steps, at most jobs at a time.
+
+    Steps must not share state: each works on its own partition and
+    mount point. A step that fails (or exits) fails the whole group once
+    the steps already running have finished.
+    """
+
+    def timed(func, args):
+        start = time.monotonic()
+        func(*args)
+        return time.monotonic() - start
+
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = [(name, executor.submit(timed, func, args)) for name, func, args in steps]
+        for name, future in futures:
+            timings.append({"name": name, "seconds": future.result(), "group": group})
+    timings.append({"name": group, "seconds": time.monotonic() - start, "group": None, "concurrent": True})
+
+
+def print_phase_report(timings):
+    print(f"\n{'Phase':<36} {'Time (s)':>9}")
+    total = 0.0
+    serial = 0.0
+    for entry in timings:
+        if entry["group"] is not None:
+            continue
+        total += entry["seconds"]
+        if not entry.get("concurrent"):
+            serial += entry["seconds"]
+            print(f"{entry['name']:<36} {entry['seconds']:>9.2f}")
+            continue
+        steps = [e for e in timings if e["group"] == entry["name"]]
+        step_total = sum(e["seconds"] for e in steps)
+        serial += step_total
+        print(f"{entry['name'] + ' (concurrent)':<36} {entry['seconds']:>9.2f}  (steps {step_total:.2f})")
+        for step in steps:
+            print(f"  {step['name']:<34} {step['seconds']:>9.2f}")
+    print(f"{'Total':<36} {total:>9.2f}")
+    if serial > total:
+        print(f"Running independent steps concurrently saved {serial - total:.2f} s over {serial:.2f} s serial.")
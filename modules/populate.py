@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+
+def can_populate_offline(fstype):
+    if fstype == "ext4":
+        return shutil.which("mke2fs") is not None
+    if fstype == "f2fs":
+        return shutil.which("mkfs.f2fs") is not None and shutil.which("sload.f2fs") is not None
+    return False
+
+
+def populate_slot_filesystem(part, image, fstype, label):
+    """Format part as fstype with the contents of image already in place.
+
+    The image is loop-mounted read-only and handed to the filesystem's own
+    offline loader (mke2fs -d, sload.f2fs), so the new filesystem is never
+    mounted while it is written and its metadata is laid out in one pass.
+    """
+    image_mount = f"/mnt/obsidian_populate_{label}"
+    run_command(f"mkdir -p {image_mount}")
+    try:
+        run_command(f"mount -o loop,ro {image} {image_mount}")
+        if fstype == "ext4":
+            run_command(f"mke2fs -t ext4 -F -L {label} -d {image_mount} {part}")
+        else:
+            run_command(f"mkfs.f2fs -f -l {label} {part}")
+            run_command(f"sload.f2fs -f {image_mount} -t / -P {part}")
+    finally:
+        run_command(f"umount {image_mount}", check=False)
+        run_command(f"rmdir {image_mount}", check=False)
+
+
+def clone_slot_filesystem(source, target, fstype, label):
+    """Copy the slot filesystem on source to target and give it its own identity.
+
+    ext4 is cloned block-wise with e2image, which reads and writes only
+    the allocated blocks in one sequential pass, and then gets a fresh
+    UUID and label. Other filesystems are copied file by file into the
+    freshly formatted target, which already carries its label.
+    """
+    if fstype == "ext4" and shutil.which("e2image") and shutil.which("tune2fs"):
+        print(f"Cloning allocated blocks of {source} to {target}...")
+        run_command(f"e2image -ra -p {source} {target}")
+        # tune2fs -U wants a freshly checked filesystem when metadata_csum is on.
+        if run_command(f"e2fsck -fy {target}", check=False, capture_output=True).returncode >= 4:
+            print(f"Error: Cloned filesystem on {target} is damaged.", file=sys.stderr)
+            sys.exit(1)
+        run_command(f"tune2fs -U random -L {label} {target}")
+        run_command("udevadm settle", check=False)
+        invalidate_topology()
+        return
+    source_mount_point = "/mnt/obsidian_clone_source"
+    target_mount_point = "/mnt/obsidian_clone_target"
+    run_command(f"mkdir -p {source_mount_point} {target_mount_point}")
+    try:
+        run_command(f"mount {source} {source_mount_point}")
+        run_command(f"mount {target} {target_mount_point}")
+        run_command(
+            f"rsync -aHAX --inplace --delete --info=progress2 {source_mount_point}/ {target_mount_point}/"
+        )
+    finally:
+        run_command(f"umount {source_mount_point}", check=False)
+        run_command(f"umount {target_mount_point}", check=False)
+        run_command(f"rm -r {source_mount_point} {target_mount_point}", check=False)
+
+
+def handle_populate_benchmark(args):
+    checkroot()
+    image = args.image
+    fstype = args.fstype
+    image_format = image_format_or_exit(image)
+    if not can_populate_offline(fstype):
+        print(f"Error: Offline population of {fstype} needs mke2fs or mkfs.f2fs and sload.f2fs.", file=sys.stderr)
+        sys.exit(1)
+
+    work_dir = tempfile.mkdtemp(prefix="obsidianctl_bench_", dir=args.work_dir)
+    backing = os.path.join(work_dir, "slot.img")
+    mount_dir = os.path.join(work_dir, "mnt")
+    os.makedirs(mount_dir)
+    loop_dev = None
+    results = []
+    try:
+        run_command(f"truncate -s {args.size} {backing}")
+        loop_dev = run_command(f"losetup --find --show {backing}", capture_output=True).stdout.strip()
+
+        print(f"Timing mkfs + mount + extract on {loop_dev}...")
+        run_command("sync")
+        start = time.monotonic()
+        run_command(f"mkfs.{fstype} -F -L bench {loop_dev}" if fstype == "ext4" else f"mkfs.f2fs -f -l bench {loop_dev}")
+        run_command(f"mount {loop_dev} {mount_dir}")
+        extract_image(image, mount_dir, image_format)
+        run_command(f"umount {mount_dir}")
+        results.append(("mkfs + mount + extract", time.monotonic() - start))
+
+        print(f"Timing offline population on {loop_dev}...")
+        run_command("sync")
+        start = time.monotonic()
+        populate_slot_filesystem(loop_dev, image, fstype, "bench")
+        run_command("sync")
+        results.append(("populate at mkfs", time.monotonic() - start))
+    finally:
+        if os.path.ismount(mount_dir):
+            run_command(f"umount {mount_dir}", check=False)
+        if loop_dev:
+            run_command(f"losetup -d {loop_dev}", check=False)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'Method':<24} {'Time (s)':>10}")
+    for method, elapsed in results:
+        print(f"{method:<24} {elapsed:>10.2f}")
+    if results[1][1] > 0:
+        print(f"Speedup: {results[0][1] / results[1][1]:.2f}x")
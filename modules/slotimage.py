@@ -0,0 +1,202 @@
+import os
+import re
+import sys
+import shutil
+import hashlib
+
+# Image-mode slots keep the system image as a single file on the root_X
+# partition and boot it as a read-only lower layer with a writable overlay
+# stored next to it, instead of extracting the image file by file.
+SLOT_IMAGE_DIR = ".obsidian"
+SLOT_IMAGE_FILE = f"{SLOT_IMAGE_DIR}/system.img"
+SLOT_UPPER_DIR = f"{SLOT_IMAGE_DIR}/upper"
+SLOT_WORK_DIR = f"{SLOT_IMAGE_DIR}/work"
+SLOT_IMAGE_COPY_BUFFER = 16 * 1024 * 1024
+
+SLOT_IMAGE_HOOK = """#!/usr/bin/ash
+# Installed by obsidianctl: boots an image-mode ObsidianOS slot.
+
+run_hook() {
+    mount_handler="obsidian_image_mount_handler"
+}
+
+obsidian_image_mount_handler() {
+    local newroot="$1" part=/obsidian/part lower=/obsidian/lower label
+    mkdir -p "$part" "$lower"
+    if ! mount -o rw "$root" "$part"; then
+        err "failed to mount the slot partition '$root'"
+        launch_interactive_shell
+    fi
+    if [ ! -f "$part/.obsidian/system.img" ]; then
+        umount "$part"
+        default_mount_handler "$newroot"
+        return
+    fi
+    label="$(blkid -s LABEL -o value "$root")"
+    mkdir -p "$part/.obsidian/upper" "$part/.obsidian/work"
+    mount -o loop,ro "$part/.obsidian/system.img" "$lower"
+    mount -t overlay "${label:-obsidian-image}" \\
+        -o "lowerdir=$lower,upperdir=$part/.obsidian/upper,workdir=$part/.obsidian/work" "$newroot"
+}
+"""
+
+SLOT_IMAGE_INSTALL_HOOK = """#!/bin/bash
+# Installed by obsidianctl: boots an image-mode ObsidianOS slot.
+
+build() {
+    add_module loop
+    add_module overlay
+    add_module 'squashfs?'
+    add_module 'erofs?'
+    add_binary blkid
+    add_runscript
+}
+
+help() {
+    cat <<HELPEOF
+Mounts the ObsidianOS slot partition, loop-mounts .obsidian/system.img
+read-only and boots an overlay with a writable layer on the same partition.
+HELPEOF
+}
+"""
+
+
+def _slot_part_dirs(target):
+    name = os.path.basename(target.rstrip("/"))
+    return f"/mnt/obsidian_part_{name}", f"/mnt/obsidian_lower_{name}"
+
+
+def _mount_slot_overlay(part_mount, lower, target, label, read_only=False):
+    upper = f"{part_mount}/{SLOT_UPPER_DIR}"
+    if read_only:
+        run_command(f"mkdir -p {lower} {target}")
+    else:
+        run_command(f"mkdir -p {lower} {upper} {part_mount}/{SLOT_WORK_DIR} {target}")
+    run_command(f"mount -o loop,ro {part_mount}/{SLOT_IMAGE_FILE} {lower}")
+    if read_only:
+        # Stacking the upper directory as a lower layer gives the same view
+        # without writing to it, so this works even while the running
+        # system uses that directory as its own upper layer.
+        lowerdirs = f"{upper}:{lower}" if os.path.isdir(upper) else lower
+        run_command(f"mount -t overlay {label} -o ro,lowerdir={lowerdirs} {target}")
+    else:
+        run_command(
+            f"mount -t overlay {label} -o lowerdir={lower},upperdir={upper},"
+            f"workdir={part_mount}/{SLOT_WORK_DIR} {target}"
+        )
+
+
+def mount_slot_root(part, target, label="obsidian-image", read_only=False):
+    """Mount a slot's root filesystem at target.
+
+    Image-mode slots are assembled from their image and overlay the same
+    way the initramfs does it, other slots are bind-mounted as they are.
+    Commands that only read the slot should pass read_only. Pair with
+    umount_slot_root().
+    """
+    part_mount, lower = _slot_part_dirs(target)
+    run_command(f"mkdir -p {part_mount} {target}")
+    run_command(f"mount {'-o ro ' if read_only else ''}{part} {part_mount}")
+    if os.path.exists(os.path.join(part_mount, SLOT_IMAGE_FILE)):
+        _mount_slot_overlay(part_mount, lower, target, label, read_only)
+    else:
+        run_command(f"mount --bind {part_mount} {target}")
+
+
+def slot_part_root(target):
+    """Return where the slot partition behind target is mounted.
+
+    That is target itself, unless the slot was mounted with
+    mount_slot_root() or install_slot_image().
+    """
+    part_mount, _ = _slot_part_dirs(target)
+    return part_mount if os.path.ismount(part_mount) else target
+
+
+def umount_slot_root(target):
+    part_mount, lower = _slot_part_dirs(target)
+    if os.path.ismount(target):
+        run_command(f"umount -R {target}", check=False)
+    for path in (lower, part_mount):
+        if os.path.ismount(path):
+            run_command(f"umount {path}", check=False)
+        if os.path.isdir(path):
+            run_command(f"rmdir {path}", check=False)
+
+
+def install_slot_image(part, image, target, label, fetch=None):
+    """Write image sequentially to the slot partition and mount it at target.
+
+    If fetch is given, it is called with the destination path to write the
+    image there itself (e.g. straight from the network) instead of copying.
+    Returns the image's SHA256, as returned by fetch or hashed while copying.
+    """
+    part_mount, lower = _slot_part_dirs(target)
+    run_command(f"mkdir -p {part_mount}")
+    run_command(f"mount {part} {part_mount}")
+    dest = os.path.join(part_mount, SLOT_IMAGE_FILE)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    for stale in (SLOT_UPPER_DIR, SLOT_WORK_DIR):
+        shutil.rmtree(os.path.join(part_mount, stale), ignore_errors=True)
+    if fetch is not None:
+        digest = fetch(dest)
+        image_format_or_exit(dest, need=None)
+    else:
+        hasher = hashlib.sha256()
+        with open(image, "rb") as src, open(dest, "wb") as dst:
+            for chunk in iter(lambda: src.read(SLOT_IMAGE_COPY_BUFFER), b""):
+                hasher.update(chunk)
+                dst.write(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+        digest = hasher.hexdigest()
+    _mount_slot_overlay(part_mount, lower, target, label)
+    return digest
+
+
+def check_image_mode_supported(root_dir):
+    conf_path = os.path.join(root_dir, "etc/mkinitcpio.conf")
+    if not os.path.exists(os.path.join(root_dir, "usr/bin/mkinitcpio")) or not os.path.exists(conf_path):
+        print(
+            "Error: Image mode needs mkinitcpio in the system image to boot the slot image.",
+            file=sys.stderr,
+        )
+        return False
+    with open(conf_path, "r") as f:
+        hooks = re.search(r"^HOOKS=\((.*?)\)", f.read(), re.MULTILINE)
+    hooks = hooks.group(1).split() if hooks else []
+    if "systemd" in hooks or "filesystems" not in hooks:
+        print(
+            "Error: Image mode needs a busybox-based initramfs (HOOKS with 'filesystems' and without 'systemd').",
+            file=sys.stderr,
+        )
+        return False
+    return True
+
+
+def enable_image_mode_boot(root_dir):
+    """Add the obsidian-image initramfs hook to the tree and rebuild the initramfs."""
+    hooks_dir = os.path.join(root_dir, "etc/initcpio/hooks")
+    install_dir = os.path.join(root_dir, "etc/initcpio/install")
+    os.makedirs(hooks_dir, exist_ok=True)
+    os.makedirs(install_dir, exist_ok=True)
+    with open(os.path.join(hooks_dir, "obsidian-image"), "w") as f:
+        f.write(SLOT_IMAGE_HOOK)
+    with open(os.path.join(install_dir, "obsidian-image"), "w") as f:
+        f.write(SLOT_IMAGE_INSTALL_HOOK)
+
+    conf_path = os.path.join(root_dir, "etc/mkinitcpio.conf")
+    with open(conf_path, "r") as f:
+        conf = f.read()
+    if "obsidian-image" not in conf:
+        conf = re.sub(
+            r"^(HOOKS=\(.*?\bfilesystems\b)",
+            r"\1 obsidian-image",
+            conf,
+            count=1,
+            flags=re.MULTILINE,
+        )
+        with open(conf_path, "w") as f:
+            f.write(conf)
+    print("Rebuilding initramfs with the obsidian-image hook...")
+    _chroot(root_dir, "mkinitcpio -P")
@@ -0,0 +1,428 @@
+import os
+import sys
+import stat
+import struct
+import zlib
+import lzma
+from collections import OrderedDict
+
+SQUASHFS_MAGIC = 0x73717368
+SQUASHFS_INVALID_FRAG = 0xFFFFFFFF
+SQUASHFS_METADATA_SIZE = 8192
+SQUASHFS_BLOCK_CACHE = 32
+SQUASHFS_COMPRESSORS = {1: "gzip", 2: "lzma", 3: "lzo", 4: "xz", 5: "lz4", 6: "zstd"}
+
+# Basic and extended inode types share the same file type, the extended
+# variants only add link counts, xattrs and 64-bit sizes.
+_SQFS_DIR = (1, 8)
+_SQFS_REG = (2, 9)
+_SQFS_LNK = (3, 10)
+_SQFS_MODE_BITS = {
+    1: stat.S_IFDIR, 2: stat.S_IFREG, 3: stat.S_IFLNK, 4: stat.S_IFBLK,
+    5: stat.S_IFCHR, 6: stat.S_IFIFO, 7: stat.S_IFSOCK,
+}
+
+
+def _sqfs_decompressor(comp_id):
+    name = SQUASHFS_COMPRESSORS.get(comp_id, str(comp_id))
+    if name == "gzip":
+        return zlib.decompress
+    if name == "xz":
+        return lambda data: lzma.decompress(data, format=lzma.FORMAT_XZ)
+    if name == "lzma":
+        return lambda data: lzma.decompress(data, format=lzma.FORMAT_ALONE)
+    if name == "zstd":
+        try:
+            from compression import zstd
+            return zstd.decompress
+        except ImportError:
+            pass
+        try:
+            import zstandard
+            return lambda data: zstandard.ZstdDecompressor().decompress(
+                data, max_output_size=1 << 20
+            )
+        except ImportError:
+            pass
+    if name == "lz4":
+        try:
+            import lz4.block
+            return lambda data: lz4.block.decompress(data, uncompressed_size=1 << 20)
+        except ImportError:
+            pass
+    return None
+
+
+class SquashFSError(Exception):
+    pass
+
+
+class SquashFSImage:
+    """Read-only access to a SquashFS 4.0 image without mounting it.
+
+    Tables are only read when first needed and data blocks go through a
+    small LRU cache, so listing a directory or reading one file touches a
+    handful of blocks regardless of the image size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "rb")
+        self._size = os.fstat(self._f.fileno()).st_size
+        sb = self._f.read(96)
+        if len(sb) < 96:
+            self._f.close()
+            raise SquashFSError(f"{path}: too small to be a SquashFS image")
+        (
+            magic, self.inode_count, self.mkfs_time, self.block_size,
+            self.fragment_count, self.compression_id, _block_log, self.flags,
+            self.id_count, major, minor, self.root_inode_ref, self.bytes_used,
+            self.id_table_start, _xattr_start, self.inode_table_start,
+            self.directory_table_start, self.fragment_table_start, _export_start,
+        ) = struct.unpack("<IIIIIHHHHHHQQQQQQQQ", sb)
+        if magic != SQUASHFS_MAGIC:
+            self._f.close()
+            raise SquashFSError(f"{path}: not a SquashFS image")
+        if major != 4:
+            self._f.close()
+            raise SquashFSError(f"{path}: unsupported SquashFS version {major}.{minor}")
+        if not 4096 <= self.block_size <= 1024 * 1024 or self.block_size & (self.block_size - 1):
+            self._f.close()
+            raise SquashFSError(f"{path}: invalid block size {self.block_size}")
+        self.compression = SQUASHFS_COMPRESSORS.get(self.compression_id, "unknown")
+        self._decompress = _sqfs_decompressor(self.compression_id)
+        self._meta_cache = {}
+        self._block_cache = OrderedDict()
+        self._ids = None
+        self._fragments = None
+        self._root = None
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _inflate(self, data):
+        if self._decompress is None:
+            raise SquashFSError(
+                f"{self.path}: {self.compression} compression is not supported by this Python"
+            )
+        try:
+            return self._decompress(data)
+        except Exception as e:
+            # zlib, lzma, zstd and lz4 each raise their own error type.
+            raise SquashFSError(f"{self.path}: corrupted {self.compression} block ({e})") from e
+
+    def _read_at(self, pos, size):
+        if pos + size > self._size:
+            raise SquashFSError(f"{self.path}: truncated image")
+        self._f.seek(pos)
+        data = self._f.read(size)
+        if len(data) != size:
+            raise SquashFSError(f"{self.path}: truncated image")
+        return data
+
+    def _metadata_block(self, pos):
+        cached = self._meta_cache.get(pos)
+        if cached is None:
+            (header,) = struct.unpack("<H", self._read_at(pos, 2))
+            size = header & 0x7FFF
+            data = self._read_at(pos + 2, size)
+            if not header & 0x8000:
+                data = self._inflate(data)
+            cached = (data, pos + 2 + size)
+            self._meta_cache[pos] = cached
+        return cached
+
+    def _read_metadata(self, pos, offset, size):
+        out = bytearray()
+        while len(out) < size:
+            data, next_pos = self._metadata_block(pos)
+            chunk = data[offset:offset + size - len(out)]
+            out += chunk
+            offset += len(chunk)
+            if offset >= len(data):
+                pos, offset = next_pos, 0
+        return bytes(out), pos, offset
+
+    def _read_table(self, start, count, entry_size):
+        if count == 0:
+            return b""
+        total = count * entry_size
+        nblocks = (total + SQUASHFS_METADATA_SIZE - 1) // SQUASHFS_METADATA_SIZE
+        pointers = struct.unpack(f"<{nblocks}Q", self._read_at(start, 8 * nblocks))
+        data = bytearray()
+        for pointer in pointers:
+            data += self._metadata_block(pointer)[0]
+        if len(data) < total:
+            raise SquashFSError(f"{self.path}: truncated table at {start}")
+        return bytes(data[:total])
+
+    def _id(self, index):
+        if self._ids is None:
+            raw = self._read_table(self.id_table_start, self.id_count, 4)
+            self._ids = struct.unpack(f"<{self.id_count}I", raw)
+        if index >= len(self._ids):
+            raise SquashFSError(f"{self.path}: invalid id index {index}")
+        return self._ids[index]
+
+    def _fragment(self, index):
+        if self._fragments is None:
+            raw = self._read_table(self.fragment_table_start, self.fragment_count, 16)
+            self._fragments = [
+                struct.unpack_from("<QI", raw, i * 16) for i in range(self.fragment_count)
+            ]
+        if index >= len(self._fragments):
+            raise SquashFSError(f"{self.path}: invalid fragment index {index}")
+        return self._fragments[index]
+
+    def _data_block(self, pos, size_field):
+        key = (pos, size_field)
+        data = self._block_cache.get(key)
+        if data is not None:
+            self._block_cache.move_to_end(key)
+            return data
+        size = size_field & 0xFFFFFF
+        data = self._read_at(pos, size)
+        if not size_field & 0x1000000:
+            data = self._inflate(data)
+        self._block_cache[key] = data
+        if len(self._block_cache) > SQUASHFS_BLOCK_CACHE:
+            self._block_cache.popitem(last=False)
+        return data
+
+    def _inode(self, ref):
+        pos = self.inode_table_start + (ref >> 16)
+        raw, pos, off = self._read_metadata(pos, ref & 0xFFFF, 16)
+        itype, perms, uid_idx, gid_idx, mtime, number = struct.unpack("<HHHHII", raw)
+        if not 1 <= itype <= 14:
+            raise SquashFSError(f"{self.path}: invalid inode type {itype}")
+        inode = {
+            "type": itype,
+            "mode": _SQFS_MODE_BITS[(itype - 1) % 7 + 1] | (perms & 0o7777),
+            "uid": self._id(uid_idx),
+            "gid": self._id(gid_idx),
+            "mtime": mtime,
+            "inode": number,
+            "size": 0,
+        }
+        if itype == 1:
+            raw, pos, off = self._read_metadata(pos, off, 16)
+            dir_start, _nlink, size, dir_off, _parent = struct.unpack("<IIHHI", raw)
+            inode.update(dir_start=dir_start, dir_offset=dir_off, size=size)
+        elif itype == 8:
+            raw, pos, off = self._read_metadata(pos, off, 24)
+            _nlink, size, dir_start, _parent, _icount, dir_off, _xattr = struct.unpack(
+                "<IIIIHHI", raw
+            )
+            inode.update(dir_start=dir_start, dir_offset=dir_off, size=size)
+        elif itype in _SQFS_REG:
+            if itype == 2:
+                raw, pos, off = self._read_metadata(pos, off, 16)
+                start, frag, frag_off, size = struct.unpack("<IIII", raw)
+            else:
+                raw, pos, off = self._read_metadata(pos, off, 40)
+                start, size, _sparse, _nlink, frag, frag_off, _xattr = struct.unpack(
+                    "<QQQIIII", raw
+                )
+            nblocks = size // self.block_size
+            if frag == SQUASHFS_INVALID_FRAG and size % self.block_size:
+                nblocks += 1
+            raw, pos, off = self._read_metadata(pos, off, 4 * nblocks)
+            inode.update(
+                size=size,
+                blocks_start=start,
+                block_sizes=struct.unpack(f"<{nblocks}I", raw),
+                fragment=frag,
+                fragment_offset=frag_off,
+            )
+        elif itype in _SQFS_LNK:
+            raw, pos, off = self._read_metadata(pos, off, 8)
+            _nlink, target_size = struct.unpack("<II", raw)
+            target, pos, off = self._read_metadata(pos, off, target_size)
+            inode.update(size=target_size, target=os.fsdecode(target))
+        return inode
+
+    def _entries(self, inode):
+        # The stored size counts the implicit "." and ".." entries.
+        remaining = inode["size"] - 3
+        pos = self.directory_table_start + inode["dir_start"]
+        off = inode["dir_offset"]
+        while remaining > 0:
+            raw, pos, off = self._read_metadata(pos, off, 12)
+            count, start, base = struct.unpack("<III", raw)
+            remaining -= 12
+            for _ in range(count + 1):
+                raw, pos, off = self._read_metadata(pos, off, 8)
+                entry_off, _delta, _itype, name_size = struct.unpack("<HhHH", raw)
+                name, pos, off = self._read_metadata(pos, off, name_size + 1)
+                remaining -= 8 + name_size + 1
+                yield os.fsdecode(name), (start << 16) | entry_off
+
+    def _root_inode(self):
+        if self._root is None:
+            self._root = self._inode(self.root_inode_ref)
+            if self._root["type"] not in _SQFS_DIR:
+                raise SquashFSError(f"{self.path}: root inode is not a directory")
+        return self._root
+
+    def lookup(self, path):
+        inode = self._root_inode()
+        for part in [p for p in path.split("/") if p and p != "."]:
+            if inode["type"] not in _SQFS_DIR:
+                raise NotADirectoryError(path)
+            for name, ref in self._entries(inode):
+                if name == part:
+                    inode = self._inode(ref)
+                    break
+            else:
+                raise FileNotFoundError(path)
+        return inode
+
+    def exists(self, path):
+        try:
+            self.lookup(path)
+            return True
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+
+    def stat(self, path):
+        inode = self.lookup(path)
+        return {k: inode[k] for k in ("mode", "uid", "gid", "mtime", "size", "inode")}
+
+    def listdir(self, path="/"):
+        inode = self.lookup(path)
+        if inode["type"] not in _SQFS_DIR:
+            raise NotADirectoryError(path)
+        return [name for name, _ in self._entries(inode)]
+
+    def readlink(self, path):
+        inode = self.lookup(path)
+        if inode["type"] not in _SQFS_LNK:
+            raise OSError(f"{path}: not a symlink")
+        return inode["target"]
+
+    def walk(self, path="/"):
+        """Yield (dirpath, dirnames, filenames) like os.walk, top-down."""
+        top = self.lookup(path)
+        if top["type"] not in _SQFS_DIR:
+            raise NotADirectoryError(path)
+        stack = [(path.rstrip("/") or "/", top)]
+        seen = set()
+        while stack:
+            dirpath, inode = stack.pop()
+            # Directories cannot be hard linked, so meeting one twice
+            # means the tables point in a circle.
+            if inode["inode"] in seen:
+                raise SquashFSError(f"{self.path}: directory loop at {dirpath}")
+            seen.add(inode["inode"])
+            dirnames, filenames, subdirs = [], [], []
+            for name, ref in self._entries(inode):
+                child = self._inode(ref)
+                if child["type"] in _SQFS_DIR:
+                    dirnames.append(name)
+                    subdirs.append((os.path.join(dirpath, name), child))
+                else:
+                    filenames.append(name)
+            yield dirpath, dirnames, filenames
+            stack.extend(reversed(subdirs))
+
+    def iter_file(self, path):
+        """Stream the contents of a regular file one block at a time."""
+        inode = self.lookup(path)
+        if inode["type"] in _SQFS_DIR:
+            raise IsADirectoryError(path)
+        if inode["type"] not in _SQFS_REG:
+            raise OSError(f"{path}: not a regular file")
+        remaining = inode["size"]
+        pos = inode["blocks_start"]
+        for size_field in inode["block_sizes"]:
+            if size_field & 0xFFFFFF == 0:
+                data = bytes(min(self.block_size, remaining))
+            else:
+                data = self._data_block(pos, size_field)[:remaining]
+                pos += size_field & 0xFFFFFF
+            remaining -= len(data)
+            yield data
+        if remaining and inode["fragment"] != SQUASHFS_INVALID_FRAG:
+            frag_pos, frag_size = self._fragment(inode["fragment"])
+            block = self._data_block(frag_pos, frag_size)
+            yield block[inode["fragment_offset"]:inode["fragment_offset"] + remaining]
+
+    def read_file(self, path):
+        return b"".join(self.iter_file(path))
+
+
+def is_squashfs_image(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == struct.pack("<I", SQUASHFS_MAGIC)
+    except OSError:
+        return False
+
+
+def sqfs_kernel_version(image, boot_dir="/boot"):
+    if not image.exists(boot_dir):
+        return "unknown"
+    for name in sorted(image.listdir(boot_dir)):
+        if name.startswith("vmlinuz"):
+            return name.replace("vmlinuz-", "")
+    return "unknown"
+
+
+def sqfs_packages(image, pacman_dir="/var/lib/pacman/local"):
+    if not image.exists(pacman_dir):
+        return []
+    return sorted(image.listdir(pacman_dir))
+
+
+def describe_image(path):
+    """One-line summary of a SquashFS image, or None if it cannot be read."""
+    if not is_squashfs_image(path):
+        return None
+    try:
+        with SquashFSImage(path) as image:
+            kernel = sqfs_kernel_version(image)
+            packages = sqfs_packages(image)
+    except (OSError, SquashFSError, struct.error):
+        return None
+    return f"kernel {kernel}, {len(packages)} packages"
+
+
+def handle_inspect_image(args):
+    try:
+        image = SquashFSImage(args.image)
+    except (OSError, SquashFSError, struct.error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    with image:
+        try:
+            if args.cat:
+                for chunk in image.iter_file(args.cat):
+                    sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+                return
+            if args.ls:
+                for name in sorted(image.listdir(args.ls)):
+                    st = image.stat(os.path.join(args.ls, name))
+                    print(f"{stat.filemode(st['mode'])} {st['uid']:>5} {st['gid']:>5} {st['size']:>12} {name}")
+                return
+            packages = sqfs_packages(image)
+            kernel = sqfs_kernel_version(image)
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError) as e:
+            print(f"Error: '{e}' not found in {args.image} or has the wrong type.", file=sys.stderr)
+            sys.exit(1)
+        except (OSError, SquashFSError, struct.error) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Image: {args.image}")
+        print(f"Compression: {image.compression}")
+        print(f"Block size: {image.block_size // 1024} KiB")
+        print(f"Inodes: {image.inode_count}")
+        print(f"Size: {image.bytes_used / (1024*1024):.1f} MB")
+        print(f"Kernel: {kernel}")
+        print(f"Packages: {len(packages)}")
@@ -1,4 +1,133 @@
+import os
+import json
+import time
+
+# Read by status from /proc and /sys, so it runs without child processes.
+PROC_UPTIME = "/proc/uptime"
+PROC_MEMINFO = "/proc/meminfo"
+PROC_CPUINFO = "/proc/cpuinfo"
+
+
+def format_uptime(seconds):
+    """Format seconds like uptime -p, without the leading "up"."""
+    minutes = int(seconds) // 60
+    parts = []
+    for unit, length in (("week", 7 * 24 * 60), ("day", 24 * 60), ("hour", 60), ("minute", 1)):
+        value, minutes = divmod(minutes, length)
+        if value:
+            parts.append(f"{value} {unit}{'s' if value != 1 else ''}")
+    return ", ".join(parts) or "0 minutes"
+
+
+def format_mem_size(size):
+    """Format a byte count like free -h."""
+    value = float(size)
+    for unit in ("B", "Ki", "Mi", "Gi", "Ti"):
+        if value < 1024 or unit == "Ti":
+            break
+        value /= 1024
+    if unit == "B":
+        return f"{int(value)}B"
+    return f"{value:.1f}{unit}" if value < 10 else f"{value:.0f}{unit}"
+
+
+def _read_text(path):
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _read_meminfo():
+    fields = {}
+    for line in _read_text(PROC_MEMINFO).splitlines():
+        key, _, value = line.partition(":")
+        parts = value.split()
+        if parts and parts[0].isdigit():
+            fields[key] = int(parts[0]) * 1024
+    if "MemTotal" not in fields:
+        return None
+    available = fields.get("MemAvailable", fields.get("MemFree", 0))
+    return {"total": fields["MemTotal"], "used": fields["MemTotal"] - available, "available": available}
+
+
+def _read_cpu_model():
+    for line in _read_text(PROC_CPUINFO).splitlines():
+        key, _, value = line.partition(":")
+        if key.strip() in ("model name", "Model", "cpu model"):
+            return value.strip()
+    return None
+
+
+def _read_os_name():
+    for line in _read_text("/etc/os-release").splitlines():
+        key, _, value = line.partition("=")
+        if key == "PRETTY_NAME":
+            return value.strip().strip('"')
+    return "GNU/Linux"
+
+
+def _partition_table():
+    topology = block_topology()
+    rows = []
+    for name, device in sorted(topology["devices"].items(), key=lambda item: (item[1]["disk"], item[0])):
+        if name.startswith(("loop", "ram", "zram")) and not device.get("label"):
+            continue
+        mountpoints = device_mountpoints(f"/dev/{name}")
+        rows.append({
+            "name": name,
+            "disk": device["disk"],
+            "label": device.get("label"),
+            "size": device["size"],
+            "mountpoint": min(mountpoints, key=len) if mountpoints else None,
+        })
+    return rows
+
+
+def collect_status():
+    """Gather everything status shows from /proc, /sys and efivarfs."""
+    boot = boot_environment()
+    uptime = _read_text(PROC_UPTIME).split()
+    hostname = _read_text("/etc/hostname").strip() or os.uname().nodename
+    return {
+        "bootloader": boot["loader"] or ("grub" if boot["grub"] else None),
+        "loader_info": boot["loader_info"],
+        "current_slot": get_current_slot(),
+        "current_entry": boot["current_entry"],
+        "default_entry": boot["default_entry"],
+        "oneshot_entry": boot["oneshot_entry"],
+        "kernel": os.uname().release,
+        "uptime_seconds": float(uptime[0]) if uptime else 0.0,
+        "os": _read_os_name(),
+        "hostname": hostname,
+        "cpu": _read_cpu_model(),
+        "memory": _read_meminfo(),
+        "partitions": _partition_table(),
+    }
+
+
+def handle_status_benchmark(iterations):
+    """Time cold status and get-current-slot lookups, rescanning every run."""
+    for name, func in (("status", collect_status), ("get-current-slot", get_current_slot)):
+        samples = []
+        for _ in range(max(iterations, 1)):
+            invalidate_topology()
+            invalidate_boot_environment()
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        print(
+            f"{name:<18} median {samples[len(samples) // 2]:7.2f} ms  "
+            f"min {samples[0]:7.2f} ms  max {samples[-1]:7.2f} ms  ({len(samples)} runs)"
+        )
+
+
 def handle_status(args):
+    if args.benchmark:
+        handle_status_benchmark(args.benchmark)
+        return
     logo = [
         "\033[0;36m *+++%\033[0;37m        ",
         "\033[0;36m****##%\033[0;37m       ",
@@ -9,42 +138,29 @@ def handle_status(args):
         "     \033[0;35m@ ######\033[0;37m ",
         "        \033[0;35m###%\033[0;37m  ",
     ]
+    status = collect_status()
+    if args.json:
+        print(json.dumps(status, indent=2))
+        return
     info = {}
-    if is_systemd_boot():
-        info["Bootloader"] = "systemd-boot"
-    elif is_grub_active():
+    if status["bootloader"] == "systemd-boot":
+        info["Bootloader"] = status["loader_info"]
+    elif status["bootloader"] == "grub":
         info["Bootloader"] = "GRUB"
     else:
         info["Bootloader"] = "Unknown"
-    info["Current Slot"] = get_current_slot()
-    info["Kernel"] = run_command(
-        "uname -r", capture_output=True, text=True
-    ).stdout.strip()
-    info["Uptime"] = (
-        run_command("uptime -p", capture_output=True, text=True)
-        .stdout.strip()
-        .replace("up ", "")
-    )
-    try:
-        with open("/etc/os-release") as f:
-            os_release = dict(line.strip().split("=", 1) for line in f if "=" in line)
-        info["OS"] = os_release.get("PRETTY_NAME", "GNU/Linux").strip('"')
-    except FileNotFoundError:
-        info["OS"] = "GNU/Linux"
-
-    info["Hostname"] = run_command(
-        "cat /etc/hostname", capture_output=True, text=True
-    ).stdout.strip()
-    cpu_info = run_command("lscpu", capture_output=True, text=True).stdout
-    cpu_model_match = re.search(r"Model name:\s+(.*)", cpu_info)
-    if cpu_model_match:
-        info["CPU"] = cpu_model_match.group(1).strip()
-
-    mem_info = run_command("free -h", capture_output=True, text=True).stdout
-    mem_line = mem_info.split("\n")[1]
-    mem_parts = mem_line.split()
-    if len(mem_parts) >= 3:
-        info["Memory"] = f"{mem_parts[2]} / {mem_parts[1]}"
+    info["Current Slot"] = status["current_slot"]
+    if status["default_entry"]:
+        info["Default Entry"] = status["default_entry"]
+    info["Kernel"] = status["kernel"]
+    info["Uptime"] = format_uptime(status["uptime_seconds"])
+    info["OS"] = status["os"]
+    info["Hostname"] = status["hostname"]
+    if status["cpu"]:
+        info["CPU"] = status["cpu"]
+    memory = status["memory"]
+    if memory:
+        info["Memory"] = f"{format_mem_size(memory['used'])} / {format_mem_size(memory['total'])}"
 
     max_logo_width = max(len(line) for line in logo)
     for i in range(max(len(logo), len(info))):
@@ -57,4 +173,6 @@ def handle_status(args):
 
         print(f"{logo_line}  {info_line}")
     print("\n\033[1mPartition Information:\033[0m")
-    run_command("lsblk -o NAME,LABEL,SIZE,MOUNTPOINT")
+    print(f"{'NAME':<12} {'LABEL':<10} {'SIZE':>7} MOUNTPOINT")
+    for part in status["partitions"]:
+        print(f"{part['name']:<12} {part['label'] or '':<10} {format_mem_size(part['size']):>7} {part['mountpoint'] or ''}")
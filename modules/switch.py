@@ -21,6 +21,10 @@ def handle_switch(args):
             )
             sys.exit(1)
 
+        if set_loader_entry("LoaderEntryDefault", f"obsidian-{slot}.conf"):
+            print(f"Default boot entry set to obsidian-{slot}.conf.")
+            return
+
         esp_mount_dir = "/mnt/obsidian_esp_tmp"
         run_command(f"mkdir -p {esp_mount_dir}")
         try:
@@ -76,6 +80,10 @@ def handle_switchonce(args):
             )
             sys.exit(1)
 
+        if set_loader_entry("LoaderEntryOneShot", f"obsidian-{slot}.conf"):
+            print(f"Boot entry for the next boot set to obsidian-{slot}.conf.")
+            return
+
         esp_mount_dir = "/mnt/obsidian_esp_tmp"
         run_command(f"mkdir -p {esp_mount_dir}")
         try:
@@ -51,6 +51,13 @@ def handle_sync(args):
     run_command(f"mkdir -p {source_mount_point} {target_mount_point}")
     try:
         run_command(f"mount {source_root_dev} {source_mount_point}")
+        if os.path.exists(os.path.join(source_mount_point, SLOT_IMAGE_FILE)):
+            print(
+                f"Error: Slot {current_slot} is an image-mode slot and cannot be synced file by file. "
+                f"Use 'update --image-mode' to install the same image into slot {target_slot}.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
         run_command(f"mount {target_root_dev} {target_mount_point}")
         run_command(
             f"rsync -aHAX --delete --info=progress2 {source_mount_point}/ {target_mount_point}/"
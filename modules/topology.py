@@ -0,0 +1,175 @@
+import os
+import re
+
+# Block devices, their labels and the mount table, read straight from
+# sysfs, /proc and the udev database instead of forking lsblk, findmnt and
+# blkid for every lookup. Built once per process; call
+# invalidate_topology() after partitioning, formatting or relabelling.
+SYS_BLOCK_DIR = "/sys/class/block"
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+UDEV_DATA_DIR = "/run/udev/data"
+# udev properties per topology key, the escaped form first. Read per
+# device, so two disks carrying the same labels both keep theirs; the
+# /dev/disk symlinks below only name one of them.
+UDEV_PROPERTIES = {
+    "label": ("ID_FS_LABEL_ENC", "ID_FS_LABEL"),
+    "uuid": ("ID_FS_UUID_ENC", "ID_FS_UUID"),
+    "partuuid": ("ID_PART_ENTRY_UUID",),
+    "partlabel": ("ID_PART_ENTRY_NAME",),
+}
+DISK_BY_DIRS = {
+    "label": "/dev/disk/by-label",
+    "uuid": "/dev/disk/by-uuid",
+    "partuuid": "/dev/disk/by-partuuid",
+    "partlabel": "/dev/disk/by-partlabel",
+}
+
+_topology = None
+
+
+def _unescape_udev(name):
+    return re.sub(r"\\x([0-9a-fA-F]{2})", lambda m: chr(int(m.group(1), 16)), name)
+
+
+def _unescape_mountinfo(field):
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+
+def _udev_properties(devnum):
+    properties = {}
+    try:
+        with open(os.path.join(UDEV_DATA_DIR, f"b{devnum}"), "r", errors="replace") as f:
+            for line in f:
+                if line.startswith("E:") and "=" in line:
+                    key, _, value = line[2:].rstrip("\n").partition("=")
+                    properties[key] = value
+    except OSError:
+        pass
+    return properties
+
+
+def _scan_topology():
+    devices = {}
+    try:
+        names = os.listdir(SYS_BLOCK_DIR)
+    except OSError:
+        names = []
+    for name in names:
+        path = os.path.join(SYS_BLOCK_DIR, name)
+        try:
+            with open(os.path.join(path, "dev"), "r") as f:
+                devnum = f.read().strip()
+        except OSError:
+            continue
+        try:
+            with open(os.path.join(path, "size"), "r") as f:
+                size = int(f.read()) * 512
+        except (OSError, ValueError):
+            size = 0
+        disk = name
+        if os.path.exists(os.path.join(path, "partition")):
+            disk = os.path.basename(os.path.dirname(os.path.realpath(path)))
+        info = {"devnum": devnum, "disk": disk, "size": size}
+        properties = _udev_properties(devnum)
+        for key, names in UDEV_PROPERTIES.items():
+            value = next((properties[prop] for prop in names if properties.get(prop)), None)
+            if value:
+                info[key] = _unescape_udev(value)
+        devices[name] = info
+
+    # Without a udev database (early boot, containers) fall back to the
+    # symlinks for whatever the database did not provide.
+    for key, directory in DISK_BY_DIRS.items():
+        try:
+            entries = os.listdir(directory)
+        except OSError:
+            continue
+        for entry in entries:
+            name = os.path.basename(os.path.realpath(os.path.join(directory, entry)))
+            if name in devices:
+                devices[name].setdefault(key, _unescape_udev(entry))
+
+    mounts = {}
+    try:
+        with open(MOUNTINFO_PATH, "r") as f:
+            for line in f:
+                fields = line.split()
+                sep = fields.index("-")
+                # Later entries are mounted on top of earlier ones.
+                mounts[_unescape_mountinfo(fields[4])] = {
+                    "devnum": fields[2],
+                    "options": fields[5].split(","),
+                    "fstype": fields[sep + 1],
+                    "source": _unescape_mountinfo(fields[sep + 2]),
+                }
+    except (OSError, ValueError, IndexError):
+        pass
+
+    by_devnum = {info["devnum"]: name for name, info in devices.items()}
+    return {"devices": devices, "mounts": mounts, "by_devnum": by_devnum}
+
+
+def block_topology():
+    global _topology
+    if _topology is None:
+        _topology = _scan_topology()
+    return _topology
+
+
+def invalidate_topology():
+    global _topology
+    _topology = None
+
+
+def device_info(device):
+    """Return the topology record (label, uuid, disk, ...) of a /dev path."""
+    name = os.path.basename(os.path.realpath(device))
+    return block_topology()["devices"].get(name)
+
+
+def find_label(label, disk=None):
+    """Return the /dev path of the partition labelled label, optionally only on disk."""
+    disk_name = os.path.basename(os.path.realpath(disk)) if disk else None
+    for name, info in block_topology()["devices"].items():
+        if info.get("label") == label and (disk_name is None or info["disk"] == disk_name):
+            return f"/dev/{name}"
+    return None
+
+
+def disk_partitions(disk):
+    """Return the /dev paths of the partitions on disk."""
+    disk_name = os.path.basename(os.path.realpath(disk))
+    return sorted(
+        f"/dev/{name}"
+        for name, info in block_topology()["devices"].items()
+        if info["disk"] == disk_name and name != disk_name
+    )
+
+
+def parent_disk(device):
+    info = device_info(device)
+    return f"/dev/{info['disk']}" if info else None
+
+
+def device_mountpoints(device):
+    """Return the mountpoints of the block device at a /dev path."""
+    info = device_info(device)
+    if info is None:
+        return []
+    return [mountpoint for mountpoint, mount in block_topology()["mounts"].items() if mount["devnum"] == info["devnum"]]
+
+
+def mount_info(mountpoint="/"):
+    return block_topology()["mounts"].get(mountpoint)
+
+
+def mount_device(mountpoint="/"):
+    """Return the /dev path of the block device mounted at mountpoint, if any."""
+    info = mount_info(mountpoint)
+    if info is None:
+        return None
+    name = block_topology()["by_devnum"].get(info["devnum"])
+    if name:
+        return f"/dev/{name}"
+    # Image-mode roots are overlays named after their slot partition.
+    return find_label(info["source"])
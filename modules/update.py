@@ -1,70 +1,243 @@
 import sys
 import os
+import json
 import shutil
 import subprocess
+import threading
+from datetime import datetime
+
+# Downloads are spooled on the slot itself, where the file index and
+# verify-integrity do not look.
+UPDATE_SPOOL_FILE = f"{SLOT_IMAGE_DIR}/update.img"
+# Records of the image installed in each slot. /var is shared, so both
+# slots see the records of both.
+SLOT_RECORD_DIR = "/var/lib/obsidianctl"
+
+
+def read_slot_record(slot):
+    try:
+        with open(os.path.join(SLOT_RECORD_DIR, f"slot_{slot}.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def slot_index_path(slot):
+    """Return the copy of the slot's file index kept in SLOT_RECORD_DIR, if there is one."""
+    path = os.path.join(SLOT_RECORD_DIR, f"slot_{slot}.manifest.db")
+    return path if os.path.isfile(path) else None
+
+
+def store_slot_index(slot, index_path, record_dir=SLOT_RECORD_DIR):
+    """Keep a copy of a slot's file index on the shared /var, so it can be read without mounting the slot."""
+    os.makedirs(record_dir, exist_ok=True)
+    path = os.path.join(record_dir, f"slot_{slot}.manifest.db")
+    shutil.copyfile(index_path, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def write_slot_record(slot, source, sha256=None, etag=None, last_modified=None):
+    os.makedirs(SLOT_RECORD_DIR, exist_ok=True)
+    record = {
+        "source": source,
+        "sha256": sha256,
+        "etag": etag,
+        "last_modified": last_modified,
+        "installed": datetime.now().isoformat(),
+    }
+    path = os.path.join(SLOT_RECORD_DIR, f"slot_{slot}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(record, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
 def handle_update_mkobsidiansfs(args):
+    cache_key = mkobsfs_cache_key(args.system_sfs, "mkobsidiansfs")
+    cached = cache_lookup(cache_key)
+    if cached:
+        print(f"Using cached build of {args.system_sfs}: {cached}")
+        args.system_sfs = cached
+        handle_update(args)
+        return
     if shutil.which("mkobsidiansfs"):
         os.system(f"mkobsidiansfs {args.system_sfs} system.sfs")
     else:
         if shutil.which("git"):
             os.system(
-                f"git clone https://github.com/Obsidian-OS/mkobsidiansfs/ /tmp/mkobsidiansfs;chmod u+x /tmp/mkobsidiansfs/mkobsidiansfs;/tmp/mkobsidiansfs/mkobsidiansfs {args.system_sfs} tmp_system.sfs"
+                f"git clone https://github.com/Obsidian-OS/mkobsidiansfs/ /tmp/mkobsidiansfs;chmod u+x /tmp/mkobsidiansfs/mkobsidiansfs;/tmp/mkobsidiansfs/mkobsidiansfs {args.system_sfs} system.sfs"
             )
         else:
             print(
                 "No git or mkobsidiansfs found. Please install one of these to directly pass in an .mkobsfs."
             )
             sys.exit(1)
-    args.system_sfs = "system.sfs"
+    if not os.path.exists("system.sfs"):
+        print(f"Error: Building {args.system_sfs} failed.", file=sys.stderr)
+        sys.exit(1)
+    try:
+        args.system_sfs = cache_store("system.sfs", key=cache_key, move=True)
+    except OSError as e:
+        print(f"Warning: Could not add the build to the image cache: {e}", file=sys.stderr)
+        args.system_sfs = "system.sfs"
     handle_update(args)
-    os.remove("system.sfs")
+
+
+def _update_slot_incremental(part, image, mount_dir, slot):
+    """Bring the extracted system on part in line with image, in place.
+
+    The image is loop-mounted read-only and rsync rewrites only the files
+    whose size or mtime changed and deletes the ones the image no longer
+    has. Returns False, with nothing left mounted, if the slot cannot be
+    updated in place and has to be reformatted instead.
+    """
+    if run_command(f"mount {part} {mount_dir}", check=False).returncode != 0:
+        print("Warning: Could not mount the slot for an incremental update.", file=sys.stderr)
+        return False
+    if os.path.exists(os.path.join(mount_dir, SLOT_IMAGE_FILE)) or not os.path.isdir(os.path.join(mount_dir, "usr")):
+        print("Warning: The slot does not hold an extracted system to update incrementally.", file=sys.stderr)
+        run_command(f"umount {mount_dir}", check=False)
+        return False
+    image_mount = f"/mnt/obsidian_incremental_{slot}"
+    run_command(f"mkdir -p {image_mount}")
+    try:
+        if run_command(f"mount -o loop,ro {image} {image_mount}", check=False).returncode != 0:
+            result = None
+        else:
+            result = run_command(
+                f"rsync -aHAX --numeric-ids --delete --exclude=/lost+found --stats {image_mount}/ {mount_dir}/",
+                check=False,
+            )
+    finally:
+        if os.path.ismount(image_mount):
+            run_command(f"umount {image_mount}", check=False)
+        run_command(f"rmdir {image_mount}", check=False)
+    if result is None or result.returncode != 0:
+        print("Warning: Incremental update failed.", file=sys.stderr)
+        run_command(f"umount {mount_dir}", check=False)
+        return False
+    return True
 
 
 def handle_update(args):
     checkroot()
-    fstype = subprocess.run(
-        [
-            "blkid",
-            "-s",
-            "TYPE",
-            "-o",
-            "value",
-            subprocess.run(
-                ["findmnt", "-no", "SOURCE", "/"], capture_output=True, text=True
-            ).stdout.strip(),
-        ],
-        capture_output=True,
-        text=True,
-    ).stdout.strip()
+    fstype = (mount_info("/") or {}).get("fstype")
     slot = args.slot
     system_sfs = args.system_sfs
-    if not os.path.exists(system_sfs):
-        print(f"Error: System image '{system_sfs}' not found.", file=sys.stderr)
+    image_mode = args.image_mode
+    fetch = args.fetch
+    if fstype in (None, "overlay"):
+        # Image-mode roots are overlays, so ask the slot partition instead.
+        fstype = subprocess.run(
+            ["blkid", "-s", "TYPE", "-o", "value", f"/dev/disk/by-label/root_{slot}"],
+            capture_output=True,
+            text=True,
+        ).stdout.strip() or "ext4"
+    if image_mode and is_grub_active():
+        print("Error: Image mode slots are only supported with systemd-boot.", file=sys.stderr)
         sys.exit(1)
-    _, ext = os.path.splitext(system_sfs)
-    if ext == ".mkobsfs":
-        handle_update_mkobsidiansfs(args)
-        sys.exit()
+    image_format = None
+    if fetch is None and system_sfs.endswith(DELTA_INDEX_EXT):
+        system_sfs = delta_update_or_exit(system_sfs, None, args.connections, args.delta_source)
+        args.system_sfs = system_sfs
+    elif fetch is None and is_url(system_sfs):
+        system_sfs = download_or_exit(system_sfs, args.connections, fetch_expected_sha256(system_sfs))
+        args.system_sfs = system_sfs
+    if fetch is None:
+        if not os.path.exists(system_sfs):
+            print(f"Error: System image '{system_sfs}' not found.", file=sys.stderr)
+            sys.exit(1)
+        _, ext = os.path.splitext(system_sfs)
+        if ext == ".mkobsfs":
+            handle_update_mkobsidiansfs(args)
+            sys.exit()
+        # Image-mode slots boot the image as it is; nothing extracts it.
+        image_format = image_format_or_exit(system_sfs, need=None if image_mode else "extract")
     target_label = f"root_{slot}"
     esp_label = f"ESP_{slot.upper()}"
     print(f"Updating slot '{slot}' with image '{system_sfs}'...")
-    print(f"WARNING: THIS WILL ERASE ALL OF SLOT {slot.upper()}. INCLUDING /root.")
+    image_summary = describe_image(system_sfs) if fetch is None else None
+    if image_summary:
+        print(f"Image contents: {image_summary}")
+    incremental = args.incremental and fetch is None and not image_mode
+    if args.incremental and not incremental:
+        print("Warning: Incremental updates need a local image and an extracted slot. Doing a full update.", file=sys.stderr)
+    if incremental:
+        print(f"WARNING: THIS WILL REPLACE ALL OF SLOT {slot.upper()}. FILES NOT IN THE IMAGE, INCLUDING /root, WILL BE DELETED.")
+    else:
+        print(f"WARNING: THIS WILL ERASE ALL OF SLOT {slot.upper()}. INCLUDING /root.")
     confirm = input("Continue? (y/N): ")
     if confirm.lower() != "y":
         print("Operation Canceled.")
         exit(1)
-    print("Formatting partition...")
-    run_command(f"mkfs.{fstype} -F -L {target_label} /dev/disk/by-label/{target_label}")
     mount_dir = f"/mnt/obsidian_update_{slot}"
     run_command(f"mkdir -p {mount_dir}")
+    if incremental:
+        print(f"Updating slot '{slot}' in place from {system_sfs}...")
+        incremental = _update_slot_incremental(f"/dev/disk/by-label/{target_label}", system_sfs, mount_dir, slot)
+        if not incremental:
+            print("Falling back to a full update.", file=sys.stderr)
+    offline_populate = args.offline_populate and not image_mode and not incremental
+    if offline_populate and not can_populate_offline(fstype):
+        print(f"Warning: Cannot populate {fstype} at mkfs time on this system. Falling back to extraction.", file=sys.stderr)
+        offline_populate = False
+    if offline_populate:
+        print(f"Formatting partition with the contents of {system_sfs}...")
+        populate_slot_filesystem(f"/dev/disk/by-label/{target_label}", system_sfs, fstype, target_label)
+        run_command("udevadm settle", check=False)
+    elif not incremental:
+        print("Formatting partition...")
+        run_command(f"mkfs.{fstype} -F -L {target_label} /dev/disk/by-label/{target_label}")
+    # The image's SHA256 identifies it in the slot's file index and in the
+    # image cache. Images that are copied or downloaded are hashed as they
+    # are written; a local image that is extracted is hashed alongside.
+    image_id = None
+    image_hash = {}
+    hasher = None
+    if fetch is None and not image_mode:
+        hasher = threading.Thread(target=lambda: image_hash.update(sha256=hash_file(system_sfs)), daemon=True)
+        hasher.start()
     try:
-        print(f"Mounting partition for slot '{slot}'...")
-        run_command(f"mount /dev/disk/by-label/{target_label} {mount_dir}")
-        print(f"Extracting system from {system_sfs} to slot '{slot}'...")
-        run_command(f"unsquashfs -f -d {mount_dir} -no-xattrs {system_sfs}")
+        if image_mode:
+            print(f"Writing image {system_sfs} to slot '{slot}'...")
+            image_id = install_slot_image(f"/dev/disk/by-label/{target_label}", system_sfs, mount_dir, target_label, fetch)
+            if not check_image_mode_supported(mount_dir):
+                sys.exit(1)
+        elif not incremental:
+            print(f"Mounting partition for slot '{slot}'...")
+            run_command(f"mount /dev/disk/by-label/{target_label} {mount_dir}")
+            if fetch is not None:
+                # Spool the download on the slot itself rather than in /tmp.
+                spool = os.path.join(mount_dir, UPDATE_SPOOL_FILE)
+                os.makedirs(os.path.dirname(spool), exist_ok=True)
+                image_id = fetch(spool)
+                image_format = image_format_or_exit(spool)
+                print(f"Extracting system to slot '{slot}'...")
+                extract_image(spool, mount_dir, image_format)
+            elif not offline_populate:
+                print(f"Extracting system from {system_sfs} to slot '{slot}'...")
+                extract_image(system_sfs, mount_dir, image_format)
+        if hasher is not None:
+            hasher.join()
+            image_id = image_hash.get("sha256")
+        if image_mode:
+            index_image = os.path.join(slot_part_root(mount_dir), SLOT_IMAGE_FILE)
+        else:
+            index_image = os.path.join(mount_dir, UPDATE_SPOOL_FILE) if fetch is not None else system_sfs
+        print(f"Indexing the files of slot '{slot}'...")
+        index_path, count, reused, total, seconds = write_image_index(
+            index_image, image_id, slot_part_root(mount_dir), mount_dir, previous=slot_index_path(slot)
+        )
+        if fetch is not None and not image_mode:
+            os.remove(index_image)
+        store_slot_index(slot, index_path)
+        print(f"Indexed {count} files ({reused} unchanged), hashing {total / (1024*1024):.0f} MB in {seconds:.1f} s")
         print(f"Generating fstab for slot '{slot}'...")
+        root_entry = f"LABEL={target_label}  /      {fstype}  defaults,noatime 0 1"
+        if image_mode:
+            # The initramfs assembles / from the slot image and its overlay.
+            root_entry = f"# {root_entry}"
         fstab_content = f"""
-LABEL={target_label}  /      {fstype}  defaults,noatime 0 1
+{root_entry}
 LABEL={esp_label}     /efi  vfat  defaults,noatime 0 2
 LABEL=etc_ab  /etc   {fstype}  defaults,noatime 0 2
 LABEL=var_ab  /var   {fstype}  defaults,noatime 0 2
@@ -83,6 +256,8 @@ LABEL=home_ab /home  {fstype}  defaults,noatime 0 2
         run_command(f"cp {script_path} {obsidianctl_dest}")
         run_command(f"chmod +x {obsidianctl_dest}")
         run_command(f"cp /etc/os-release {mount_dir}/etc/os-release")
+        if image_mode:
+            enable_image_mode_boot(mount_dir)
 
         print(f"Populating ESP_{slot.upper()} with new boot files...")
         esp_tmp_mount = "/mnt/obsidian_esp_tmp"
@@ -108,9 +283,27 @@ LABEL=home_ab /home  {fstype}  defaults,noatime 0 2
 
     finally:
         print("Unmounting partition...")
-        run_command(f"umount -R {mount_dir}", check=False)
+        umount_slot_root(mount_dir)
         run_command(f"rm -r {mount_dir}", check=False)
 
+    image_sha256 = image_id
+    source = os.path.abspath(system_sfs) if fetch is None else system_sfs
+    # Downloads already live on /var, next to the cache, and are moved
+    # into it. A local image would be copied onto the size-limited var_ab
+    # partition, so that is left to --cache.
+    downloaded = fetch is None and os.path.dirname(source) == DOWNLOAD_DIR
+    if downloaded or (fetch is None and args.cache):
+        print("Adding the image to the image cache...")
+        try:
+            cached = cache_store(system_sfs, sha256=image_id, move=downloaded)
+            image_sha256 = os.path.splitext(os.path.basename(cached))[0]
+            if downloaded:
+                remove_download(system_sfs)
+                source = cached
+        except OSError as e:
+            # The slot is already updated; only the cached copy is lost.
+            print(f"Warning: Could not add the image to the image cache: {e}", file=sys.stderr)
+    write_slot_record(slot, source, image_sha256)
     print(f"Update for slot '{slot}' complete!")
     print("You may need to switch to this slot and reboot to use the updated system.")
     if args.switch:
@@ -48,50 +48,28 @@ def is_grub_available():
 
 
 def is_grub_active():
-    if os.path.exists(f"{EFI_DIR}/grub/grub.cfg"):
-        return True
-    try:
-        efibootmgr_output = subprocess.check_output(["efibootmgr", "-v"], text=True)
-        if "grub" in efibootmgr_output.lower():
-            return True
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        pass
-    return False
+    return boot_environment()["grub"]
 
 
 def is_systemd_boot():
-    try:
-        output = subprocess.check_output(
-            ["bootctl", "status"], stderr=subprocess.DEVNULL, text=True
-        )
-        if "systemd-boot" in output or "Boot Loader:" in output:
-            return True
-        return False
-    except (FileNotFoundError, subprocess.CalledProcessError):
-        return False
+    return boot_environment()["loader"] == "systemd-boot"
 
 
 def lordo(
     label, disk=None
 ):  # LORDO = LABEL On Root Disk Only, returns /dev/disk/by-uuid/UUID
-    root_part = subprocess.check_output(
-        ["findmnt", "-no", "SOURCE", "/"], text=True
-    ).strip()
     if disk is None:
-        disk_name = subprocess.check_output(
-            ["lsblk", "-no", "PKNAME", root_part], text=True
-        ).strip()
-        disk = f"/dev/{disk_name}"
-    parts = subprocess.check_output(
-        ["lsblk", "-o", "NAME,LABEL,UUID", "-l", disk], text=True
-    ).splitlines()
-    for p in parts:
-        fields = p.split(None, 2)  # NAME, LABEL, UUID
-        if len(fields) < 3:
-            continue
-        name, lbl, uuid = fields
-        if lbl.strip() == label:
+        root_part = mount_device("/")
+        disk = parent_disk(root_part) if root_part else None
+        if disk is None:
+            return None
+    for attempt in range(2):
+        part = find_label(label, disk)
+        uuid = (device_info(part) or {}).get("uuid") if part else None
+        if uuid:
             return f"/dev/disk/by-uuid/{uuid}"
+        # The partition may have been created or relabelled since the scan.
+        invalidate_topology()
 
     return None
 
@@ -141,15 +119,9 @@ def _get_part_path(device, part_num):
 
 
 def get_current_slot_systemd():
-    try:
-        bootctl_output = subprocess.check_output(["bootctl", "status"], text=True)
-        match = re.search(
-            r"^\s*id:\s+.*obsidian-([ab])\.conf", bootctl_output, re.MULTILINE
-        )
-        if match:
-            return match.group(1)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        pass
+    match = re.search(r"obsidian-([ab])\.conf", boot_environment()["current_entry"] or "")
+    if match:
+        return match.group(1)
     return "unknown"
 
 
@@ -183,20 +155,25 @@ def get_current_slot_systemd():
 #            pass
 #    return "unknown"
 def get_current_slot():
-    try:
-        result = subprocess.run(
-            ["findmnt", "-n", "-o", "SOURCE,UUID,PARTUUID,LABEL,PARTLABEL", "/"],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        for item in result.stdout.split():
-            if "_a" in item:
-                return "a"
-            elif "_b" in item:
-                return "b"
-    except subprocess.CalledProcessError:
-        pass
+    info = mount_info("/")
+    if info is None:
+        return "unknown"
+    root_part = mount_device("/")
+    device = (device_info(root_part) or {}) if root_part else {}
+    # Slot partitions are labelled root_a/root_b; image-mode overlays are
+    # named after them.
+    for item in (device.get("label"), device.get("partlabel"), info["source"]):
+        match = re.fullmatch(r"root_([ab])", item or "")
+        if match:
+            return match.group(1)
+    items = [info["source"]] + [
+        device.get(key, "") for key in ("uuid", "partuuid", "label", "partlabel")
+    ]
+    for item in items:
+        if "_a" in item:
+            return "a"
+        elif "_b" in item:
+            return "b"
     return "unknown"
 
 
@@ -215,8 +192,9 @@ def get_user_home_dir():
 
 
 def get_primary_disk_device():
-    root_part = run_command("findmnt -no SOURCE /", capture_output=True).stdout.strip()
-    disk_name = run_command(
-        f"lsblk -no PKNAME {root_part}", capture_output=True
-    ).stdout.strip()
-    return f"/dev/{disk_name}"
+    root_part = mount_device("/")
+    disk = parent_disk(root_part) if root_part else None
+    if disk is None:
+        print("Error: Could not determine the disk holding the root filesystem.", file=sys.stderr)
+        sys.exit(1)
+    return disk
@@ -0,0 +1,78 @@
+"""A local HTTP server with Range and conditional request support, for the download tests.
+
+Python's http.server ignores Range headers, which every ranged and
+delta download depends on.
+"""
+import re
+import threading
+import http.server
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        range_header = self.headers.get("Range")
+        with server.lock:
+            server.requests.append((self.path, range_header))
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        if server.etag and self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.send_header("ETag", server.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header or "")
+        start = int(match.group(1)) if match else 0
+        end = min(int(match.group(2)) + 1 if match and match.group(2) else len(data), len(data))
+        if server.fail is not None and server.fail(self.path, start):
+            self.send_error(503)
+            return
+        self.send_response(206 if match else 200)
+        if match:
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+        if server.etag:
+            self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        self.wfile.write(data[start:end])
+
+
+class RangeServer:
+    """Serve files ({path: bytes}) on localhost while in a with block.
+
+    requests records (path, Range header) of every GET. fail, if set, is
+    called with (path, start) and answers 503 when it returns true.
+    """
+
+    def __init__(self, files, etag='"1"'):
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.files = files
+        self.httpd.etag = etag
+        self.httpd.fail = None
+        self.httpd.requests = []
+        self.httpd.lock = threading.Lock()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
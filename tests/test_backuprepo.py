@@ -0,0 +1,149 @@
+"""Backups into a chunk repository, restores from it, and its gc.
+
+Run with `make test`. The modules are executed into one namespace, in
+build order, as in the built script.
+"""
+import os
+import random
+import tempfile
+import unittest
+
+MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules")
+
+
+def load_modules(*names):
+    namespace = {"__name__": "obsidianctl"}
+    for name in names:
+        path = os.path.join(MODULES_DIR, f"{name}.py")
+        with open(path, "r") as f:
+            exec(compile(f.read(), path, "exec"), namespace)
+    return namespace
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def tree_state(root):
+    """Return {path: (kind, content or target, mode, mtime_ns)} plus the hard link groups."""
+    state = {}
+    inodes = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root)
+            st = os.lstat(path)
+            if os.path.islink(path):
+                state[rel] = ("link", os.readlink(path), None, None)
+            elif os.path.isdir(path):
+                state[rel] = ("dir", None, st.st_mode, None)
+            else:
+                with open(path, "rb") as f:
+                    state[rel] = ("file", f.read(), st.st_mode, st.st_mtime_ns)
+                inodes.setdefault(st.st_ino, set()).add(rel)
+    return state, sorted(sorted(group) for group in inodes.values() if len(group) > 1)
+
+
+class BackupRepositoryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self._tmp.name, "source")
+        self.repo = os.path.join(self._tmp.name, "repo")
+        self.ns = load_modules("image", "download", "delta", "backuprepo")
+        rng = random.Random(4)
+        self.big = rng.randbytes(3 * 1024 * 1024)
+        write_file(os.path.join(self.source, "usr", "lib", "big.so"), self.big)
+        write_file(os.path.join(self.source, "etc", "hostname"), b"obsidian\n")
+        write_file(os.path.join(self.source, "etc", "empty"), b"")
+        os.chmod(os.path.join(self.source, "etc", "hostname"), 0o600)
+        os.symlink("lib", os.path.join(self.source, "usr", "lib64"))
+        os.link(os.path.join(self.source, "usr", "lib", "big.so"), os.path.join(self.source, "usr", "lib", "big.so.1"))
+        # Runtime directories are kept empty.
+        write_file(os.path.join(self.source, "tmp", "scratch"), b"scratch")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def backup(self, name, slot="a"):
+        with self.ns["_repo_lock"](self.repo):
+            stats = self.ns["backup_to_repository"](self.source, self.repo, name, slot)
+            metadata = {"slot": slot, "index": name + self.ns["BACKUP_INDEX_EXT"], "stats": stats}
+            with open(os.path.join(self.repo, f"{name}.json"), "w") as f:
+                self.ns["json"].dump(metadata, f)
+        return metadata, stats
+
+    def chunk_files(self):
+        chunk_dir = os.path.join(self.repo, self.ns["BACKUP_CHUNK_DIR"])
+        return {name for _, _, names in os.walk(chunk_dir) for name in names}
+
+    def test_round_trip(self):
+        metadata, stats = self.backup("slot_a_backup_1")
+        dest = os.path.join(self._tmp.name, "dest")
+        os.makedirs(dest)
+        written = self.ns["restore_from_repository"](self.repo, metadata, dest)
+        self.assertEqual(written, len(self.big) + len(b"obsidian\n"))
+        expected, expected_links = tree_state(self.source)
+        del expected[os.path.join("tmp", "scratch")]
+        self.assertEqual(tree_state(dest), (expected, expected_links))
+        self.assertEqual(expected_links, [[os.path.join("usr", "lib", "big.so"), os.path.join("usr", "lib", "big.so.1")]])
+        # A hard link costs neither a read nor an index of chunks.
+        self.assertEqual(stats["files"], 3)
+
+    def test_restore_handle(self):
+        self.backup("slot_a_backup_1")
+        base = os.path.join(self.repo, "slot_a_backup_1")
+        for path in (base, base + ".json", base + self.ns["BACKUP_INDEX_EXT"]):
+            repo, metadata = self.ns["read_repository_backup"](path)
+            self.assertEqual(repo, self.repo)
+            self.assertEqual(metadata["index"], "slot_a_backup_1" + self.ns["BACKUP_INDEX_EXT"])
+        self.assertIsNone(self.ns["read_repository_backup"](os.path.join(self.repo, "missing.json")))
+
+    def test_chunks_are_shared_between_backups(self):
+        _, first = self.backup("slot_a_backup_1")
+        chunks = self.chunk_files()
+        self.assertGreater(first["new_chunks"], 1)
+        # Same data in the other slot: nothing new is stored.
+        _, other = self.backup("slot_b_backup_1", slot="b")
+        self.assertEqual(other["new_chunks"], 0)
+        self.assertEqual(other["stored_bytes"], 0)
+        # An edit in the middle of the big file adds only the chunks around it.
+        with open(os.path.join(self.source, "usr", "lib", "big.so"), "r+b") as f:
+            f.seek(len(self.big) // 2)
+            f.write(b"patched")
+        _, second = self.backup("slot_a_backup_2")
+        self.assertGreaterEqual(second["unchanged_files"], 1)
+        self.assertGreater(second["new_chunks"], 0)
+        self.assertLess(second["new_chunks"], first["new_chunks"])
+        self.assertTrue(chunks < self.chunk_files())
+
+    def test_gc(self):
+        self.backup("slot_a_backup_1")
+        first_chunks = self.chunk_files()
+        write_file(os.path.join(self.source, "usr", "lib", "big.so"), random.Random(5).randbytes(1024 * 1024))
+        self.backup("slot_a_backup_2")
+        # Left behind by interrupted backups.
+        for name in ("slot_a_backup_3.index.gz", "slot_a_backup_4.index.gz.tmp"):
+            open(os.path.join(self.repo, name), "w").close()
+        self.assertEqual(self.ns["gc_repository"](self.repo), (0, 0, 0))
+        self.assertFalse(os.path.exists(os.path.join(self.repo, "slot_a_backup_3.index.gz")))
+        self.assertFalse(os.path.exists(os.path.join(self.repo, "slot_a_backup_4.index.gz.tmp")))
+
+        deleted_backups, deleted_chunks, freed = self.ns["gc_repository"](self.repo, keep=1)
+        self.assertEqual(deleted_backups, 1)
+        self.assertGreater(deleted_chunks, 0)
+        self.assertGreater(freed, 0)
+        self.assertFalse(os.path.exists(os.path.join(self.repo, "slot_a_backup_1.json")))
+        remaining = self.chunk_files()
+        self.assertTrue(first_chunks - remaining)
+        # What is left still restores.
+        metadata = self.ns["repository_backups"](self.repo, "a")[-1][1]
+        dest = os.path.join(self._tmp.name, "dest")
+        os.makedirs(dest)
+        self.ns["restore_from_repository"](self.repo, metadata, dest)
+        self.assertEqual(tree_state(dest)[0][os.path.join("etc", "hostname")][1], b"obsidian\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""Content-defined chunking and delta downloads.
+
+Run with `make test`. The modules are executed into one namespace, in
+build order, as in the built script; images are served from a local
+server with Range support.
+"""
+import os
+import random
+import hashlib
+import tempfile
+import unittest
+
+from rangeserver import RangeServer
+
+MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules")
+
+
+def load_modules(*names):
+    namespace = {"__name__": "obsidianctl"}
+    for name in names:
+        path = os.path.join(MODULES_DIR, f"{name}.py")
+        with open(path, "r") as f:
+            exec(compile(f.read(), path, "exec"), namespace)
+    return namespace
+
+
+class DeltaTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.ns = load_modules("download", "delta")
+        # Random bytes stand in for compressed image data.
+        self.image = random.Random(7).randbytes(6 * 1024 * 1024)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self._tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def chunks(self, data):
+        return list(self.ns["iter_chunks"](self.write("image", data)))
+
+    def test_chunk_sizes(self):
+        chunks = self.chunks(self.image)
+        self.assertEqual(b"".join(data for _, data in chunks), self.image)
+        self.assertEqual([offset for offset, _ in chunks], [sum(len(d) for _, d in chunks[:i]) for i in range(len(chunks))])
+        for _, data in chunks[:-1]:
+            self.assertGreaterEqual(len(data), self.ns["DELTA_MIN_CHUNK"])
+            self.assertLessEqual(len(data), self.ns["DELTA_MAX_CHUNK"])
+        self.assertLessEqual(len(chunks[-1][1]), self.ns["DELTA_MAX_CHUNK"])
+        # Without anchors every chunk is cut at the maximum size.
+        zeros = self.chunks(bytes(3 * self.ns["DELTA_MAX_CHUNK"] + 5))
+        self.assertEqual([len(data) for _, data in zeros], [self.ns["DELTA_MAX_CHUNK"]] * 3 + [5])
+
+    def test_chunks_do_not_depend_on_read_size(self):
+        expected = self.chunks(self.image)
+        self.ns["DELTA_READ_SIZE"] = 100 * 1000
+        self.assertEqual(self.chunks(self.image), expected)
+
+    def test_insertion_only_changes_nearby_chunks(self):
+        old = [hashlib.sha256(data).digest() for _, data in self.chunks(self.image)]
+        middle = len(self.image) // 2
+        new = [hashlib.sha256(data).digest() for _, data in self.chunks(self.image[:middle] + b"!" + self.image[middle:])]
+        changed = [digest for digest in new if digest not in set(old)]
+        self.assertLessEqual(len(changed), 2)
+        self.assertGreaterEqual(len(new), len(old) - 1)
+
+    def test_rebuild_from_local_chunks(self):
+        rng = random.Random(8)
+        old_path = self.write("old.sfs", self.image)
+        # A new image: some data inserted, some replaced, some appended.
+        third = len(self.image) // 3
+        new_image = (
+            self.image[:third] + rng.randbytes(1000) + self.image[third:2 * third]
+            + rng.randbytes(300 * 1024) + self.image[2 * third + 300 * 1024:] + rng.randbytes(5000)
+        )
+        index = self.ns["build_chunk_index"](self.write("new.sfs", new_image))
+        self.assertEqual(index["sha256"], hashlib.sha256(new_image).hexdigest())
+        dest = os.path.join(self._tmp.name, "rebuilt.sfs")
+        with RangeServer({"/system.sfs": new_image}) as server:
+            reused, fetched = self.ns["delta_download"](index, server.url("/system.sfs"), dest, [old_path], 2)
+        with open(dest, "rb") as f:
+            self.assertEqual(f.read(), new_image)
+        self.assertEqual(reused + fetched, len(new_image))
+        self.assertGreater(reused, len(new_image) // 2)
+        self.assertLess(fetched, len(new_image) // 4)
+        self.assertTrue(all(header and header.startswith("bytes=") for _, header in server.requests))
+
+    def test_rebuild_without_local_chunks(self):
+        index = self.ns["build_chunk_index"](self.write("new.sfs", self.image))
+        dest = os.path.join(self._tmp.name, "rebuilt.sfs")
+        with RangeServer({"/system.sfs": self.image}) as server:
+            reused, fetched = self.ns["delta_download"](index, server.url("/system.sfs"), dest, [], 3)
+        self.assertEqual((reused, fetched), (0, len(self.image)))
+        with open(dest, "rb") as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), index["sha256"])
+        # Adjacent chunks are fetched together, up to DELTA_MAX_REQUEST per request.
+        self.assertLessEqual(len(server.requests), len(index["chunks"]))
+        self.assertGreaterEqual(len(server.requests), len(self.image) // self.ns["DELTA_MAX_REQUEST"])
+
+
+if __name__ == "__main__":
+    unittest.main()
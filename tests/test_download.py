@@ -0,0 +1,103 @@
+"""Resumable ranged downloads against a local server with Range support.
+
+Run with `make test`. The module is executed into a namespace of its
+own, as in the built script.
+"""
+import os
+import json
+import random
+import hashlib
+import tempfile
+import unittest
+
+from rangeserver import RangeServer
+
+MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules", "download.py")
+CHUNK_SIZE = 64 * 1024
+
+
+def load_download():
+    namespace = {"__name__": "download"}
+    with open(MODULE, "r") as f:
+        exec(compile(f.read(), MODULE, "exec"), namespace)
+    namespace["DOWNLOAD_CHUNK_SIZE"] = CHUNK_SIZE
+    return namespace
+
+
+class RangedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.download = load_download()
+        self.image = random.Random(6).randbytes(20 * CHUNK_SIZE + 1234)
+        self.sha256 = hashlib.sha256(self.image).hexdigest()
+        self.dest = os.path.join(self._tmp.name, "system.sfs")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def ranges_fetched(self, server):
+        return sorted(int(header[6:].split("-")[0]) for path, header in server.requests
+                      if path == "/system.sfs" and header and header != "bytes=0-0")
+
+    def interrupted(self, server):
+        # Everything from the middle of the image on fails.
+        server.httpd.fail = lambda path, start: start >= len(self.image) // 2
+        with self.assertRaises(OSError):
+            self.download["ranged_download"](server.url("/system.sfs"), self.dest, 2)
+        server.httpd.fail = None
+        self.assertFalse(os.path.exists(self.dest))
+        with open(self.dest + ".part.json", "r") as f:
+            done = bytes.fromhex(json.load(f)["done"])
+        return {i * CHUNK_SIZE for i in range(len(done) * 8) if done[i // 8] & (1 << (i % 8))}
+
+    def test_resumes_after_interruption(self):
+        with RangeServer({"/system.sfs": self.image}) as server:
+            done = self.interrupted(server)
+            del server.requests[:]
+            self.assertIsNone(self.download["ranged_download"](server.url("/system.sfs"), self.dest, 2))
+            refetched = self.ranges_fetched(server)
+        self.assertEqual(self.download["file_sha256"](self.dest), self.sha256)
+        # Only the chunks the first attempt did not finish were fetched again.
+        self.assertTrue(done)
+        self.assertTrue(all(start < len(self.image) // 2 for start in done))
+        self.assertEqual(refetched, sorted(set(range(0, len(self.image), CHUNK_SIZE)) - done))
+        self.assertFalse(os.path.exists(self.dest + ".part"))
+        self.assertFalse(os.path.exists(self.dest + ".part.json"))
+        self.assertTrue(os.path.exists(self.dest + self.download["DOWNLOAD_INFO_EXT"]))
+
+    def test_changed_image_starts_over(self):
+        with RangeServer({"/system.sfs": self.image}) as server:
+            self.interrupted(server)
+            server.httpd.etag = '"2"'
+            server.httpd.files["/system.sfs"] = self.image = random.Random(9).randbytes(len(self.image))
+            del server.requests[:]
+            self.download["ranged_download"](server.url("/system.sfs"), self.dest, 2)
+            self.assertEqual(len(self.ranges_fetched(server)), len(range(0, len(self.image), CHUNK_SIZE)))
+        self.assertEqual(self.download["file_sha256"](self.dest), hashlib.sha256(self.image).hexdigest())
+
+    def test_chunk_manifest_rejects_bad_data(self):
+        digests = [hashlib.sha256(self.image[i:i + CHUNK_SIZE]).hexdigest() for i in range(0, len(self.image), CHUNK_SIZE)]
+        files = {
+            "/system.sfs": self.image,
+            "/system.sfs.chunksums": ('{"chunk_size": %d, "sha256": ["%s"]}' % (CHUNK_SIZE, '", "'.join(digests))).encode(),
+        }
+        with RangeServer(files) as server:
+            self.download["ranged_download"](server.url("/system.sfs"), self.dest, 2)
+            self.assertEqual(self.download["file_sha256"](self.dest), self.sha256)
+            # The server now sends other data under the same ETag.
+            os.remove(self.dest)
+            server.httpd.files["/system.sfs"] = bytes(len(self.image))
+            with self.assertRaises(OSError):
+                self.download["ranged_download"](server.url("/system.sfs"), self.dest, 2)
+
+    def test_finished_download_is_revalidated(self):
+        with RangeServer({"/system.sfs": self.image}) as server:
+            url = server.url("/system.sfs")
+            self.download["ranged_download"](url, self.dest, 2)
+            self.assertTrue(self.download["_download_is_current"](self.dest, url))
+            server.httpd.etag = '"2"'
+            self.assertFalse(self.download["_download_is_current"](self.dest, url))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Boot environment detection against a fake efivars tree.
+
+Run with `make test`. Like the built script, the module is executed into
+a namespace of its own, with the globals it shares with other modules
+filled in here.
+"""
+import os
+import struct
+import tempfile
+import unittest
+
+MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules", "efivars.py")
+LOADER_GUID = "4a67b082-0a4c-41cf-b6c7-440b29bb8c4f"
+
+
+def load_efivars(efivars_dir, efi_dir):
+    namespace = {"__name__": "efivars", "EFI_DIR": efi_dir}
+    with open(MODULE, "r") as f:
+        exec(compile(f.read(), MODULE, "exec"), namespace)
+    namespace["EFIVARS_DIR"] = efivars_dir
+    return namespace
+
+
+def write_variable(efivars_dir, name, text, guid=LOADER_GUID):
+    with open(os.path.join(efivars_dir, f"{name}-{guid}"), "wb") as f:
+        f.write(struct.pack("<I", 0x7) + (text + "\0").encode("utf-16-le"))
+
+
+class EfivarsTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.efivars_dir = os.path.join(self._tmp.name, "efivars")
+        self.efi_dir = os.path.join(self._tmp.name, "efi")
+        os.makedirs(self.efivars_dir)
+        os.makedirs(self.efi_dir)
+        self.efivars = load_efivars(self.efivars_dir, self.efi_dir)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_detects_systemd_boot(self):
+        write_variable(self.efivars_dir, "LoaderInfo", "systemd-boot 256.4")
+        write_variable(self.efivars_dir, "LoaderEntrySelected", "obsidian-b.conf")
+        write_variable(self.efivars_dir, "LoaderEntryDefault", "obsidian-a.conf")
+        env = self.efivars["boot_environment"]()
+        self.assertEqual(env["loader"], "systemd-boot")
+        self.assertEqual(env["loader_info"], "systemd-boot 256.4")
+        self.assertEqual(env["current_entry"], "obsidian-b.conf")
+        self.assertEqual(env["default_entry"], "obsidian-a.conf")
+        self.assertIsNone(env["oneshot_entry"])
+        self.assertFalse(env["grub"])
+
+    def test_detects_grub_from_its_config(self):
+        os.makedirs(os.path.join(self.efi_dir, "grub"))
+        open(os.path.join(self.efi_dir, "grub", "grub.cfg"), "w").close()
+        env = self.efivars["boot_environment"]()
+        self.assertEqual(env["loader"], "grub")
+        self.assertIsNone(env["current_entry"])
+
+    def test_no_loader(self):
+        self.assertIsNone(self.efivars["boot_environment"]()["loader"])
+
+    def test_set_loader_entry_round_trip(self):
+        write_variable(self.efivars_dir, "LoaderInfo", "systemd-boot 256.4")
+        write_variable(self.efivars_dir, "LoaderEntryDefault", "obsidian-a.conf")
+        self.assertEqual(self.efivars["boot_environment"]()["default_entry"], "obsidian-a.conf")
+        self.assertTrue(self.efivars["set_loader_entry"]("LoaderEntryDefault", "obsidian-b.conf"))
+        with open(os.path.join(self.efivars_dir, f"LoaderEntryDefault-{LOADER_GUID}"), "rb") as f:
+            data = f.read()
+        self.assertEqual(struct.unpack_from("<I", data)[0], 0x7)
+        self.assertEqual(data[4:], "obsidian-b.conf\0".encode("utf-16-le"))
+        # The cached environment is dropped, so the new default shows.
+        self.assertEqual(self.efivars["boot_environment"]()["default_entry"], "obsidian-b.conf")
+
+    def test_set_loader_entry_reports_failure(self):
+        self.efivars["EFIVARS_DIR"] = os.path.join(self._tmp.name, "missing")
+        self.assertFalse(self.efivars["set_loader_entry"]("LoaderEntryOneShot", "obsidian-b.conf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
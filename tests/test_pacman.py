@@ -0,0 +1,144 @@
+"""Package version comparison and pacman local database parsing.
+
+Run with `make test`. The module is executed into a namespace of its
+own, as in the built script.
+"""
+import os
+import tempfile
+import unittest
+
+MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules", "pacman.py")
+
+# From pacman's test/util/vercmptest.sh: (a, b, vercmp(a, b)). Each case
+# is also checked the other way round.
+VERCMP_CASES = [
+    # all similar length, no pkgrel
+    ("1.5.0", "1.5.0", 0),
+    ("1.5.1", "1.5.0", 1),
+    # mixed length
+    ("1.5.1", "1.5", 1),
+    # with pkgrel, simple
+    ("1.5.0-1", "1.5.0-1", 0),
+    ("1.5.0-1", "1.5.0-2", -1),
+    ("1.5.0-1", "1.5.1-1", -1),
+    ("1.5.0-2", "1.5.1-1", -1),
+    # with pkgrel, mixed lengths
+    ("1.5-1", "1.5.1-1", -1),
+    ("1.5-2", "1.5.1-1", -1),
+    ("1.5-2", "1.5.1-2", -1),
+    # mixed pkgrel inclusion
+    ("1.5", "1.5-1", 0),
+    ("1.5-1", "1.5", 0),
+    ("1.1-1", "1.1", 0),
+    ("1.0-1", "1.1", -1),
+    ("1.1-1", "1.0", 1),
+    # alphanumeric versions
+    ("1.5b-1", "1.5-1", -1),
+    ("1.5b", "1.5", -1),
+    ("1.5b-1", "1.5", -1),
+    ("1.5b", "1.5.1", -1),
+    # from the manpage
+    ("1.0a", "1.0alpha", -1),
+    ("1.0alpha", "1.0b", -1),
+    ("1.0b", "1.0beta", -1),
+    ("1.0beta", "1.0rc", -1),
+    ("1.0rc", "1.0", -1),
+    # alpha-dotted versions
+    ("1.5.a", "1.5", 1),
+    ("1.5.b", "1.5.a", 1),
+    ("1.5.1", "1.5.b", 1),
+    # alpha dots and dashes
+    ("1.5.b-1", "1.5.b", 0),
+    ("1.5-1", "1.5.b", -1),
+    # same or similar content, differing separators
+    ("2.0", "2_0", 0),
+    ("2.0_a", "2_0.a", 0),
+    ("2.0a", "2.0.a", -1),
+    ("2___a", "2_a", 1),
+    # epoch included version comparisons
+    ("0:1.0", "0:1.0", 0),
+    ("0:1.0", "0:1.1", -1),
+    ("1:1.0", "0:1.0", 1),
+    ("1:1.0", "0:1.1", 1),
+    ("1:1.0", "2:1.1", -1),
+    # epoch + sometimes present pkgrel
+    ("1:1.0", "0:1.0-1", 1),
+    ("1:1.0-1", "0:1.1-1", 1),
+    # epoch included on one version
+    ("0:1.0", "1.0", 0),
+    ("0:1.0", "1.1", -1),
+    ("0:1.1", "1.0", 1),
+    ("1:1.0", "1.0", 1),
+    ("1:1.0", "1.1", 1),
+    ("1:1.1", "1.1", 1),
+]
+
+
+def load_pacman():
+    namespace = {"__name__": "pacman"}
+    with open(MODULE, "r") as f:
+        exec(compile(f.read(), MODULE, "exec"), namespace)
+    return namespace
+
+
+def write_desc(db_dir, name, version, extra=""):
+    package_dir = os.path.join(db_dir, f"{name}-{version}")
+    os.makedirs(package_dir)
+    with open(os.path.join(package_dir, "desc"), "w") as f:
+        f.write(
+            f"%NAME%\n{name}\n\n%VERSION%\n{version}\n\n%BASE%\n{name}\n\n"
+            f"%DESC%\nA package\n\n%BUILDDATE%\n1723000000\n\n%SIZE%\n4096\n\n{extra}"
+        )
+    open(os.path.join(package_dir, "files"), "w").close()
+
+
+class VercmpTest(unittest.TestCase):
+    def test_vercmptest_cases(self):
+        vercmp = load_pacman()["vercmp"]
+        for a, b, expected in VERCMP_CASES:
+            with self.subTest(a=a, b=b):
+                self.assertEqual(vercmp(a, b), expected)
+                self.assertEqual(vercmp(b, a), -expected)
+
+
+class LocalDbTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.pacman = load_pacman()
+        self.pacman["PACMAN_CACHE_FILE"] = os.path.join(self._tmp.name, "packages_{slot}.json")
+        self.root = os.path.join(self._tmp.name, "root")
+        self.db_dir = os.path.join(self.root, self.pacman["PACMAN_LOCAL_DB"])
+        os.makedirs(self.db_dir)
+        with open(os.path.join(self.db_dir, "ALPM_DB_VERSION"), "w") as f:
+            f.write("9\n")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_names_with_dashes(self):
+        write_desc(self.db_dir, "lib32-gcc-libs", "14.2.1+r134+gab884fffe3fc-1", "%DEPENDS%\nglibc\n\n")
+        write_desc(self.db_dir, "python-typing_extensions", "1:4.12.2-3")
+        packages = self.pacman["read_local_db"](self.db_dir)
+        self.assertEqual(
+            packages,
+            {
+                "lib32-gcc-libs": {"version": "14.2.1+r134+gab884fffe3fc-1", "builddate": 1723000000, "size": 4096},
+                "python-typing_extensions": {"version": "1:4.12.2-3", "builddate": 1723000000, "size": 4096},
+            },
+        )
+
+    def test_slot_packages_cache(self):
+        write_desc(self.db_dir, "linux-firmware-whence", "20240815.a1b2c3d-1")
+        first = self.pacman["slot_packages"](self.root, "a")
+        self.assertIn("linux-firmware-whence", first)
+        self.assertTrue(os.path.exists(os.path.join(self._tmp.name, "packages_a.json")))
+        # Installing a package adds a directory, which changes the database's mtime.
+        write_desc(self.db_dir, "xdg-desktop-portal-gtk", "1.15.1-1")
+        self.assertEqual(
+            sorted(self.pacman["slot_packages"](self.root, "a")), ["linux-firmware-whence", "xdg-desktop-portal-gtk"]
+        )
+        self.assertEqual(self.pacman["slot_packages"](os.path.join(self._tmp.name, "missing"), "b"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
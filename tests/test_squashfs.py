@@ -0,0 +1,204 @@
+"""The in-process SquashFS reader, on a small synthetic image.
+
+Run with `make test`. The module is executed into a namespace of its
+own, as in the built script. The image is written here byte by byte, so
+the tests need neither mksquashfs nor root; with mksquashfs installed, a
+real image is read as well.
+"""
+import os
+import stat
+import shutil
+import struct
+import random
+import subprocess
+import tempfile
+import unittest
+import zlib
+
+MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules", "squashfs.py")
+BLOCK_SIZE = 4096
+FILE_DATA = b"ObsidianOS\n" * 500
+
+
+def load_squashfs():
+    namespace = {"__name__": "squashfs"}
+    with open(MODULE, "r") as f:
+        exec(compile(f.read(), MODULE, "exec"), namespace)
+    return namespace
+
+
+def metadata_block(data, compress=False):
+    if compress:
+        packed = zlib.compress(data)
+        return struct.pack("<H", len(packed)) + packed
+    return struct.pack("<H", len(data) | 0x8000) + data
+
+
+def build_image():
+    """Return a gzip SquashFS 4.0 image holding /etc/hostname, a 5500 byte /data and /link -> data."""
+    # Data blocks: /data takes one full block and a second, compressed one; /etc/hostname one raw block.
+    blocks = bytearray()
+    data_start = 96
+    first, second = FILE_DATA[:BLOCK_SIZE], zlib.compress(FILE_DATA[BLOCK_SIZE:])
+    blocks += first + second
+    data_sizes = [len(first) | 0x1000000, len(second)]
+    hostname = b"obsidian\n"
+    hostname_start = data_start + len(blocks)
+    blocks += hostname
+
+    def header(itype, mode, number):
+        return struct.pack("<HHHHII", itype, mode, 0, 1, 1700000000, number)
+
+    # Inodes, all in the first inode table block. Directory sizes count
+    # their listing plus 3.
+    inodes = bytearray()
+    offsets = {}
+    offsets["data"] = len(inodes)
+    inodes += header(2, 0o644, 2) + struct.pack("<IIII", data_start, 0xFFFFFFFF, 0, len(FILE_DATA))
+    inodes += struct.pack("<2I", *data_sizes)
+    offsets["hostname"] = len(inodes)
+    inodes += header(2, 0o644, 3) + struct.pack("<IIII", hostname_start, 0xFFFFFFFF, 0, len(hostname))
+    inodes += struct.pack("<I", len(hostname) | 0x1000000)
+    offsets["link"] = len(inodes)
+    inodes += header(3, 0o777, 4) + struct.pack("<II", 1, 4) + b"data"
+
+    def listing(entries, base):
+        out = struct.pack("<III", len(entries) - 1, 0, base)
+        for name, itype, number in entries:
+            out += struct.pack("<HhHH", offsets.get(name, 0), number - base, itype, len(name) - 1) + name.encode()
+        return out
+
+    def directories():
+        root = listing([("data", 2, 2), ("etc", 1, 5), ("link", 3, 4)], 2)
+        return root, listing([("hostname", 2, 3)], 3)
+
+    # Listings name the offsets of their inodes, but their lengths do not
+    # depend on them, so the directory inodes can be written first.
+    root_listing, etc_listing = directories()
+    offsets["etc"] = len(inodes)
+    inodes += header(1, 0o755, 5) + struct.pack("<IIHHI", 0, 2, len(etc_listing) + 3, len(root_listing), 1)
+    offsets["root"] = len(inodes)
+    inodes += header(1, 0o755, 1) + struct.pack("<IIHHI", 0, 3, len(root_listing) + 3, 0, 6)
+    root_listing, etc_listing = directories()
+
+    image = bytearray(96) + blocks
+    inode_table_start = len(image)
+    image += metadata_block(bytes(inodes))
+    directory_table_start = len(image)
+    image += metadata_block(root_listing + etc_listing, compress=True)
+    ids = len(image)
+    image += metadata_block(struct.pack("<2I", 0, 1000))
+    id_table_start = len(image)
+    image += struct.pack("<Q", ids)
+    bytes_used = len(image)
+    image[:96] = struct.pack(
+        "<IIIIIHHHHHHQQQQQQQQ",
+        0x73717368, 5, 1700000000, BLOCK_SIZE, 0, 1, 12, 0, 2, 4, 0,
+        offsets["root"], bytes_used, id_table_start, 0xFFFFFFFFFFFFFFFF,
+        inode_table_start, directory_table_start, 0xFFFFFFFFFFFFFFFF, 0xFFFFFFFFFFFFFFFF,
+    )
+    return bytes(image)
+
+
+def read_everything(squashfs, path):
+    """Walk the image at path and read every file and link in it."""
+    contents = {}
+    with squashfs["SquashFSImage"](path) as image:
+        for dirpath, dirnames, filenames in image.walk("/"):
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                mode = image.stat(full)["mode"]
+                if stat.S_ISLNK(mode):
+                    contents[full] = image.readlink(full)
+                elif stat.S_ISREG(mode):
+                    contents[full] = image.read_file(full)
+                else:
+                    contents[full] = mode
+    return contents
+
+
+class SquashFSTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.squashfs = load_squashfs()
+        self.image = build_image()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write(self, data, name="system.sfs"):
+        path = os.path.join(self._tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_reads_synthetic_image(self):
+        path = self.write(self.image)
+        self.assertEqual(
+            read_everything(self.squashfs, path),
+            {"/data": FILE_DATA, "/link": "data", "/etc/hostname": b"obsidian\n"},
+        )
+        with self.squashfs["SquashFSImage"](path) as image:
+            self.assertEqual(image.compression, "gzip")
+            self.assertEqual(sorted(image.listdir("/")), ["data", "etc", "link"])
+            self.assertEqual(image.stat("/etc")["uid"], 0)
+            self.assertEqual(image.stat("/etc")["gid"], 1000)
+            self.assertFalse(image.exists("/etc/missing"))
+            with self.assertRaises(NotADirectoryError):
+                image.listdir("/data/x")
+        self.assertEqual(self.squashfs["describe_image"](path), "kernel unknown, 0 packages")
+
+    def test_truncated_image(self):
+        for size in list(range(0, 200, 7)) + list(range(len(self.image) - 200, len(self.image), 3)):
+            path = self.write(self.image[:size])
+            with self.subTest(size=size):
+                with self.assertRaises(self.squashfs["SquashFSError"]):
+                    read_everything(self.squashfs, path)
+
+    def test_garbage(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            path = self.write(rng.randbytes(rng.randrange(1, 8192)))
+            with self.assertRaises(self.squashfs["SquashFSError"]):
+                read_everything(self.squashfs, path)
+        # A valid superblock in front of garbage.
+        for _ in range(50):
+            path = self.write(self.image[:96] + rng.randbytes(len(self.image) - 96))
+            with self.assertRaises(self.squashfs["SquashFSError"]):
+                read_everything(self.squashfs, path)
+        self.assertIsNone(self.squashfs["describe_image"](path))
+
+    def test_corrupted_bytes(self):
+        # Any single damaged byte either leaves the image readable or is
+        # reported as a SquashFSError, never as another exception.
+        rng = random.Random(2)
+        for pos in range(len(self.image)):
+            damaged = bytearray(self.image)
+            damaged[pos] ^= 1 << rng.randrange(8)
+            path = self.write(bytes(damaged))
+            with self.subTest(pos=pos):
+                try:
+                    read_everything(self.squashfs, path)
+                except self.squashfs["SquashFSError"]:
+                    pass
+
+    @unittest.skipUnless(shutil.which("mksquashfs"), "needs mksquashfs")
+    def test_mksquashfs_round_trip(self):
+        source = os.path.join(self._tmp.name, "source")
+        os.makedirs(os.path.join(source, "usr", "lib"))
+        big = random.Random(3).randbytes(300 * 1024)
+        with open(os.path.join(source, "usr", "lib", "big.so"), "wb") as f:
+            f.write(big)
+        with open(os.path.join(source, "small"), "wb") as f:
+            f.write(b"fragment")
+        os.symlink("usr/lib", os.path.join(source, "lib"))
+        path = os.path.join(self._tmp.name, "real.sfs")
+        subprocess.run(["mksquashfs", source, path, "-comp", "gzip", "-quiet", "-no-progress"], check=True)
+        self.assertEqual(
+            read_everything(self.squashfs, path),
+            {"/usr/lib/big.so": big, "/small": b"fragment", "/lib": "usr/lib"},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Label lookup against a fake sysfs and udev database.
+
+Run with `make test`. The module is executed into a namespace of its
+own, as in the built script, and pointed at the fake tree.
+"""
+import os
+import tempfile
+import unittest
+
+MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "modules", "topology.py")
+
+
+def load_topology(root):
+    namespace = {"__name__": "topology"}
+    with open(MODULE, "r") as f:
+        exec(compile(f.read(), MODULE, "exec"), namespace)
+    namespace["SYS_BLOCK_DIR"] = os.path.join(root, "sys", "class", "block")
+    namespace["UDEV_DATA_DIR"] = os.path.join(root, "run", "udev", "data")
+    namespace["MOUNTINFO_PATH"] = os.path.join(root, "mountinfo")
+    namespace["DISK_BY_DIRS"] = {
+        key: os.path.join(root, "dev", "disk", f"by-{key}") for key in ("label", "uuid", "partuuid", "partlabel")
+    }
+    return namespace
+
+
+class TopologyTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+        os.makedirs(os.path.join(self.root, "sys", "class", "block"))
+        os.makedirs(os.path.join(self.root, "run", "udev", "data"))
+        for key in ("label", "uuid", "partuuid", "partlabel"):
+            os.makedirs(os.path.join(self.root, "dev", "disk", f"by-{key}"))
+        open(os.path.join(self.root, "mountinfo"), "w").close()
+        self.topology = load_topology(self.root)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def add_device(self, name, devnum, disk=None, properties=None):
+        device_dir = os.path.join(self.root, "sys", "devices", *([disk] if disk else []), name)
+        os.makedirs(device_dir)
+        with open(os.path.join(device_dir, "dev"), "w") as f:
+            f.write(f"{devnum}\n")
+        with open(os.path.join(device_dir, "size"), "w") as f:
+            f.write("2048\n")
+        if disk:
+            open(os.path.join(device_dir, "partition"), "w").close()
+        os.symlink(device_dir, os.path.join(self.root, "sys", "class", "block", name))
+        if properties is not None:
+            with open(os.path.join(self.root, "run", "udev", "data", f"b{devnum}"), "w") as f:
+                f.write("S:disk/by-id/fake\n")
+                for key, value in properties.items():
+                    f.write(f"E:{key}={value}\n")
+
+    def add_symlink(self, key, entry, name):
+        os.symlink(f"../../{name}", os.path.join(self.root, "dev", "disk", f"by-{key}", entry))
+
+    def add_obsidian_disk(self, disk, major, suffix):
+        self.add_device(disk, f"{major}:0", properties={})
+        for minor, label in enumerate(("EFI", "obsidian_a", "obsidian_b"), start=1):
+            self.add_device(
+                f"{disk}{minor}",
+                f"{major}:{minor}",
+                disk=disk,
+                properties={"ID_FS_LABEL": label, "ID_FS_LABEL_ENC": label, "ID_FS_UUID": f"{suffix}-{minor}"},
+            )
+
+    def test_shared_labels_resolve_per_disk(self):
+        self.add_obsidian_disk("sda", 8, "aaaa")
+        self.add_obsidian_disk("sdb", 16, "bbbb")
+        # udev points the shared symlinks at whichever disk came last.
+        self.add_symlink("label", "obsidian_a", "sdb2")
+        self.add_symlink("uuid", "bbbb-2", "sdb2")
+        find_label = self.topology["find_label"]
+        self.assertEqual(find_label("obsidian_a", "/dev/sda"), "/dev/sda2")
+        self.assertEqual(find_label("obsidian_a", "/dev/sdb"), "/dev/sdb2")
+        self.assertEqual(find_label("obsidian_b", "/dev/sda"), "/dev/sda3")
+        self.assertEqual(self.topology["device_info"]("/dev/sda2")["uuid"], "aaaa-2")
+        self.assertEqual(self.topology["device_info"]("/dev/sdb3")["uuid"], "bbbb-3")
+        self.assertEqual(self.topology["disk_partitions"]("/dev/sdb"), ["/dev/sdb1", "/dev/sdb2", "/dev/sdb3"])
+
+    def test_escaped_label(self):
+        self.add_device("sda", "8:0", properties={})
+        self.add_device("sda1", "8:1", disk="sda", properties={"ID_FS_LABEL": "my_disk", "ID_FS_LABEL_ENC": "my\\x20disk"})
+        self.assertEqual(self.topology["find_label"]("my disk", "/dev/sda"), "/dev/sda1")
+
+    def test_symlinks_without_udev_database(self):
+        self.add_device("vda", "253:0")
+        self.add_device("vda1", "253:1", disk="vda")
+        self.add_symlink("label", "obsidian_a", "vda1")
+        self.add_symlink("uuid", "cccc-1", "vda1")
+        self.assertEqual(self.topology["find_label"]("obsidian_a", "/dev/vda"), "/dev/vda1")
+        self.assertEqual(self.topology["device_info"]("/dev/vda1")["uuid"], "cccc-1")
+        self.assertIsNone(self.topology["find_label"]("obsidian_b"))
+
+
+if __name__ == "__main__":
+    unittest.main()